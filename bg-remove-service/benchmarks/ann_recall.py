@@ -0,0 +1,80 @@
+"""
+ANN Recall Benchmark
+Compares IVF search against the exact brute-force path on synthetic 64-d embeddings
+and reports recall@k and per-query latency for a range of nprobe values.
+
+Usage:
+    poetry run python benchmarks/ann_recall.py --items 200000 --nlist 512 --nprobe 1 4 8 16 32
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from bg_remove_service.ann_index import IVFIndex, normalize_rows
+from bg_remove_service.embedding_service import cosine_similarities, top_k_indices
+
+
+def synthetic_embeddings(n: int, dimensions: int, clusters: int, seed: int) -> np.ndarray:
+    """Clustered Gaussian data, closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimensions)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    noise = rng.normal(scale=0.6, size=(n, dimensions)).astype(np.float32)
+    return centers[labels] + noise
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dimensions", type=int, default=64)
+    parser.add_argument("--clusters", type=int, default=100, help="Clusters in the synthetic data")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=256)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    data = synthetic_embeddings(args.items, args.dimensions, args.clusters, args.seed)
+    queries = synthetic_embeddings(args.queries, args.dimensions, args.clusters, args.seed + 1)
+
+    print(f"Items: {args.items}  Queries: {args.queries}  k: {args.k}  nlist: {args.nlist}")
+
+    # Exact results with the same code path as find_most_compatible
+    started = time.perf_counter()
+    truth = [set(top_k_indices(cosine_similarities(q, data), args.k).tolist()) for q in queries]
+    exact_ms = (time.perf_counter() - started) * 1000 / args.queries
+    print(f"Brute force: {exact_ms:.3f} ms/query")
+
+    index = IVFIndex(args.dimensions, nlist=args.nlist, seed=args.seed)
+    started = time.perf_counter()
+    index.train(data)
+    train_s = time.perf_counter() - started
+    started = time.perf_counter()
+    index.add(np.arange(args.items), data)
+    add_s = time.perf_counter() - started
+    print(f"Train: {train_s:.2f} s  Add: {add_s:.2f} s  {index.get_stats()}")
+
+    # The index keeps keys only; candidates are scored from the data, as EmbeddingIndex does
+    unit = normalize_rows(data)
+    nprobes = [nprobe for nprobe in args.nprobe if nprobe <= index.nlist]
+    if len(nprobes) < len(args.nprobe):
+        print(f"Skipping nprobe values above nlist ({index.nlist})")
+
+    print(f"{'nprobe':>8} {'recall@k':>10} {'ms/query':>10} {'speedup':>9}")
+    for nprobe in nprobes:
+        hits = 0
+        started = time.perf_counter()
+        found = [index.search(q, args.k, lambda keys: unit[keys] @ q, nprobe=nprobe)[0]
+                 for q in normalize_rows(queries)]
+        ivf_ms = (time.perf_counter() - started) * 1000 / args.queries
+        for keys, expected in zip(found, truth):
+            hits += len(expected.intersection(keys.tolist()))
+        recall = hits / (args.k * args.queries)
+        print(f"{nprobe:>8} {recall:>10.4f} {ivf_ms:>10.3f} {exact_ms / ivf_ms:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
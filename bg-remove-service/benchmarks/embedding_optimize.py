@@ -0,0 +1,70 @@
+"""
+Embedding Model Optimization Benchmark
+Checks that the frozen TorchScript model (BatchNorm folded, channels_last) matches
+the eager model numerically and compares forward latency at several batch sizes.
+
+Usage:
+    poetry run python benchmarks/embedding_optimize.py --checkpoint ../model_best.pth.tar --batch-sizes 1 8 32
+"""
+
+import argparse
+import copy
+
+import torch
+
+from bg_remove_service.embedding_service import FashionEmbeddingService
+from bg_remove_service.model_optimization import compare_outputs, freeze_model, measure_latency, optimize_frozen
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint to load (random weights if omitted)")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=None, help="torch.set_num_threads")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(args.seed)
+
+    if args.checkpoint:
+        eager = FashionEmbeddingService(model_path=args.checkpoint, device="cpu").model
+    else:
+        # Random weights (and BatchNorm statistics) are enough to compare the graphs
+        from bg_remove_service.embedding_service import SimpleEmbeddingNet
+        eager = SimpleEmbeddingNet(pretrained=False).eval()
+        for module in eager.modules():
+            if isinstance(module, torch.nn.BatchNorm2d):
+                module.running_mean.uniform_(-0.5, 0.5)
+                module.running_var.uniform_(0.5, 2.0)
+
+    example = torch.randn(max(args.batch_sizes), 3, 112, 112)
+    variants = {
+        "frozen NCHW": optimize_frozen(freeze_model(copy.deepcopy(eager), example, channels_last=False)),
+        "frozen channels_last": optimize_frozen(freeze_model(copy.deepcopy(eager), example, channels_last=True)),
+    }
+
+    print(f"Threads: {torch.get_num_threads()}")
+    with torch.no_grad():
+        reference = eager(example)
+        for name, model in variants.items():
+            memory_format = torch.channels_last if "channels_last" in name else torch.contiguous_format
+            output = model(example.contiguous(memory_format=memory_format))
+            print(f"{name:>22}: {compare_outputs(reference, output)}")
+
+    print(f"\n{'batch':>6} {'eager ms':>10}" + "".join(f" {name + ' ms':>26}" for name in variants))
+    for batch_size in args.batch_sizes:
+        batch = torch.randn(batch_size, 3, 112, 112)
+        eager_ms = measure_latency(eager, batch, args.iterations)
+        row = f"{batch_size:>6} {eager_ms:>10.2f}"
+        for name, model in variants.items():
+            memory_format = torch.channels_last if "channels_last" in name else None
+            ms = measure_latency(model, batch, args.iterations, memory_format=memory_format)
+            row += f" {ms:>18.2f} ({eager_ms / ms:.2f}x)"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark Image Fixtures
+Deterministic synthetic product photos at a range of resolutions and upload
+formats, so every benchmark run sees byte-identical inputs.
+
+Each photo is a smooth random background with a soft-edged garment-like
+shape and mild sensor noise. That is close enough to real uploads for decode,
+segmentation, and encode timing, though not for model accuracy.
+"""
+
+import io
+import os
+from typing import NamedTuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+
+# (name, width, height): thumbnail, model-native, phone photos
+RESOLUTIONS = [
+    ("256", 256, 256),
+    ("1024", 1024, 1024),
+    ("2mp", 1600, 1200),
+    ("12mp", 4032, 3024),
+]
+
+# Upload formats: name -> (Pillow format, save options, image mode)
+FORMATS = {
+    "jpeg": ("JPEG", {"quality": 90}, "RGB"),
+    "png": ("PNG", {}, "RGB"),
+    "png-rgba": ("PNG", {}, "RGBA"),
+    "webp": ("WEBP", {"quality": 85}, "RGB"),
+}
+
+
+class Fixture(NamedTuple):
+    name: str
+    resolution: str
+    format: str
+    width: int
+    height: int
+    data: bytes
+
+    @property
+    def filename(self) -> str:
+        extension = "png" if self.format.startswith("png") else self.format
+        return f"{self.name}.{extension}"
+
+    @property
+    def media_type(self) -> str:
+        return f"image/{self.filename.rsplit('.', 1)[-1]}"
+
+
+def synthetic_photo(width: int, height: int, seed: int, mode: str = "RGB") -> Image.Image:
+    """A smooth background with one soft-edged foreground shape."""
+    rng = np.random.default_rng(seed)
+    background = rng.integers(0, 255, (height // 64 + 2, width // 64 + 2, 3), dtype=np.uint8)
+    image = Image.fromarray(background).resize((width, height), Image.BICUBIC)
+
+    shape = Image.new("L", (width, height), 0)
+    draw = ImageDraw.Draw(shape)
+    draw.rounded_rectangle(
+        (width // 4, height // 6, width * 3 // 4, height * 5 // 6),
+        radius=min(width, height) // 8,
+        fill=255,
+    )
+    shape = shape.filter(ImageFilter.GaussianBlur(radius=max(width, height) / 300))
+    color = tuple(int(c) for c in rng.integers(0, 255, 3))
+    image.paste(Image.new("RGB", (width, height), color), mask=shape)
+
+    noise = rng.normal(0, 4, (height, width, 3))
+    image = Image.fromarray(np.clip(np.asarray(image) + noise, 0, 255).astype(np.uint8))
+    if mode == "RGBA":
+        image.putalpha(Image.fromarray(np.where(np.asarray(shape) > 0, 255, 96).astype(np.uint8)))
+    return image
+
+
+def encode(image: Image.Image, format: str) -> bytes:
+    pil_format, options, _ = FORMATS[format]
+    buffer = io.BytesIO()
+    image.save(buffer, format=pil_format, **options)
+    return buffer.getvalue()
+
+
+def build_fixtures(resolutions: list[str], formats: list[str], seed: int = 0) -> list[Fixture]:
+    """
+    One fixture per (resolution, format) pair.
+
+    Args:
+        resolutions: Names from RESOLUTIONS
+        formats: Names from FORMATS
+        seed: Base seed; the same seed always yields the same bytes
+
+    Returns:
+        Fixtures in (resolution, format) order
+    """
+    sizes = {name: (width, height) for name, width, height in RESOLUTIONS}
+    fixtures = []
+    for r, resolution in enumerate(resolutions):
+        width, height = sizes[resolution]
+        for format in formats:
+            mode = FORMATS[format][2]
+            image = synthetic_photo(width, height, seed + r, mode)
+            fixtures.append(Fixture(f"{resolution}_{format}", resolution, format, width, height,
+                                    encode(image, format)))
+    return fixtures
+
+
+def write_fixtures(fixtures: list[Fixture], directory: str):
+    """Save fixtures to disk (e.g. to inspect them or feed other tools)."""
+    os.makedirs(directory, exist_ok=True)
+    for fixture in fixtures:
+        with open(os.path.join(directory, fixture.filename), "wb") as f:
+            f.write(fixture.data)
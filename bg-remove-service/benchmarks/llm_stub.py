@@ -0,0 +1,141 @@
+"""
+Stub OpenRouter Server
+A local OpenAI-compatible /chat/completions endpoint for benchmarks, so
+attribute extraction can be load-tested without network calls or cost.
+
+Replies follow the request:
+- with a json_schema `response_format`, one item array per schema property
+- otherwise a bare array for one image, or {"0": [...], ...} for several
+- `"stream": true` is answered as server-sent events
+
+A fixed `latency` (plus jitter) stands in for model time. Requests are served
+on their own threads, like a real provider.
+
+Usage:
+    python benchmarks/llm_stub.py --port 8090 --latency-ms 800
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+ITEM = {
+    "category": "tops",
+    "color": "white",
+    "name": "White Cotton T-Shirt",
+    "brand": None,
+    "material": "cotton",
+    "size": None,
+    "estimated_price": 350000,
+}
+
+
+def stub_reply(body: dict) -> str:
+    """The JSON text a well-behaved model would return for this request."""
+    response_format = body.get("response_format") or {}
+    schema = response_format.get("json_schema", {}).get("schema")
+    if schema:
+        return json.dumps({key: [ITEM] for key in schema.get("properties", {})})
+
+    images = sum(
+        1
+        for message in body.get("messages", [])
+        if isinstance(message.get("content"), list)
+        for part in message["content"]
+        if part.get("type") == "image_url"
+    )
+    if images <= 1:
+        return json.dumps([ITEM])
+    return json.dumps({str(i): [ITEM] for i in range(images)})
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+
+        time.sleep(max(0.0, server.latency + random.uniform(-server.jitter, server.jitter)))
+        content = stub_reply(body)
+        usage = {"prompt_tokens": 850, "completion_tokens": len(content) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        base = {"id": "stub", "created": int(time.time()), "model": body.get("model", "stub")}
+
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for start in range(0, len(content), 16):
+                chunk = {**base, "object": "chat.completion.chunk", "choices": [
+                    {"index": 0, "delta": {"content": content[start:start + 16]}, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+            return
+
+        payload = json.dumps({**base, "object": "chat.completion", "usage": usage, "choices": [
+            {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.5, jitter: float = 0.0):
+        """
+        Args:
+            host: Interface to listen on
+            port: Port (0 picks a free one)
+            latency: Seconds each completion takes
+            jitter: Uniform +/- jitter added to the latency, in seconds
+        """
+        super().__init__((host, port), StubHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api/v1"
+
+    def start(self) -> "StubServer":
+        """Serve on a daemon thread."""
+        threading.Thread(target=self.serve_forever, name="llm-stub", daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=800)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    server = StubServer(args.host, args.port, args.latency_ms / 1000, args.jitter_ms / 1000)
+    print(f"Stub OpenRouter on {server.base_url} (set OPENROUTER_BASE_URL to this)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Cut-out Output Encoding Benchmark
+Encode time and size of each cut-out output codec (PNG compress levels, lossy
+and lossless WebP, AVIF, mask-only) on the same images and mattes.
+
+Mattes come from RMBG-1.4 with `--images`; without it, synthetic photos get a
+soft elliptical matte, which is close enough for codec timing.
+
+Usage:
+    poetry run python benchmarks/output_encoding.py --images data/eval_images --count 8
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, features
+
+from bg_remove_service.output_codec import OutputCodec
+
+
+CODECS = [
+    ("png z6 (default)", dict(format="png")),
+    ("png z1", dict(format="png", compress_level=1)),
+    ("png z0", dict(format="png", compress_level=0)),
+    ("webp q80 m4", dict(format="webp", quality=80)),
+    ("webp q80 m0", dict(format="webp", quality=80, method=0)),
+    ("webp lossless m0", dict(format="webp", lossless=True, quality=0, method=0)),
+    ("webp lossless m4", dict(format="webp", lossless=True)),
+    ("avif q60", dict(format="avif", quality=60)),
+    ("mask z6", dict(format="mask")),
+    ("mask z1", dict(format="mask", compress_level=1)),
+]
+
+
+def synthetic_photos(count: int, size: tuple[int, int], seed: int) -> list[Image.Image]:
+    """Smooth random RGB images."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    return [
+        Image.fromarray(rng.integers(0, 255, (height // 64 + 2, width // 64 + 2, 3), dtype=np.uint8))
+        .resize((width, height), Image.BICUBIC)
+        for _ in range(count)
+    ]
+
+
+def ellipse_matte(size: tuple[int, int]) -> np.ndarray:
+    """Soft-edged centered ellipse covering about half the frame."""
+    width, height = size
+    matte = Image.new("L", size, 0)
+    ImageDraw.Draw(matte).ellipse((width // 5, height // 8, width * 4 // 5, height * 7 // 8), fill=255)
+    return np.asarray(matte.filter(ImageFilter.GaussianBlur(radius=max(width, height) / 200)))
+
+
+def load_inputs(args) -> tuple[list[Image.Image], list[np.ndarray]]:
+    if not args.images:
+        images = synthetic_photos(args.count, (args.width, args.height), args.seed)
+        return images, [ellipse_matte(image.size) for image in images]
+
+    from bg_remove_service.segmentation import load_segmentation_pipeline, predict_masks
+
+    names = sorted(os.listdir(args.images))[:args.count]
+    images = [Image.open(os.path.join(args.images, name)).convert("RGB") for name in names]
+    pipe = load_segmentation_pipeline()
+    return images, predict_masks(pipe.model, images, pipe.device)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default=None, help="Folder of photos (synthetic images if omitted)")
+    parser.add_argument("--count", type=int, default=4)
+    parser.add_argument("--width", type=int, default=3024, help="Synthetic image width")
+    parser.add_argument("--height", type=int, default=4032, help="Synthetic image height")
+    parser.add_argument("--repeat", type=int, default=2, help="Timed encodes per image and codec")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    images, masks = load_inputs(args)
+    pixels = sum(image.width * image.height for image in images)
+    print(f"Images: {len(images)}  Mean size: {pixels / len(images) / 1e6:.1f} MP")
+    print(f"{'codec':<18} {'ms/image':>9} {'KiB/image':>10} {'vs png z6':>10}")
+
+    baseline = None
+    for name, options in CODECS:
+        if options["format"] == "avif" and not features.check("avif"):
+            print(f"{name:<18} {'(no AVIF support in this Pillow build)':>30}")
+            continue
+        codec = OutputCodec(**options)
+        sizes = [len(codec.encode(image, mask)) for image, mask in zip(images, masks)]
+
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            for image, mask in zip(images, masks):
+                codec.encode(image, mask)
+        ms = (time.perf_counter() - started) * 1000 / (args.repeat * len(images))
+        kib = np.mean(sizes) / 1024
+        baseline = baseline or kib
+        print(f"{name:<18} {ms:>9.1f} {kib:>10.1f} {kib / baseline:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Quantization Accuracy Benchmark
+Measures what int8 quantization costs in quality and gains in CPU throughput,
+against the fp32 models on a fixed image set.
+
+- embedding: cosine similarity between fp32 and int8 embeddings of the same image,
+  and how many of each image's top-5 neighbours (within the set) stay the same
+- segmentation: IoU of the binarized (alpha > 127) fp32 and int8 masks, and the
+  mean absolute alpha difference
+
+Usage:
+    poetry run python benchmarks/quantization_accuracy.py --images data/eval_images \
+        --calibration-dir data/calibration_images --models embedding segmentation --modes dynamic static
+"""
+
+import argparse
+import copy
+import os
+import time
+
+import numpy as np
+import torch
+
+from bg_remove_service.embedding_service import FashionEmbeddingService, cosine_similarities, top_k_indices
+from bg_remove_service.quantization import calibration_images, quantize_model
+from bg_remove_service.segmentation import load_segmentation_pipeline, predict_masks, preprocess_batch
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def neighbour_overlap(reference: np.ndarray, candidate: np.ndarray, k: int = 5) -> float:
+    """Mean fraction of each item's top-k neighbours (excluding itself) that survive quantization."""
+    k = min(k, reference.shape[0] - 1)
+    if k <= 0:
+        return 1.0
+    overlaps = []
+    for i in range(reference.shape[0]):
+        ref_sims, cand_sims = cosine_similarities(reference[i], reference), cosine_similarities(candidate[i], candidate)
+        ref_sims[i] = cand_sims[i] = -np.inf
+        overlaps.append(len(set(top_k_indices(ref_sims, k)) & set(top_k_indices(cand_sims, k))) / k)
+    return float(np.mean(overlaps))
+
+
+def evaluate_embeddings(images, modes, checkpoint):
+    fp32 = FashionEmbeddingService(model_path=checkpoint, device="cpu")
+    reference, fp32_s = timed(lambda: np.array(fp32.generate_embeddings_batch(images)))
+    print(f"\nEmbedding fp32: {len(images) / fp32_s:.1f} img/s")
+    print(f"{'mode':>8} {'mean cos':>9} {'min cos':>9} {'top-5 kept':>11} {'img/s':>8} {'speedup':>8}")
+
+    for mode in modes:
+        # Same weights as the reference, even when fc_embed is randomly initialized
+        service = copy.deepcopy(fp32)
+        service.quantize(mode)
+        embeddings, seconds = timed(lambda: np.array(service.generate_embeddings_batch(images)))
+        cosine = (reference * embeddings).sum(axis=1) / np.maximum(
+            np.linalg.norm(reference, axis=1) * np.linalg.norm(embeddings, axis=1), 1e-12
+        )
+        print(f"{mode:>8} {cosine.mean():>9.5f} {cosine.min():>9.5f} "
+              f"{neighbour_overlap(reference, embeddings):>11.3f} "
+              f"{len(images) / seconds:>8.1f} {fp32_s / seconds:>7.2f}x")
+
+
+def calibration_batches(images, batch_size: int = 2):
+    return [preprocess_batch(images[i:i + batch_size]) for i in range(0, len(images), batch_size)]
+
+
+def evaluate_masks(images, modes):
+    pipe = load_segmentation_pipeline()
+    reference, fp32_s = timed(lambda: predict_masks(pipe.model, images, pipe.device))
+    print(f"\nSegmentation fp32: {len(images) / fp32_s:.2f} img/s")
+    print(f"{'mode':>8} {'mean IoU':>9} {'min IoU':>9} {'alpha MAE':>10} {'img/s':>8} {'speedup':>8}")
+
+    for mode in modes:
+        model = quantize_model(pipe.model, mode, lambda: calibration_batches(calibration_images()))
+        masks, seconds = timed(lambda: predict_masks(model, images, pipe.device))
+        ious, maes = [], []
+        for ref, mask in zip(reference, masks):
+            ref_bin, mask_bin = ref > 127, mask > 127
+            union = np.logical_or(ref_bin, mask_bin).sum()
+            ious.append(np.logical_and(ref_bin, mask_bin).sum() / union if union else 1.0)
+            maes.append(np.abs(ref.astype(np.float32) - mask.astype(np.float32)).mean())
+        print(f"{mode:>8} {np.mean(ious):>9.4f} {np.min(ious):>9.4f} {np.mean(maes):>10.2f} "
+              f"{len(images) / seconds:>8.2f} {fp32_s / seconds:>7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", required=True, help="Folder of evaluation images")
+    parser.add_argument("--calibration-dir", default=None,
+                        help="Folder of calibration images for static mode (default: QUANTIZATION_CALIBRATION_DIR)")
+    parser.add_argument("--limit", type=int, default=64, help="Evaluation images to use")
+    parser.add_argument("--models", nargs="+", choices=["embedding", "segmentation"], default=["embedding"])
+    parser.add_argument("--modes", nargs="+", choices=["dynamic", "static"], default=["dynamic", "static"])
+    parser.add_argument("--checkpoint", default=os.getenv("EMBEDDING_MODEL_PATH"))
+    parser.add_argument("--threads", type=int, default=None, help="torch.set_num_threads")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    if args.calibration_dir:
+        os.environ["QUANTIZATION_CALIBRATION_DIR"] = args.calibration_dir
+    # The fp32 reference must not pick up a quantization mode from the environment
+    os.environ["EMBEDDING_QUANTIZATION"] = os.environ["SEGMENTATION_QUANTIZATION"] = "none"
+
+    images = calibration_images(args.images, args.limit)
+    print(f"Evaluation images: {len(images)}  Threads: {torch.get_num_threads()}")
+    if "embedding" in args.models:
+        evaluate_embeddings(images, args.modes, args.checkpoint)
+    if "segmentation" in args.models:
+        evaluate_masks(images, args.modes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""
+Benchmark Suite
+Latency percentiles and throughput for every AI code path, on deterministic
+synthetic fixtures, written as JSON so runs can be compared over time.
+
+Sections:
+- remove_bg: remove_background_from_image per fixture resolution
+- embedding: generate_embedding called N times vs one generate_embeddings_batch of N
+- find_compatible: find_most_compatible (candidate dicts) and the packed-matrix
+  path, 100 -> 1M candidates
+- http: every endpoint under concurrent load through an in-process ASGI client,
+  with LLM calls answered by a local stub OpenRouter server (benchmarks/llm_stub.py)
+
+The result cache is off and near-duplicate grouping is disabled unless set in the
+environment, so repeated fixtures are really processed every time. RMBG-1.4 is
+downloaded on first use.
+
+Usage:
+    poetry run python benchmarks/suite.py --output results/baseline.json
+    poetry run python benchmarks/suite.py --sections embedding find_compatible \\
+        --output results/run.json --compare results/baseline.json --fail-on-regression
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+from PIL import Image
+
+from fixtures import FORMATS, RESOLUTIONS, Fixture, build_fixtures, write_fixtures
+from llm_stub import StubServer
+
+
+SECTIONS = ("remove_bg", "embedding", "find_compatible", "http")
+
+
+def summarize(timings_ms: list[float], items_per_call: int = 1, wall_seconds: Optional[float] = None) -> dict:
+    """
+    Percentiles of per-call latency and items/s.
+    Throughput uses the wall time when calls overlapped, otherwise the summed latency.
+    """
+    p50, p90, p99 = np.percentile(timings_ms, [50, 90, 99])
+    seconds = wall_seconds if wall_seconds is not None else sum(timings_ms) / 1000
+    return {
+        "calls": len(timings_ms),
+        "p50_ms": round(float(p50), 3),
+        "p90_ms": round(float(p90), 3),
+        "p99_ms": round(float(p99), 3),
+        "mean_ms": round(float(np.mean(timings_ms)), 3),
+        "throughput_per_s": round(len(timings_ms) * items_per_call / seconds, 2) if seconds else None,
+    }
+
+
+class Recorder:
+    """Collects results and prints one row per measurement."""
+
+    def __init__(self):
+        self.results: list[dict] = []
+        print(f"{'section':<16} {'name':<44} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'items/s':>9}")
+
+    def add(self, section: str, name: str, params: dict, stats: dict, **extra):
+        self.results.append({"section": section, "name": name, "params": params, **stats, **extra})
+        label = name + "".join(f" {k}={v}" for k, v in params.items())
+        print(f"{section:<16} {label:<44} {stats['p50_ms']:>9.2f} {stats['p90_ms']:>9.2f} "
+              f"{stats['p99_ms']:>9.2f} {stats['throughput_per_s'] or 0:>9.1f}")
+
+
+def time_calls(fn: Callable[[], object], iterations: int, warmup: int) -> list[float]:
+    timings = []
+    for i in range(warmup + iterations):
+        start = time.perf_counter()
+        fn()
+        if i >= warmup:
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+async def time_async_calls(fn: Callable[[], Awaitable], iterations: int, warmup: int) -> list[float]:
+    timings = []
+    for i in range(warmup + iterations):
+        start = time.perf_counter()
+        await fn()
+        if i >= warmup:
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def decode(fixture: Fixture) -> Image.Image:
+    return Image.open(io.BytesIO(fixture.data)).convert("RGB")
+
+
+async def bench_remove_bg(service, fixtures: list[Fixture], args, recorder: Recorder):
+    for fixture in fixtures:
+        if fixture.format != "jpeg":
+            continue
+        image = decode(fixture)
+        timings = await time_async_calls(
+            lambda: service.remove_background_from_image(image), args.iterations, args.warmup
+        )
+        recorder.add("remove_bg", "remove_background_from_image",
+                     {"resolution": fixture.resolution}, summarize(timings))
+
+
+async def bench_embedding(service, fixtures: list[Fixture], args, recorder: Recorder):
+    model = await service.load_model(service.embedding_model)
+    image = decode(next(f for f in fixtures if f.format == "jpeg"))
+    for batch_size in args.batch_sizes:
+        images = [image] * batch_size
+        single = time_calls(lambda: [model.generate_embedding(i) for i in images], args.iterations, args.warmup)
+        recorder.add("embedding", "generate_embedding xN", {"batch_size": batch_size},
+                     summarize(single, batch_size))
+        batched = time_calls(lambda: model.generate_embeddings_batch(images), args.iterations, args.warmup)
+        recorder.add("embedding", "generate_embeddings_batch", {"batch_size": batch_size},
+                     summarize(batched, batch_size))
+
+
+async def bench_find_compatible(service, args, recorder: Recorder):
+    model = await service.load_model(service.embedding_model)
+    rng = np.random.default_rng(args.seed)
+    target = rng.normal(size=64).astype(np.float32)
+    for count in args.candidates:
+        matrix = rng.normal(size=(count, 64)).astype(np.float32)
+        ids = list(range(count))
+        # Large sweeps get fewer iterations so 1M candidates stays in minutes
+        iterations = max(3, min(args.iterations, 10_000_000 // count))
+
+        if count <= args.max_dict_candidates:
+            candidates = [{"id": i, "embedding": row} for i, row in zip(ids, matrix.tolist())]
+            timings = time_calls(lambda: model.find_most_compatible(target, candidates, top_k=10),
+                                 iterations, args.warmup)
+            recorder.add("find_compatible", "find_most_compatible", {"candidates": count}, summarize(timings))
+
+        timings = time_calls(lambda: model.find_most_compatible_packed(target, ids, matrix, top_k=10),
+                             iterations, args.warmup)
+        recorder.add("find_compatible", "find_most_compatible_packed", {"candidates": count}, summarize(timings))
+
+
+def http_scenarios(fixture: Fixture, args) -> dict[str, tuple[Callable, int]]:
+    """Endpoint name -> (function sending one request with an httpx client, images per request)."""
+    upload = ("file", (fixture.filename, fixture.data, fixture.media_type))
+    batch = [("files", (f"{i}_{fixture.filename}", fixture.data, fixture.media_type))
+             for i in range(args.http_batch_size)]
+
+    rng = np.random.default_rng(args.seed)
+    find_body = {
+        "target_embedding": rng.normal(size=64).tolist(),
+        "candidates": [{"id": i, "embedding": row} for i, row in
+                       enumerate(rng.normal(size=(args.http_candidates, 64)).tolist())],
+        "top_k": 10,
+    }
+
+    size = args.http_batch_size
+    return {
+        "POST /remove-bg": (lambda c: c.post("/remove-bg", files=[upload]), 1),
+        "POST /batch/remove-bg": (lambda c: c.post("/batch/remove-bg", files=batch), size),
+        "POST /generate-embedding": (lambda c: c.post("/generate-embedding", files=[upload]), 1),
+        "POST /batch/generate-embedding": (lambda c: c.post("/batch/generate-embedding", files=batch), size),
+        "POST /find-compatible": (lambda c: c.post("/find-compatible", json=find_body), 1),
+        "POST /extract-attributes": (lambda c: c.post("/extract-attributes", files=[upload]), 1),
+        "POST /batch/extract-attributes": (lambda c: c.post("/batch/extract-attributes", files=batch), size),
+    }
+
+
+async def bench_http(service, fixtures: list[Fixture], args, recorder: Recorder):
+    import httpx
+
+    fixture = next(f for f in fixtures if f.resolution == args.http_resolution and f.format == "jpeg")
+    transport = httpx.ASGITransport(app=service.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        for name, (send, items) in http_scenarios(fixture, args).items():
+            if args.endpoints and name.split(" ", 1)[1] not in args.endpoints:
+                continue
+            for _ in range(args.warmup):
+                await send(client)
+            for concurrency in args.concurrency:
+                limit = asyncio.Semaphore(concurrency)
+                timings, statuses = [], Counter()
+
+                async def one():
+                    async with limit:
+                        start = time.perf_counter()
+                        response = await send(client)
+                        timings.append((time.perf_counter() - start) * 1000)
+                        statuses[response.status_code] += 1
+
+                started = time.perf_counter()
+                await asyncio.gather(*(one() for _ in range(args.requests)))
+                wall = time.perf_counter() - started
+                recorder.add("http", name, {"concurrency": concurrency}, summarize(timings, items, wall),
+                             statuses={str(code): n for code, n in sorted(statuses.items())})
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_metadata(args, service) -> dict:
+    import torch
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "platform": platform.platform(),
+        "runtime": service.get_runtime_config(),
+        "args": vars(args),
+    }
+
+
+def result_key(result: dict) -> tuple:
+    return result["section"], result["name"], json.dumps(result["params"], sort_keys=True)
+
+
+def compare(results: list[dict], baseline_path: str, threshold: float) -> int:
+    """Print p50 changes against a previous run; returns the number of regressions."""
+    with open(baseline_path) as f:
+        baseline = {result_key(r): r for r in json.load(f)["results"]}
+
+    print(f"\nAgainst {baseline_path} (regression: p50 more than {threshold:.0%} slower)")
+    regressions = 0
+    for result in results:
+        before = baseline.get(result_key(result))
+        if before is None or not before["p50_ms"]:
+            continue
+        ratio = result["p50_ms"] / before["p50_ms"]
+        regressed = ratio > 1 + threshold
+        regressions += regressed
+        label = result["name"] + "".join(f" {k}={v}" for k, v in result["params"].items())
+        print(f"{result['section']:<16} {label:<44} {before['p50_ms']:>9.2f} -> {result['p50_ms']:>9.2f} "
+              f"{ratio:>6.2f}x{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def configure_environment(stub: StubServer, index_dir: str):
+    """Point the service at the stub and isolate it; must run before the service is imported."""
+    os.environ["OPENROUTER_API_KEY"] = "benchmark"
+    os.environ["OPENROUTER_BASE_URL"] = stub.base_url
+    os.environ.setdefault("RESULT_CACHE_ENABLED", "false")
+    os.environ.setdefault("LLM_DEDUPE_MAX_DISTANCE", "-1")
+    os.environ.setdefault("EMBEDDING_INDEX_DIR", index_dir)
+
+
+async def run(args, service) -> list[dict]:
+    fixtures = build_fixtures(args.resolutions, args.formats, args.seed)
+    if args.write_fixtures:
+        write_fixtures(fixtures, args.write_fixtures)
+    recorder = Recorder()
+
+    # Run the app's startup (thread settings, index) and shutdown handlers around the whole run
+    async with service.app.router.lifespan_context(service.app):
+        if "remove_bg" in args.sections:
+            await bench_remove_bg(service, fixtures, args, recorder)
+        if "embedding" in args.sections:
+            await bench_embedding(service, fixtures, args, recorder)
+        if "find_compatible" in args.sections:
+            await bench_find_compatible(service, args, recorder)
+        if "http" in args.sections:
+            await bench_http(service, fixtures, args, recorder)
+    return recorder.results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sections", nargs="+", choices=SECTIONS, default=list(SECTIONS))
+    parser.add_argument("--resolutions", nargs="+", choices=[r[0] for r in RESOLUTIONS],
+                        default=[r[0] for r in RESOLUTIONS])
+    parser.add_argument("--formats", nargs="+", choices=sorted(FORMATS), default=sorted(FORMATS))
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--candidates", type=int, nargs="+", default=[100, 1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--max-dict-candidates", type=int, default=100_000,
+                        help="Largest count benchmarked with candidate dicts (the packed path runs for all)")
+    parser.add_argument("--endpoints", nargs="+", default=None, help="Only these HTTP paths, e.g. /remove-bg")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=32, help="HTTP requests per endpoint and concurrency")
+    parser.add_argument("--http-resolution", choices=[r[0] for r in RESOLUTIONS], default="2mp")
+    parser.add_argument("--http-batch-size", type=int, default=4, help="Images per batch-endpoint request")
+    parser.add_argument("--http-candidates", type=int, default=1000, help="Candidates per /find-compatible")
+    parser.add_argument("--llm-latency-ms", type=float, default=300, help="Stub OpenRouter response time")
+    parser.add_argument("--output", default=None, help="Write results as JSON to this file")
+    parser.add_argument("--compare", default=None, help="Previous JSON results to compare against")
+    parser.add_argument("--regression-threshold", type=float, default=0.15)
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--write-fixtures", default=None, help="Also save the fixture images to this folder")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if "http" in args.sections and args.http_resolution not in args.resolutions:
+        args.resolutions.append(args.http_resolution)
+    if "jpeg" not in args.formats:
+        args.formats.append("jpeg")
+
+    stub = StubServer(latency=args.llm_latency_ms / 1000).start()
+    index_dir = tempfile.mkdtemp(prefix="bench-index-")
+    configure_environment(stub, index_dir)
+    from bg_remove_service import main as service
+
+    results = asyncio.run(run(args, service))
+    report = {"meta": run_metadata(args, service), "results": results}
+    print(f"\nStub OpenRouter served {stub.requests} completions")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.regression_threshold)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Thread Scaling Benchmark
+Forward latency and throughput of each model as torch intra-op threads grow,
+to pick TORCH_NUM_THREADS (and serve workers x threads) for a machine.
+
+Speedup is relative to the first thread count in the sweep (normally 1);
+efficiency is speedup per added thread, 1.0 being perfect scaling. Past the point
+where efficiency drops well below 1, more throughput comes from more
+serve workers rather than more threads.
+
+The embedding model runs with random weights unless `--checkpoint` is given;
+the segmentation model (RMBG-1.4) is downloaded on first use.
+
+Usage:
+    poetry run python benchmarks/thread_scaling.py --models embedding segmentation --threads 1 2 4 8
+"""
+
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from bg_remove_service.runtime_config import available_cpus, configure_threads, get_runtime_config
+
+
+def load_embedding(checkpoint):
+    from bg_remove_service.embedding_service import FashionEmbeddingService, SimpleEmbeddingNet
+
+    if checkpoint:
+        service = FashionEmbeddingService(model_path=checkpoint, device="cpu")
+        return service.model, (3, 112, 112), service.memory_format
+    return SimpleEmbeddingNet(pretrained=False).eval(), (3, 112, 112), torch.contiguous_format
+
+
+def load_segmentation(checkpoint):
+    from bg_remove_service.segmentation import RMBG_INPUT_SIZE, load_segmentation_pipeline
+
+    return load_segmentation_pipeline().model.eval(), (3, *RMBG_INPUT_SIZE), torch.contiguous_format
+
+
+MODELS = {"embedding": load_embedding, "segmentation": load_segmentation}
+
+
+def time_forward(model, batch: torch.Tensor, iterations: int, warmup: int) -> list[float]:
+    """Per-iteration forward latency in milliseconds."""
+    timings = []
+    with torch.inference_mode():
+        for i in range(warmup + iterations):
+            start = time.perf_counter()
+            model(batch)
+            if i >= warmup:
+                timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def default_thread_counts() -> list[int]:
+    """1, 2, 4, ... up to (and including) the available CPUs."""
+    cpus = available_cpus()
+    counts = [1]
+    while counts[-1] * 2 < cpus:
+        counts.append(counts[-1] * 2)
+    return sorted(set(counts + [cpus]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", nargs="+", choices=sorted(MODELS), default=["embedding"])
+    parser.add_argument("--threads", type=int, nargs="+", default=None,
+                        help="Thread counts to sweep (default: powers of two up to the available CPUs)")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--checkpoint", default=None, help="Embedding checkpoint (random weights if omitted)")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    torch.manual_seed(args.seed)
+    thread_counts = args.threads or default_thread_counts()
+    configure_threads(thread_counts[0])
+    runtime = get_runtime_config()
+    print(f"Available CPUs: {runtime['available_cpus']}  Affinity: {runtime['affinity']}  "
+          f"Quota: {runtime['cpu_quota']}  Allocator: {runtime['allocator']}")
+
+    for name in args.models:
+        model, input_shape, memory_format = MODELS[name](args.checkpoint)
+        print(f"\n{name}  input {tuple(input_shape)}")
+        print(f"{'batch':>6} {'threads':>8} {'p50 ms':>9} {'p90 ms':>9} {'img/s':>8} {'speedup':>8} {'eff':>6}")
+        for batch_size in args.batch_sizes:
+            batch = torch.randn(batch_size, *input_shape).contiguous(memory_format=memory_format)
+            baseline = None
+            for threads in thread_counts:
+                torch.set_num_threads(threads)
+                timings = time_forward(model, batch, args.iterations, args.warmup)
+                p50, p90 = np.percentile(timings, [50, 90])
+                throughput = batch_size * 1000 / np.mean(timings)
+                baseline = baseline or throughput
+                speedup = throughput / baseline
+                print(f"{batch_size:>6} {threads:>8} {p50:>9.1f} {p90:>9.1f} {throughput:>8.1f} "
+                      f"{speedup:>7.2f}x {speedup * thread_counts[0] / threads:>6.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Approximate Nearest Neighbour Index
+Inverted-file (IVF) index for cosine search over fashion embeddings, in pure NumPy.
+
+Vectors are assigned to the nearest of `nlist` centroids (spherical k-means).
+A query scores only the `nprobe` closest lists, trading recall for latency.
+
+The lists hold keys only. Candidates are scored by the caller from whatever
+representation it keeps (compact codes, a memory-mapped matrix), so the index
+adds 8 bytes per vector instead of a second float32 copy.
+"""
+
+from typing import Callable, Optional
+
+import numpy as np
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize rows (zero rows stay zero)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def spherical_kmeans(vectors: np.ndarray,
+                     k: int,
+                     iterations: int = 20,
+                     seed: int = 0) -> np.ndarray:
+    """
+    Cluster unit vectors by cosine similarity.
+
+    Args:
+        vectors: (N x D) vectors (normalized here)
+        k: Number of centroids
+        iterations: Lloyd iterations
+        seed: Random seed for initialization
+
+    Returns:
+        (k x D) unit-norm centroids
+    """
+    rng = np.random.default_rng(seed)
+    data = normalize_rows(vectors)
+    k = min(k, data.shape[0])
+    centroids = data[rng.choice(data.shape[0], size=k, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = np.argmax(data @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, data)
+        counts = np.bincount(assignments, minlength=k)
+
+        # Re-seed empty clusters with random points
+        empty = np.flatnonzero(counts == 0)
+        if empty.size:
+            sums[empty] = data[rng.choice(data.shape[0], size=empty.size, replace=False)]
+        centroids = normalize_rows(sums)
+
+    return centroids
+
+
+class _InvertedList:
+    """Growable key array for one centroid."""
+
+    def __init__(self):
+        self.keys = np.empty(0, dtype=np.int64)
+        self.size = 0
+
+    def add(self, keys: np.ndarray):
+        needed = self.size + keys.shape[0]
+        if needed > self.keys.shape[0]:
+            capacity = max(needed, 2 * self.keys.shape[0], 16)
+            grown_keys = np.empty(capacity, dtype=np.int64)
+            grown_keys[:self.size] = self.keys[:self.size]
+            self.keys = grown_keys
+        self.keys[self.size:needed] = keys
+        self.size = needed
+
+    def remove(self, key: int) -> bool:
+        positions = np.flatnonzero(self.keys[:self.size] == key)
+        if positions.size == 0:
+            return False
+        # Swap with the last entry to keep the array dense
+        pos, last = positions[0], self.size - 1
+        self.keys[pos] = self.keys[last]
+        self.size = last
+        return True
+
+
+class IVFIndex:
+    """
+    IVF index over integer keys with incremental inserts and removals.
+
+    Knobs:
+        nlist: number of coarse clusters (more = smaller lists, needs more training data)
+        nprobe: lists scanned per query (higher = better recall, slower)
+    """
+
+    def __init__(self, dimensions: int, nlist: int = 256, nprobe: int = 8, seed: int = 0):
+        if nprobe < 1:
+            raise ValueError(f"nprobe must be at least 1, got {nprobe}")
+        self.dimensions = dimensions
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self._lists: list[_InvertedList] = []
+        self._list_of_key: dict[int, int] = {}
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def __len__(self) -> int:
+        return len(self._list_of_key)
+
+    def train(self, vectors: np.ndarray, max_samples: int = 100_000, iterations: int = 20):
+        """Learn the coarse centroids from (a sample of) the data."""
+        rng = np.random.default_rng(self.seed)
+        if vectors.shape[0] > max_samples:
+            vectors = vectors[rng.choice(vectors.shape[0], size=max_samples, replace=False)]
+        self.set_centroids(spherical_kmeans(vectors, self.nlist, iterations, self.seed))
+
+    def set_centroids(self, centroids: np.ndarray):
+        """Use precomputed centroids (e.g. loaded from disk); clears all lists."""
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.nlist = self.centroids.shape[0]
+        if self.nprobe > self.nlist:
+            # k-means makes at most one list per training vector
+            print(f"[ANN] Default nprobe {self.nprobe} exceeds the {self.nlist} trained lists; using {self.nlist}")
+            self.nprobe = self.nlist
+        self._lists = [_InvertedList() for _ in range(self.nlist)]
+        self._list_of_key = {}
+
+    def add(self, keys: np.ndarray, vectors: np.ndarray):
+        """Assign (or re-assign) integer keys to lists by their vectors; the vectors are not kept."""
+        if not self.is_trained:
+            raise RuntimeError("IVFIndex must be trained before adding vectors")
+        keys = np.asarray(keys, dtype=np.int64)
+        for key in keys.tolist():
+            if key in self._list_of_key:
+                self.remove(key)
+
+        data = normalize_rows(vectors)
+        assignments = np.argmax(data @ self.centroids.T, axis=1)
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.flatnonzero(np.diff(assignments[order])) + 1
+        for group in np.split(order, bounds):
+            if group.size == 0:
+                continue
+            list_id = int(assignments[group[0]])
+            self._lists[list_id].add(keys[group])
+            for key in keys[group].tolist():
+                self._list_of_key[key] = list_id
+
+    def remove(self, key: int) -> bool:
+        list_id = self._list_of_key.pop(int(key), None)
+        if list_id is None:
+            return False
+        return self._lists[list_id].remove(int(key))
+
+    def probe(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """
+        Keys in the `nprobe` lists closest to the query.
+
+        Args:
+            query: (D,) query vector
+            nprobe: Lists to scan (defaults to the index setting)
+
+        Raises:
+            ValueError: If nprobe is not between 1 and nlist
+        """
+        if nprobe is None:
+            nprobe = self.nprobe
+        elif not 1 <= nprobe <= self.nlist:
+            raise ValueError(f"nprobe must be between 1 and {self.nlist}, got {nprobe}")
+        if not self.is_trained or len(self) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        centroid_sims = self.centroids @ normalize_rows(query)
+        probes = np.argpartition(-centroid_sims, nprobe - 1)[:nprobe]
+        return np.concatenate([self._lists[p].keys[:self._lists[p].size] for p in probes])
+
+    def search(self,
+               query: np.ndarray,
+               top_k: int,
+               score: Callable[[np.ndarray], np.ndarray],
+               nprobe: Optional[int] = None,
+               allowed: Optional[np.ndarray] = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate top-k.
+
+        Args:
+            query: (D,) query vector
+            top_k: Number of results
+            score: Maps candidate keys to their similarity with the query
+            nprobe: Lists to scan (defaults to the index setting)
+            allowed: Optional boolean array indexed by key; False keys are skipped
+
+        Returns:
+            (keys, similarities), best first
+        """
+        keys = self.probe(query, nprobe)
+        if allowed is not None and keys.size:
+            keys = keys[allowed[keys]]
+        if keys.size == 0:
+            return keys, np.empty(0, dtype=np.float32)
+
+        sims = np.asarray(score(keys), dtype=np.float32)
+        if top_k < sims.shape[0]:
+            best = np.argpartition(-sims, top_k - 1)[:top_k]
+        else:
+            best = np.arange(sims.shape[0])
+        best = best[np.argsort(-sims[best], kind="stable")]
+        return keys[best], sims[best]
+
+    def get_stats(self) -> dict:
+        sizes = [lst.size for lst in self._lists]
+        return {
+            "trained": self.is_trained,
+            "nlist": self.nlist,
+            "nprobe": self.nprobe,
+            "vectors": len(self),
+            "max_list_size": max(sizes) if sizes else 0,
+            "mean_list_size": round(float(np.mean(sizes)), 1) if sizes else 0.0,
+        }
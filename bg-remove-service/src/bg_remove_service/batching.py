@@ -0,0 +1,266 @@
+"""
+Micro-batching Scheduler
+Coalesces concurrent single-item inference requests into batched forward passes.
+Callers await their own result while a background worker groups queued requests.
+"""
+
+import asyncio
+import contextvars
+import time
+from typing import Any, Callable, Optional
+
+from .executors import ModelExecutor, ServiceSaturated
+
+
+# Upper bounds for the queue depth histogram (last bucket is open-ended)
+QUEUE_DEPTH_BUCKETS = [0, 1, 2, 4, 8, 16, 32, 64, 128, 256]
+
+
+class BatchStats:
+    """
+    Counters and histograms describing how requests were coalesced.
+    Used to tune max batch size / max wait without hurting tail latency.
+    """
+
+    def __init__(self, max_batch_size: int):
+        self.max_batch_size = max_batch_size
+        self.requests = 0
+        self.batches = 0
+        self.errors = 0
+        self.rejected = 0
+        self.max_queue_depth = 0
+        # Exact histogram: batch size -> number of batches dispatched with that size
+        self.batch_size_histogram = {size: 0 for size in range(1, max_batch_size + 1)}
+        # Queue depth observed when a request is enqueued, bucketed by upper bound
+        self.queue_depth_histogram = {bound: 0 for bound in QUEUE_DEPTH_BUCKETS}
+        self.queue_depth_overflow = 0
+        self.total_wait_ms = 0.0
+        self.total_batch_ms = 0.0
+
+    def record_enqueue(self, depth: int):
+        self.requests += 1
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+        for bound in QUEUE_DEPTH_BUCKETS:
+            if depth <= bound:
+                self.queue_depth_histogram[bound] += 1
+                return
+        self.queue_depth_overflow += 1
+
+    def record_batch(self, size: int, wait_ms: float, batch_ms: float, failed: bool):
+        self.batches += 1
+        self.batch_size_histogram[size] = self.batch_size_histogram.get(size, 0) + 1
+        self.total_wait_ms += wait_ms
+        self.total_batch_ms += batch_ms
+        if failed:
+            self.errors += 1
+
+    def to_dict(self, queue_depth: int) -> dict:
+        depth_histogram = {f"<={bound}": count for bound, count in self.queue_depth_histogram.items()}
+        depth_histogram[f">{QUEUE_DEPTH_BUCKETS[-1]}"] = self.queue_depth_overflow
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "queue_depth": queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "mean_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+            "mean_wait_ms": round(self.total_wait_ms / self.batches, 3) if self.batches else 0.0,
+            "mean_batch_ms": round(self.total_batch_ms / self.batches, 3) if self.batches else 0.0,
+            "batch_size_histogram": self.batch_size_histogram,
+            "queue_depth_histogram": depth_histogram,
+        }
+
+
+class MicroBatcher:
+    """
+    Request-coalescing scheduler.
+
+    Requests are put on a queue; a single worker pulls up to `max_batch_size`
+    of them, waiting at most `max_wait_ms` after the first one arrives, and
+    runs them through `batch_fn` in one call. Each caller gets its own result.
+
+    The queue and worker belong to the event loop that first submits; a later
+    loop (a restarted app, another test client) gets a fresh pair.
+    """
+
+    def __init__(self,
+                 batch_fn: Callable[[list[Any]], list[Any]],
+                 max_batch_size: int = 16,
+                 max_wait_ms: float = 5.0,
+                 executor: Optional[ModelExecutor] = None,
+                 max_queue: Optional[int] = None,
+                 name: str = "batcher"):
+        """
+        Initialize the batcher.
+
+        Args:
+            batch_fn: Synchronous function mapping a list of inputs to a list of outputs
+            max_batch_size: Maximum number of requests per forward pass (N)
+            max_wait_ms: Maximum time to wait for a batch to fill up (T)
+            executor: Inference pool that runs `batch_fn`, with its admission control
+                      (None uses the loop default)
+            max_queue: Maximum number of waiting requests (None for unbounded)
+            name: Name used in logs and stats
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self.executor = executor
+        self.max_queue = max_queue
+        self.name = name
+        self.stats = BatchStats(max_batch_size)
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _ensure_worker(self):
+        """Start the worker lazily inside the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Queues and tasks cannot be shared between loops; the old loop keeps its own
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = None
+        if self._worker is None or self._worker.done():
+            # A fresh context: the worker serves many requests, not the one that started it
+            self._worker = loop.create_task(self._run(), context=contextvars.Context())
+
+    async def close(self):
+        """Stop the worker and fail requests still waiting; a later submit starts afresh."""
+        worker, queue = self._worker, self._queue
+        self._worker = self._queue = self._loop = None
+        if worker is not None and not worker.done():
+            worker.cancel()
+            try:
+                await worker
+            except asyncio.CancelledError:
+                pass
+        while queue is not None and not queue.empty():
+            _, future, _ = queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError(f"{self.name}: batcher closed"))
+
+    async def submit(self, item: Any) -> Any:
+        """
+        Queue a single input and wait for its result.
+
+        Args:
+            item: One input for `batch_fn`
+
+        Returns:
+            The output produced for this input
+
+        Raises:
+            ServiceSaturated: If `max_queue` requests are already waiting
+        """
+        self._ensure_worker()
+        if self.max_queue is not None and self._queue.qsize() >= self.max_queue:
+            self.stats.rejected += 1
+            raise ServiceSaturated(self.name)
+        future = asyncio.get_running_loop().create_future()
+        self.stats.record_enqueue(self._queue.qsize())
+        self._queue.put_nowait((item, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self) -> list[tuple]:
+        """Wait for the first request, then fill the batch until N items or T ms."""
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait_ms / 1000
+
+        while len(batch) < self.max_batch_size:
+            # Take whatever is already queued without yielding
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _call(self, items: list[Any]) -> list[Any]:
+        if self.executor is None:
+            return await asyncio.get_running_loop().run_in_executor(None, self.batch_fn, items)
+        return await self.executor.run(self.batch_fn, items)
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # Skip requests whose callers already went away
+            batch = [entry for entry in batch if not entry[1].done()]
+            if not batch:
+                continue
+
+            items = [item for item, _, _ in batch]
+            started = time.perf_counter()
+            wait_ms = (started - min(enqueued for _, _, enqueued in batch)) * 1000
+            failed = False
+
+            try:
+                results = await self._call(items)
+                if len(results) != len(items):
+                    raise RuntimeError(
+                        f"{self.name}: batch function returned {len(results)} results for {len(items)} inputs"
+                    )
+                for (_, future, _), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+            except asyncio.CancelledError:
+                # Closed mid-batch: these callers would otherwise wait forever
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(RuntimeError(f"{self.name}: batcher closed"))
+                raise
+            except ServiceSaturated as e:
+                # The pool is full: retrying one by one would only be rejected again
+                failed = True
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            except Exception as e:
+                failed = True
+                if len(batch) == 1:
+                    if not batch[0][1].done():
+                        batch[0][1].set_exception(e)
+                else:
+                    # One bad input must not fail its neighbours: retry individually
+                    await self._run_individually(batch)
+
+            batch_ms = (time.perf_counter() - started) * 1000
+            self.stats.record_batch(len(batch), wait_ms, batch_ms, failed)
+
+    async def _run_individually(self, batch: list[tuple]):
+        for item, future, _ in batch:
+            if future.done():
+                continue
+            try:
+                result = await self._call([item])
+                if not future.done():
+                    future.set_result(result[0])
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+
+    def get_stats(self) -> dict:
+        """Return counters and histograms for this batcher."""
+        return {
+            "name": self.name,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "max_queue": self.max_queue,
+            **self.stats.to_dict(self.queue_depth),
+        }
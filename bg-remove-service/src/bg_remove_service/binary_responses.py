@@ -0,0 +1,108 @@
+"""
+Binary Response Formats
+Content negotiation for the image and embedding endpoints, so callers can skip
+base64 PNGs inside JSON and JSON float lists.
+
+- cut-outs: `Accept: multipart/mixed` returns one raw image part per image
+  (failed images become application/json parts carrying the error)
+- embeddings: `Accept: application/octet-stream` returns packed little-endian
+  float32, one row per image, with the shape in response headers
+"""
+
+import json
+import os
+import uuid
+from typing import Any, AsyncIterator, Optional, Sequence, Union
+
+import numpy as np
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+
+MULTIPART_MEDIA_TYPE = "multipart/mixed"
+FLOAT32_MEDIA_TYPE = "application/octet-stream"
+
+# Headers describing a packed float32 body
+DIMENSIONS_HEADER = "X-Embedding-Dimensions"
+COUNT_HEADER = "X-Embedding-Count"
+FAILED_HEADER = "X-Failed-Indices"
+
+
+def accepts(request: Request, media_type: str) -> bool:
+    """True when the Accept header lists the media type."""
+    return media_type in request.headers.get("accept", "")
+
+
+def _header_value(value: Optional[str]) -> str:
+    """Make a filename safe to put inside a quoted header parameter."""
+    return (value or "").replace("\\", "_").replace('"', "_").replace("\r", "").replace("\n", "")
+
+
+def _part(boundary: str, item: dict[str, Any]) -> bytes:
+    """
+    One multipart/mixed part for a cut-out result dict.
+
+    Successful items carry their encoded image in 'data' (of type 'media_type');
+    anything else is sent as JSON.
+    """
+    index, filename = item["index"], _header_value(item.get("filename"))
+    if item.get("success"):
+        content_type, body = item.get("media_type", "image/png"), item["data"]
+        stem = os.path.splitext(filename or "image")[0]
+        filename = f"nobg_{stem}.{content_type.split('/')[-1]}"
+    else:
+        content_type, body = "application/json", json.dumps(item).encode()
+
+    headers = (
+        f"--{boundary}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f'Content-Disposition: attachment; name="{index}"; filename="{filename}"\r\n'
+        f"X-Item-Index: {index}\r\n"
+        f"\r\n"
+    )
+    return headers.encode() + body + b"\r\n"
+
+
+def multipart_response(items: AsyncIterator[dict[str, Any]]) -> StreamingResponse:
+    """
+    Stream cut-out results as a multipart/mixed body, one part per item.
+    Parts are written as soon as each item is yielded.
+    """
+    boundary = uuid.uuid4().hex
+
+    async def parts():
+        async for item in items:
+            yield _part(boundary, item)
+        yield f"--{boundary}--\r\n".encode()
+
+    return StreamingResponse(
+        parts(),
+        media_type=f'{MULTIPART_MEDIA_TYPE}; boundary="{boundary}"',
+        headers={"X-Accel-Buffering": "no"},
+    )
+
+
+def float32_response(embeddings: Sequence[Optional[Union[list[float], np.ndarray]]]) -> Response:
+    """
+    Pack embeddings into an (N, D) little-endian float32 body.
+
+    Rows for failed items (None) are zero-filled and listed in X-Failed-Indices,
+    so row i always belongs to input i.
+    """
+    failed = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    dimensions = next((len(e) for e in embeddings if e is not None), 0)
+
+    matrix = np.zeros((len(embeddings), dimensions), dtype="<f4")
+    for i, embedding in enumerate(embeddings):
+        if embedding is not None:
+            matrix[i] = embedding
+
+    return Response(
+        content=matrix.tobytes(),
+        media_type=FLOAT32_MEDIA_TYPE,
+        headers={
+            DIMENSIONS_HEADER: str(dimensions),
+            COUNT_HEADER: str(len(embeddings)),
+            FAILED_HEADER: ",".join(map(str, failed)),
+        },
+    )
@@ -0,0 +1,704 @@
+"""
+Embedding Index
+Persistent, memory-mapped store of item embeddings keyed by item id, so
+compatibility queries only need to send the target instead of every candidate.
+
+On disk (EMBEDDING_INDEX_DIR):
+- vectors.f32: float32 matrix (capacity x dimensions), memory-mapped
+- meta.sqlite: item id -> row, owner and category; the source of truth for which
+  rows are taken, so processes sharing the directory never write the same row
+- ivf_centroids.npy: coarse centroids of the optional IVF index
+- pq_codebooks.npy: codebooks of the optional product quantizer
+"""
+
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+import numpy as np
+
+from .ann_index import IVFIndex
+from .ann_index import normalize_rows
+from .embedding_service import (
+    EmbeddingLike,
+    ProductQuantizer,
+    decode_embedding,
+    quantize_float16,
+    quantize_int8,
+    similarity_to_score,
+    top_k_indices,
+)
+from .env_settings import env_int
+from .tracing import stage
+from .type_space import TypeSpace
+
+
+STORAGE_MODES = ("float32", "float16", "int8", "pq")
+
+# Default shortlist size (x top_k) rescored exactly; PQ estimates are coarser
+DEFAULT_RESCORE_FACTORS = {"float32": 1, "float16": 4, "int8": 4, "pq": 20}
+
+# Product quantization needs enough vectors to fill 256 centroids per subspace
+PQ_MIN_TRAIN_ITEMS = 4096
+
+
+class EmbeddingIndex:
+    """
+    Embedding store with upsert/delete, metadata filters and exact top-k search.
+
+    Vectors live in a memory-mapped file, so startup only maps the file and
+    reads the small metadata table; pages are loaded lazily by the OS.
+
+    Once the index holds `ann_min_items` items an IVF index is trained, and
+    queries may ask for approximate search instead of the exact scan.
+
+    With a compressed `storage` mode (float16, int8 or pq) only compact codes
+    are scanned in memory; a shortlist of `rescore_factor * top_k` rows is then
+    rescored exactly from the float32 file, so full vectors need not stay resident.
+
+    With a TypeSpace attached, the per-condition norms |m_c * x| of every item
+    are cached, so a query for a category pair is one exact matmul in that
+    pair's subspace.
+    """
+
+    def __init__(self,
+                 path: str,
+                 dimensions: int = 64,
+                 initial_capacity: int = 1024,
+                 ann_nlist: int = 256,
+                 ann_nprobe: int = 8,
+                 ann_min_items: int = 20_000,
+                 storage: str = "float32",
+                 rescore_factor: Optional[int] = None,
+                 pq_subspaces: int = 16):
+        """
+        Open (or create) an index directory.
+
+        Args:
+            path: Directory holding the index files
+            dimensions: Embedding dimensions
+            initial_capacity: Rows to allocate when creating a new index
+            ann_nlist: Number of IVF clusters
+            ann_nprobe: Default IVF lists scanned per approximate query
+            ann_min_items: Train the IVF index automatically at this size (0 disables)
+            storage: In-memory representation scanned by queries
+                ('float32', 'float16', 'int8' or 'pq')
+            rescore_factor: Shortlist size (x top_k) rescored exactly in compressed modes
+                (None picks a per-mode default)
+            pq_subspaces: Bytes per vector in 'pq' mode
+        """
+        if storage not in STORAGE_MODES:
+            raise ValueError(f"Unknown storage mode '{storage}', expected one of {STORAGE_MODES}")
+        self.path = path
+        self.dimensions = dimensions
+        self.ann_nlist = ann_nlist
+        self.ann_nprobe = ann_nprobe
+        self.ann_min_items = ann_min_items
+        self._ivf: Optional[IVFIndex] = None
+        self._centroids_path = os.path.join(path, "ivf_centroids.npy")
+
+        self.storage = storage
+        self.rescore_factor = max(1, rescore_factor or DEFAULT_RESCORE_FACTORS[storage])
+        self._codes: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._pq: Optional[ProductQuantizer] = None
+        self._pq_path = os.path.join(path, "pq_codebooks.npy")
+        if storage == "pq":
+            self._pq = ProductQuantizer(dimensions, pq_subspaces)
+            if os.path.exists(self._pq_path):
+                self._pq.codebooks = np.load(self._pq_path)
+        self.type_space: Optional[TypeSpace] = None
+        self._type_norms: Optional[np.ndarray] = None
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._db = sqlite3.connect(os.path.join(path, "meta.sqlite"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            " id TEXT PRIMARY KEY,"
+            " row INTEGER NOT NULL UNIQUE,"
+            " owner_id TEXT,"
+            " category TEXT)"
+        )
+        self._db.commit()
+
+        if os.path.exists(self._vectors_path):
+            capacity = os.path.getsize(self._vectors_path) // (4 * dimensions)
+        else:
+            capacity = max(1, initial_capacity)
+        self._open_vectors(capacity)
+        self._load_metadata()
+        if os.path.exists(self._centroids_path):
+            self._load_ann(np.load(self._centroids_path))
+        self._build_codes()
+        self._synced_version = self._data_version()
+        self._synced_files = self._file_stamps()
+
+    def _open_vectors(self, capacity: int):
+        """Map the vectors file, growing it to `capacity` rows if needed."""
+        size = capacity * self.dimensions * 4
+        mode = "r+b" if os.path.exists(self._vectors_path) else "w+b"
+        with open(self._vectors_path, mode) as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() < size:
+                f.truncate(size)
+        self._vectors = np.memmap(
+            self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dimensions)
+        )
+        self.capacity = capacity
+
+    def _load_metadata(self):
+        """Rebuild the in-memory id/row maps, filter codes and norms."""
+        self._ids: list[Optional[str]] = [None] * self.capacity
+        self._row_of: dict[str, int] = {}
+        self._alive = np.zeros(self.capacity, dtype=bool)
+        self._owner_codes = np.full(self.capacity, -1, dtype=np.int32)
+        self._category_codes = np.full(self.capacity, -1, dtype=np.int32)
+        self._norms = np.zeros(self.capacity, dtype=np.float32)
+        self._owner_vocab: dict[str, int] = {}
+        self._category_vocab: dict[str, int] = {}
+        self._owner_names: list[str] = []
+        self._category_names: list[str] = []
+
+        for item_id, row, owner_id, category in self._db.execute(
+            "SELECT id, row, owner_id, category FROM items"
+        ):
+            self._set_row_metadata(row, item_id, owner_id, category)
+
+        rows = np.flatnonzero(self._alive)
+        if rows.size:
+            self._norms[rows] = np.linalg.norm(self._vectors[rows], axis=1)
+        self._free_rows = sorted(set(range(self.capacity)) - set(rows.tolist()), reverse=True)
+
+    @staticmethod
+    def _code(vocab: dict[str, int], names: list[str], value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        if value not in vocab:
+            vocab[value] = len(names)
+            names.append(value)
+        return vocab[value]
+
+    def _set_row_metadata(self, row: int, item_id: str, owner_id: Optional[str], category: Optional[str]):
+        self._ids[row] = item_id
+        self._row_of[item_id] = row
+        self._alive[row] = True
+        self._owner_codes[row] = self._code(self._owner_vocab, self._owner_names, owner_id)
+        self._category_codes[row] = self._code(self._category_vocab, self._category_names, category)
+
+    def _grow(self, min_capacity: int):
+        """Double the capacity until it fits `min_capacity` rows."""
+        old_capacity = self.capacity
+        new_capacity = old_capacity
+        while new_capacity < min_capacity:
+            new_capacity *= 2
+
+        self._vectors.flush()
+        del self._vectors
+        self._open_vectors(new_capacity)
+
+        extra = new_capacity - old_capacity
+        self._ids.extend([None] * extra)
+        self._alive = np.concatenate([self._alive, np.zeros(extra, dtype=bool)])
+        self._owner_codes = np.concatenate([self._owner_codes, np.full(extra, -1, dtype=np.int32)])
+        self._category_codes = np.concatenate([self._category_codes, np.full(extra, -1, dtype=np.int32)])
+        self._norms = np.concatenate([self._norms, np.zeros(extra, dtype=np.float32)])
+        if self._type_norms is not None:
+            self._type_norms = np.concatenate(
+                [self._type_norms, np.zeros((extra, self._type_norms.shape[1]), dtype=np.float32)]
+            )
+        if self._codes is not None:
+            self._codes = np.concatenate(
+                [self._codes, np.zeros((extra, self._codes.shape[1]), dtype=self._codes.dtype)]
+            )
+        if self._scales is not None:
+            self._scales = np.concatenate([self._scales, np.ones(extra, dtype=np.float32)])
+        self._free_rows = list(range(new_capacity - 1, old_capacity - 1, -1)) + self._free_rows
+
+    def __len__(self) -> int:
+        return len(self._row_of)
+
+    # ---- rows shared with other processes ----
+
+    def _data_version(self) -> int:
+        """Changes whenever another connection commits; this connection's own commits leave it as is."""
+        return self._db.execute("PRAGMA data_version").fetchone()[0]
+
+    def _file_stamps(self) -> tuple:
+        return tuple(
+            os.stat(path).st_mtime_ns if os.path.exists(path) else None
+            for path in (self._centroids_path, self._pq_path)
+        )
+
+    def _sync(self):
+        """
+        Reload what another process (e.g. a serve worker) changed since this one last looked.
+        Costs one pragma and two stats when nothing changed; after a foreign commit the
+        metadata is re-read and every derived array rebuilt, which is O(items).
+        """
+        version = self._data_version()
+        files = self._file_stamps()
+        if version == self._synced_version and files == self._synced_files:
+            return
+
+        if version != self._synced_version:
+            file_capacity = os.path.getsize(self._vectors_path) // (4 * self.dimensions)
+            if file_capacity > self.capacity:
+                self._vectors.flush()
+                del self._vectors
+                self._open_vectors(file_capacity)
+            self._load_metadata()
+            self._build_type_norms()
+        if self._pq is not None and os.path.exists(self._pq_path):
+            self._pq.codebooks = np.load(self._pq_path)
+        self._build_codes()
+        if os.path.exists(self._centroids_path):
+            self._load_ann(np.load(self._centroids_path))
+        self._synced_version = version
+        self._synced_files = files
+
+    def _begin_write(self):
+        """
+        Start a write transaction, which holds sqlite's lock until commit.
+        Another process (e.g. a serve worker) may have grown the vectors file meanwhile.
+        """
+        self._db.execute("BEGIN IMMEDIATE")
+        self._sync()
+        file_capacity = os.path.getsize(self._vectors_path) // (4 * self.dimensions)
+        if file_capacity > self.capacity:
+            self._grow(file_capacity)
+
+    def _db_row(self, item_id: str) -> Optional[int]:
+        found = self._db.execute("SELECT row FROM items WHERE id = ?", (item_id,)).fetchone()
+        return None if found is None else found[0]
+
+    def _reload_row(self, row: int):
+        """Bring one row's in-memory state in line with sqlite, after another process changed it."""
+        old_id = self._ids[row]
+        if old_id is not None and self._row_of.get(old_id) == row:
+            del self._row_of[old_id]
+        found = self._db.execute("SELECT id, owner_id, category FROM items WHERE row = ?", (row,)).fetchone()
+        if found is None:
+            if self._alive[row]:
+                self._free_rows.append(row)
+            self._ids[row] = None
+            self._alive[row] = False
+            self._norms[row] = 0.0
+            if self._type_norms is not None:
+                self._type_norms[row] = 0.0
+            if self._ivf is not None:
+                self._ivf.remove(row)
+            return
+
+        item_id, owner_id, category = found
+        stale_row = self._row_of.get(item_id)
+        self._set_row_metadata(row, item_id, owner_id, category)
+        if stale_row is not None and stale_row != row:
+            self._reload_row(stale_row)
+        vector = np.array(self._vectors[row])
+        self._norms[row] = np.linalg.norm(vector)
+        if self._type_norms is not None:
+            self._type_norms[row] = self.type_space.masked_norms(vector)[0]
+        rows = np.array([row], dtype=np.int64)
+        if self._codes is not None:
+            self._encode_rows(rows)
+        if self._ivf is not None:
+            self._ivf.add(rows, vector[None, :])
+
+    def _allocate_row(self) -> int:
+        """A row no item holds in sqlite, growing the file when none is left."""
+        while True:
+            if not self._free_rows:
+                self._grow(self.capacity + 1)
+            row = self._free_rows.pop()
+            if self._db.execute("SELECT 1 FROM items WHERE row = ?", (row,)).fetchone() is None:
+                return row
+            # Taken by another process since this one last looked
+            self._reload_row(row)
+
+    # ---- compressed codes ----
+
+    def _build_codes(self):
+        """Encode every live row in the configured storage mode."""
+        if self.storage == "float32" or (self._pq is not None and not self._pq.is_trained):
+            self._codes = None
+            self._scales = None
+            return
+
+        if self.storage == "float16":
+            self._codes = np.zeros((self.capacity, self.dimensions), dtype=np.float16)
+        elif self.storage == "int8":
+            self._codes = np.zeros((self.capacity, self.dimensions), dtype=np.int8)
+            self._scales = np.ones(self.capacity, dtype=np.float32)
+        else:
+            self._codes = np.zeros((self.capacity, self._pq.subspaces), dtype=np.uint8)
+
+        rows = np.flatnonzero(self._alive)
+        if rows.size:
+            self._encode_rows(rows)
+
+    def _encode_rows(self, rows: np.ndarray):
+        vectors = np.asarray(self._vectors[rows])
+        if self.storage == "float16":
+            self._codes[rows] = quantize_float16(vectors)
+        elif self.storage == "int8":
+            self._codes[rows], self._scales[rows] = quantize_int8(vectors)
+        else:
+            self._codes[rows] = self._pq.encode(normalize_rows(vectors))
+
+    # ---- type-specific spaces ----
+
+    def set_type_space(self, type_space: Optional[TypeSpace]):
+        """Attach the checkpoint's type masks and cache every item's per-condition norms."""
+        with self._lock:
+            if type_space is self.type_space:
+                return
+            self.type_space = type_space
+            self._build_type_norms()
+
+    def _build_type_norms(self):
+        if self.type_space is None:
+            self._type_norms = None
+            return
+        self._type_norms = np.zeros((self.capacity, self.type_space.n_conditions), dtype=np.float32)
+        rows = np.flatnonzero(self._alive)
+        if rows.size:
+            self._type_norms[rows] = self.type_space.masked_norms(self._vectors[rows])
+
+    def _type_similarities(self, rows: np.ndarray, target: np.ndarray, target_category: str) -> np.ndarray:
+        """
+        Similarities in the subspace of (target_category, row category).
+        Rows are grouped by category; rows without a known pair use the general space.
+        """
+        sims = np.empty(rows.size, dtype=np.float32)
+        codes = self._category_codes[rows]
+        for code in np.unique(codes).tolist():
+            group = np.flatnonzero(codes == code)
+            category = self._category_names[code] if code >= 0 else None
+            condition = self.type_space.condition(target_category, category)
+            group_rows = rows[group]
+            if condition is None:
+                norms = self._norms[group_rows]
+                target_norm = np.linalg.norm(target)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    group_sims = (self._vectors[group_rows] @ target) / (norms * target_norm)
+                group_sims[norms == 0] = 0.0
+            else:
+                group_sims = self.type_space.similarities(
+                    target, self._vectors[group_rows], condition, self._type_norms[group_rows, condition]
+                )
+            sims[group] = group_sims
+        return sims
+
+    def train_quantizer(self):
+        """Train the product quantizer on the current items and persist it."""
+        with self._lock:
+            rows = np.flatnonzero(self._alive)
+            if self._pq is None or rows.size == 0:
+                return
+            self._pq.train(normalize_rows(self._vectors[rows]))
+            np.save(self._pq_path, self._pq.codebooks)
+            self._synced_files = self._file_stamps()
+            self._build_codes()
+
+    def _approximate_scores(self, rows: np.ndarray, target: np.ndarray, target_norm: float) -> np.ndarray:
+        """Cosine estimates computed from the compact codes only."""
+        if self.storage == "pq":
+            table = self._pq.inner_product_table(target / target_norm)
+            return self._pq.scores(self._codes[rows], table)
+
+        dots = self._codes[rows].astype(np.float32) @ target
+        if self.storage == "int8":
+            dots *= self._scales[rows]
+        norms = self._norms[rows]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sims = dots / (norms * target_norm)
+        sims[norms == 0] = 0.0
+        return sims
+
+    def memory_bytes(self) -> int:
+        """Bytes of the in-memory representation scanned by exact queries."""
+        if self._codes is None:
+            return len(self) * self.dimensions * 4
+        per_row = self._codes.shape[1] * self._codes.itemsize
+        if self._scales is not None:
+            per_row += self._scales.itemsize
+        return len(self) * per_row
+
+    def _load_ann(self, centroids: np.ndarray):
+        """Assign every live row to the given centroids (one matmul, no training)."""
+        ivf = IVFIndex(self.dimensions, nlist=centroids.shape[0], nprobe=self.ann_nprobe)
+        ivf.set_centroids(centroids)
+        rows = np.flatnonzero(self._alive)
+        if rows.size:
+            ivf.add(rows, self._vectors[rows])
+        self._ivf = ivf
+
+    def build_ann(self) -> dict:
+        """(Re)train the IVF index on the current items and persist its centroids."""
+        with self._lock:
+            rows = np.flatnonzero(self._alive)
+            if rows.size == 0:
+                raise ValueError("Cannot build an ANN index over an empty index")
+            ivf = IVFIndex(self.dimensions, nlist=self.ann_nlist, nprobe=self.ann_nprobe)
+            ivf.train(self._vectors[rows])
+            np.save(self._centroids_path, ivf.centroids)
+            self._synced_files = self._file_stamps()
+            self._load_ann(ivf.centroids)
+            return self._ivf.get_stats()
+
+    def upsert(self, items: list[dict]) -> int:
+        """
+        Insert or replace items.
+
+        Args:
+            items: Dicts with 'id', 'embedding' and optional 'owner_id' / 'category'
+
+        Returns:
+            Number of items written
+        """
+        # Validate everything before touching the index
+        vectors = []
+        for item in items:
+            vector = decode_embedding(item["embedding"])
+            if vector.shape[0] != self.dimensions:
+                raise ValueError(
+                    f"Item {item['id']}: expected {self.dimensions} dimensions, got {vector.shape[0]}"
+                )
+            vectors.append(vector)
+
+        with self._lock:
+            self._begin_write()
+            try:
+                new_ids = {str(item["id"]) for item in items} - self._row_of.keys()
+                if len(new_ids) > len(self._free_rows):
+                    self._grow(len(self) + len(new_ids))
+                records = self._write_items(items, vectors)
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+
+            rows = np.array([row for _, row, _, _ in records], dtype=np.int64)
+            if self._codes is not None:
+                self._encode_rows(rows)
+            elif self._pq is not None and len(self) >= PQ_MIN_TRAIN_ITEMS:
+                self.train_quantizer()
+
+            if self._ivf is not None:
+                self._ivf.add(rows, self._vectors[rows])
+            elif self.ann_min_items and len(self) >= self.ann_min_items:
+                self.build_ann()
+            return len(records)
+
+    def _write_items(self, items: list[dict], vectors: list[np.ndarray]) -> list[tuple]:
+        """Write vectors and metadata inside the open transaction; returns the sqlite records."""
+        records = []
+        for item, vector in zip(items, vectors):
+            item_id = str(item["id"])
+            row = self._db_row(item_id)
+            if row != self._row_of.get(item_id):
+                # Another process inserted, moved or deleted this item
+                if item_id in self._row_of:
+                    self._reload_row(self._row_of[item_id])
+                if row is not None:
+                    self._reload_row(row)
+            if row is None:
+                row = self._allocate_row()
+            owner_id = item.get("owner_id")
+            category = item.get("category")
+
+            self._vectors[row] = vector
+            self._norms[row] = np.linalg.norm(vector)
+            if self._type_norms is not None:
+                self._type_norms[row] = self.type_space.masked_norms(vector)[0]
+            self._set_row_metadata(row, item_id, owner_id, category)
+            records.append((item_id, row, owner_id, category))
+
+        self._vectors.flush()
+        self._db.executemany(
+            "INSERT OR REPLACE INTO items (id, row, owner_id, category) VALUES (?, ?, ?, ?)",
+            records
+        )
+        return records
+
+    def delete(self, ids: list[str]) -> int:
+        """Remove items by id; returns how many existed."""
+        with self._lock:
+            self._begin_write()
+            try:
+                removed = 0
+                for item_id in map(str, ids):
+                    row = self._db_row(item_id)
+                    if row is not None:
+                        self._db.execute("DELETE FROM items WHERE id = ?", (item_id,))
+                        removed += 1
+                    # Also clears what this process still held for an item deleted elsewhere
+                    for stale_row in {row, self._row_of.get(item_id)} - {None}:
+                        self._reload_row(stale_row)
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+            return removed
+
+    def get(self, item_id: str) -> Optional[np.ndarray]:
+        """Return a copy of an item's embedding, or None if unknown."""
+        with self._lock:
+            self._sync()
+            row = self._row_of.get(str(item_id))
+            return None if row is None else np.array(self._vectors[row])
+
+    def candidate_rows(self,
+                       owner_id: Optional[str] = None,
+                       category: Optional[str] = None,
+                       exclude_ids: Optional[list[str]] = None) -> np.ndarray:
+        """Rows of live items matching the metadata filters."""
+        mask = self._alive.copy()
+        if owner_id is not None:
+            mask &= self._owner_codes == self._owner_vocab.get(owner_id, -2)
+        if category is not None:
+            mask &= self._category_codes == self._category_vocab.get(category, -2)
+        for item_id in exclude_ids or []:
+            row = self._row_of.get(str(item_id))
+            if row is not None:
+                mask[row] = False
+        return np.flatnonzero(mask)
+
+    @stage("search")
+    def query(self,
+              target_embedding: Optional[EmbeddingLike] = None,
+              target_id: Optional[str] = None,
+              top_k: int = 5,
+              owner_id: Optional[str] = None,
+              category: Optional[str] = None,
+              exclude_ids: Optional[list[str]] = None,
+              approximate: bool = False,
+              nprobe: Optional[int] = None,
+              target_category: Optional[str] = None) -> list[dict]:
+        """
+        Find the most compatible indexed items.
+
+        Args:
+            target_embedding: Embedding to match against
+            target_id: Id of an indexed item to use as the target instead
+                (the item itself is excluded from results)
+            top_k: Number of results to return
+            owner_id: Only consider items from this owner
+            category: Only consider items in this category
+            exclude_ids: Item ids to leave out
+            approximate: Use the IVF index when it is built (exact scan otherwise)
+            nprobe: IVF lists to scan (higher = better recall, slower)
+            target_category: Category of the target (defaults to the stored category
+                of `target_id`); with a TypeSpace attached, each
+                candidate is scored in the subspace of its category pair (always an
+                exact scan, the IVF and compact codes index the general space)
+
+        Returns:
+            List of dicts with 'id', 'similarity', 'compatibility_score', 'owner_id', 'category'
+        """
+        with self._lock:
+            # Items written through another worker since the last query
+            self._sync()
+            exclude_ids = list(exclude_ids or [])
+            if target_id is not None:
+                target = self.get(target_id)
+                if target is None:
+                    raise KeyError(f"Unknown item id: {target_id}")
+                exclude_ids.append(str(target_id))
+                if target_category is None:
+                    category_code = int(self._category_codes[self._row_of[str(target_id)]])
+                    target_category = self._category_names[category_code] if category_code >= 0 else None
+            elif target_embedding is not None:
+                target = decode_embedding(target_embedding)
+            else:
+                raise ValueError("Either target_embedding or target_id is required")
+
+            rows = self.candidate_rows(owner_id, category, exclude_ids)
+            target_norm = np.linalg.norm(target)
+            if rows.size == 0 or target_norm == 0:
+                return []
+
+            if target_category and self.type_space is not None:
+                sims = self._type_similarities(rows, target, target_category)
+                return [self._result(rows[idx], float(sims[idx])) for idx in top_k_indices(sims, top_k)]
+
+            if approximate and self._ivf is not None:
+                # Only candidates in the probed lists, scored below like an exact scan
+                rows = np.intersect1d(rows, self._ivf.probe(target, nprobe))
+                if rows.size == 0:
+                    return []
+
+            if self._codes is not None:
+                # Scan the compact codes, then rescore a shortlist exactly
+                shortlist = top_k * self.rescore_factor
+                if shortlist < rows.size:
+                    approx = self._approximate_scores(rows, target, target_norm)
+                    rows = np.sort(rows[top_k_indices(approx, shortlist)])
+
+            norms = self._norms[rows]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                sims = (self._vectors[rows] @ target) / (norms * target_norm)
+            sims[norms == 0] = 0.0
+
+            return [self._result(rows[idx], float(sims[idx])) for idx in top_k_indices(sims, top_k)]
+
+    def _result(self, row: int, similarity: float) -> dict:
+        owner_code = int(self._owner_codes[row])
+        category_code = int(self._category_codes[row])
+        return {
+            "id": self._ids[row],
+            "similarity": round(similarity, 4),
+            "compatibility_score": similarity_to_score(similarity),
+            "owner_id": self._owner_names[owner_code] if owner_code >= 0 else None,
+            "category": self._category_names[category_code] if category_code >= 0 else None,
+        }
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            self._sync()
+            return {
+                "path": self.path,
+                "dimensions": self.dimensions,
+                "items": len(self),
+                "capacity": self.capacity,
+                "owners": len(self._owner_vocab),
+                "categories": len(self._category_vocab),
+                "ann": self._ivf.get_stats() if self._ivf is not None else None,
+                "storage": self.storage,
+                "storage_active": self._codes is not None,
+                "memory_bytes": self.memory_bytes(),
+                "type_conditions": self.type_space.n_conditions if self.type_space is not None else None,
+            }
+
+    def close(self):
+        with self._lock:
+            self._vectors.flush()
+            self._db.close()
+
+
+# Singleton instance for the service
+_embedding_index: Optional[EmbeddingIndex] = None
+
+
+def get_embedding_index() -> EmbeddingIndex:
+    """Get or open the singleton embedding index."""
+    global _embedding_index
+
+    if _embedding_index is None:
+        _embedding_index = EmbeddingIndex(
+            path=os.getenv("EMBEDDING_INDEX_DIR", "data/embedding_index"),
+            dimensions=env_int("EMBEDDING_DIMENSIONS", 64),
+            ann_nlist=env_int("EMBEDDING_INDEX_ANN_NLIST", 256),
+            ann_nprobe=env_int("EMBEDDING_INDEX_ANN_NPROBE", 8),
+            ann_min_items=env_int("EMBEDDING_INDEX_ANN_MIN_ITEMS", 20000),
+            storage=os.getenv("EMBEDDING_INDEX_STORAGE") or "float32",
+            # Empty or 0 picks the per-mode default
+            rescore_factor=env_int("EMBEDDING_INDEX_RESCORE_FACTOR") or None,
+            pq_subspaces=env_int("EMBEDDING_INDEX_PQ_SUBSPACES", 16),
+        )
+
+    return _embedding_index
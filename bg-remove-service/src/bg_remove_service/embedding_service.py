@@ -6,14 +6,232 @@ Based on: "Learning Type-Aware Embeddings for Fashion Compatibility" (ECCV 2018)
 
 import torch
 import torch.nn as nn
-from torchvision import transforms
 from PIL import Image
 import io
 import os
-from typing import Optional
+import base64
+import copy
+import hashlib
+from typing import Optional, Union
 import numpy as np
 
+from .image_preprocessing import EmbeddingPreprocessor
+from .model_optimization import (
+    compare_outputs,
+    is_frozen_artifact,
+    freeze_model,
+    load_frozen,
+    save_frozen,
+)
+from .quantization import calibration_images, quantization_mode, quantize_model
 from .resnet18 import resnet18
+from .tracing import stage
+from .type_space import TypeSpace, create_type_space
+
+
+# An embedding as a JSON float list or as base64 of little-endian float32 bytes
+EmbeddingLike = Union[list[float], str, np.ndarray]
+
+# Marks a file written by `FashionEmbeddingService.save_artifact`
+ARTIFACT_FORMAT = "fashion-embedding-artifact/1"
+
+
+def encode_embedding(embedding: Union[list[float], np.ndarray]) -> str:
+    """Encode an embedding as base64 of little-endian float32 bytes."""
+    return base64.b64encode(np.asarray(embedding, dtype='<f4').tobytes()).decode()
+
+
+def decode_embedding(embedding: EmbeddingLike) -> np.ndarray:
+    """
+    Decode an embedding given as a float list or a base64 float32 string.
+    
+    Returns:
+        1-D float32 array
+    """
+    if isinstance(embedding, str):
+        return np.frombuffer(base64.b64decode(embedding), dtype='<f4').astype(np.float32)
+    return np.asarray(embedding, dtype=np.float32)
+
+
+def decode_embedding_matrix(data: str, dimensions: int) -> np.ndarray:
+    """
+    Decode a packed (N x dimensions) base64 float32 matrix.
+    
+    Returns:
+        2-D float32 array
+    """
+    raw = base64.b64decode(data)
+    row_bytes = 4 * dimensions
+    if len(raw) % row_bytes:
+        raise ValueError(f"Packed matrix size {len(raw)} is not a multiple of {row_bytes} bytes")
+    return np.frombuffer(raw, dtype='<f4').astype(np.float32).reshape(-1, dimensions)
+
+
+def cosine_similarities(target: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+    """
+    Cosine similarity between one vector and every row of a matrix, in one matmul.
+    Rows (or a target) with zero norm score 0.
+    """
+    target_norm = np.linalg.norm(target)
+    if target_norm == 0 or matrix.shape[0] == 0:
+        return np.zeros(matrix.shape[0], dtype=np.float32)
+    
+    norms = np.linalg.norm(matrix, axis=1)
+    dots = matrix @ target
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sims = dots / (norms * target_norm)
+    sims[norms == 0] = 0.0
+    return sims
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """
+    Indices of the `top_k` highest scores, best first, without a full sort.
+    Equal scores keep their input order, as a stable sort of every score would.
+    """
+    n = scores.shape[0]
+    if top_k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if top_k < n:
+        # argpartition picks arbitrarily among scores tied with the k-th; take the earliest
+        kth = scores[np.argpartition(-scores, top_k - 1)[top_k - 1]]
+        above = np.flatnonzero(scores > kth)
+        tied = np.flatnonzero(scores == kth)[:top_k - above.size]
+        candidates = np.sort(np.concatenate([above, tied]))
+    else:
+        candidates = np.arange(n)
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def rank_similarities(sims: np.ndarray) -> np.ndarray:
+    """
+    Sort keys for API results: the similarity as returned (4 decimals), so items
+    shown with equal similarity stay in input order, as they always have.
+    """
+    return np.round(sims, 4)
+
+
+def similarity_to_score(similarity: float) -> float:
+    """Transform cosine similarity from [-1, 1] to a 0-100 compatibility score."""
+    return round((similarity + 1) * 50, 2)
+
+
+# ===========================================
+# COMPACT EMBEDDING STORAGE
+# ===========================================
+
+def quantize_float16(vectors: np.ndarray) -> np.ndarray:
+    """Store embeddings as float16 (2x smaller than float32)."""
+    return np.asarray(vectors, dtype=np.float16)
+
+
+def quantize_int8(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric int8 quantization with one scale per vector (~4x smaller).
+    
+    Args:
+        vectors: (N x D) embeddings
+        
+    Returns:
+        (codes, scales): int8 codes (N x D) and float32 scales (N,)
+    """
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize_int8(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    """Reconstruct float32 embeddings from int8 codes and per-vector scales."""
+    return codes.astype(np.float32) * scales[:, None]
+
+
+class ProductQuantizer:
+    """
+    Product quantizer for unit-norm embeddings.
+    
+    Splits each vector into `subspaces` chunks and replaces every chunk by the
+    index of its nearest of 256 centroids, so a 64-d float32 vector (256 bytes)
+    becomes `subspaces` bytes. Inner products with a query are computed from a
+    small lookup table without decoding the vectors.
+    """
+    
+    n_centroids = 256
+    
+    def __init__(self, dimensions: int = 64, subspaces: int = 16):
+        if dimensions % subspaces:
+            raise ValueError(f"dimensions ({dimensions}) must be divisible by subspaces ({subspaces})")
+        self.dimensions = dimensions
+        self.subspaces = subspaces
+        self.sub_dim = dimensions // subspaces
+        # (subspaces x 256 x sub_dim)
+        self.codebooks: Optional[np.ndarray] = None
+    
+    @property
+    def is_trained(self) -> bool:
+        return self.codebooks is not None
+    
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        """(N x D) -> (subspaces x N x sub_dim)"""
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        return vectors.reshape(-1, self.subspaces, self.sub_dim).transpose(1, 0, 2)
+    
+    def train(self, vectors: np.ndarray, iterations: int = 15, seed: int = 0):
+        """Learn one 256-centroid codebook per subspace with k-means."""
+        rng = np.random.default_rng(seed)
+        chunks = self._split(vectors)
+        n = chunks.shape[1]
+        k = min(self.n_centroids, n)
+        codebooks = np.zeros((self.subspaces, self.n_centroids, self.sub_dim), dtype=np.float32)
+        
+        for m in range(self.subspaces):
+            data = chunks[m]
+            centroids = data[rng.choice(n, size=k, replace=False)].copy()
+            for _ in range(iterations):
+                assignments = self._nearest(data, centroids)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignments, data)
+                counts = np.bincount(assignments, minlength=k)
+                empty = counts == 0
+                centroids = np.where(
+                    empty[:, None], data[rng.choice(n, size=k)], sums / np.maximum(counts, 1)[:, None]
+                )
+            codebooks[m, :k] = centroids
+        
+        self.codebooks = codebooks
+    
+    @staticmethod
+    def _nearest(data: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        """Index of the nearest centroid (squared L2) for each row."""
+        distances = (
+            (data ** 2).sum(axis=1, keepdims=True)
+            - 2 * data @ centroids.T
+            + (centroids ** 2).sum(axis=1)[None, :]
+        )
+        return np.argmin(distances, axis=1)
+    
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Encode (N x D) vectors as (N x subspaces) uint8 codes."""
+        chunks = self._split(vectors)
+        codes = np.empty((chunks.shape[1], self.subspaces), dtype=np.uint8)
+        for m in range(self.subspaces):
+            codes[:, m] = self._nearest(chunks[m], self.codebooks[m])
+        return codes
+    
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """Reconstruct approximate (N x D) vectors from codes."""
+        parts = [self.codebooks[m][codes[:, m]] for m in range(self.subspaces)]
+        return np.concatenate(parts, axis=1)
+    
+    def inner_product_table(self, query: np.ndarray) -> np.ndarray:
+        """(subspaces x 256) table of query-chunk . centroid products."""
+        chunks = np.asarray(query, dtype=np.float32).reshape(self.subspaces, 1, self.sub_dim)
+        return (self.codebooks * chunks).sum(axis=2)
+    
+    def scores(self, codes: np.ndarray, table: np.ndarray) -> np.ndarray:
+        """Approximate inner products between the query and every coded vector."""
+        return table[np.arange(self.subspaces), codes].sum(axis=1)
 
 
 class SimpleEmbeddingNet(nn.Module):
@@ -39,16 +257,26 @@ class FashionEmbeddingService:
     def __init__(self, 
                  model_path: Optional[str] = None,
                  embedding_size: int = 64,
-                 device: Optional[str] = None):
+                 device: Optional[str] = None,
+                 quantization: str = "none"):
         """
         Initialize the embedding service.
         
         Args:
-            model_path: Path to pre-trained model checkpoint (optional)
+            model_path: Path to a training checkpoint, an exported inference artifact
+                or a frozen TorchScript artifact (optional; without one ImageNet
+                weights are downloaded)
             embedding_size: Dimension of output embeddings (default: 64)
             device: Device to run on ('cuda', 'cpu', or None for auto-detect)
+            quantization: Int8 mode on CPU ('none', 'dynamic' or 'static')
         """
         self.embedding_size = embedding_size
+        # Identifies the weights in use; changes whenever the checkpoint changes
+        self.model_version = f"imagenet-{embedding_size}"
+        # Per-category-pair masks from the checkpoint (None = general space only)
+        self.type_space: Optional[TypeSpace] = None
+        # Frozen TorchScript artifacts are traced for channels_last inputs
+        self.memory_format = torch.contiguous_format
         
         # Auto-detect device
         if device is None:
@@ -58,38 +286,70 @@ class FashionEmbeddingService:
         
         print(f"[EmbeddingService] Using device: {self.device}")
         
-        # Initialize model
+        # ImageNet weights are only fetched when no checkpoint will overwrite them,
+        # so startup with a checkpoint or artifact works offline
+        has_checkpoint = bool(model_path) and os.path.exists(model_path)
         self.model = SimpleEmbeddingNet(
             embedding_size=embedding_size,
-            pretrained=True  # Use ImageNet pretrained weights
+            pretrained=not has_checkpoint
         )
         
         # Load checkpoint if provided
-        if model_path and os.path.exists(model_path):
-            self._load_checkpoint(model_path)
-        else:
+        if has_checkpoint and not self._load_checkpoint(model_path):
+            print("[EmbeddingService] Using ImageNet pretrained weights instead")
+            self.model = SimpleEmbeddingNet(embedding_size=embedding_size, pretrained=True)
+        elif not has_checkpoint:
             print("[EmbeddingService] Using ImageNet pretrained ResNet-18 backbone")
         
         self.model.to(self.device)
         self.model.eval()
         
-        # Image preprocessing (matching the fashion-compatibility paper)
-        self.transform = transforms.Compose([
-            transforms.Resize(112),
-            transforms.CenterCrop(112),
-            transforms.ToTensor(),
-            transforms.Normalize(
-                mean=[0.485, 0.456, 0.406],
-                std=[0.229, 0.224, 0.225]
-            )
-        ])
+        # Image preprocessing (Resize(112) + CenterCrop(112) + ImageNet normalization,
+        # matching the fashion-compatibility paper), batched
+        self.preprocess_batch = EmbeddingPreprocessor(112)
+        
+        self.quantization = "none"
+        if quantization != "none":
+            self.quantize(quantization)
+    
+    def quantize(self, mode: str):
+        """
+        Swap the model for an int8 version ('dynamic' or 'static', CPU only).
+        Static mode calibrates on QUANTIZATION_CALIBRATION_DIR.
+        """
+        if self.device.type != 'cpu' or isinstance(self.model, torch.jit.ScriptModule):
+            print(f"[EmbeddingService] Quantization '{mode}' needs an eager model on CPU, skipping")
+            return
+        
+        def calibration_batches() -> list[torch.Tensor]:
+            images = calibration_images()
+            return [self.preprocess_batch(images[i:i + 8]) for i in range(0, len(images), 8)]
+        
+        self.model = quantize_model(self.model, mode, calibration_batches)
+        self.quantization = mode
+        # Quantized embeddings differ from fp32 ones, so they must not share cache entries
+        self.model_version = f"{self.model_version}-int8-{mode}"
+        print(f"[EmbeddingService] Using int8 {mode} quantization")
     
-    def _load_checkpoint(self, model_path: str):
-        """Load model weights from checkpoint."""
+    def _load_checkpoint(self, model_path: str) -> bool:
+        """Load model weights from a checkpoint or artifact; returns False on failure."""
         try:
+            if is_frozen_artifact(model_path):
+                self.model, metadata = load_frozen(model_path, self.device)
+                self._load_metadata(metadata)
+                if metadata.get('channels_last'):
+                    self.memory_format = torch.channels_last
+                print(f"[EmbeddingService] Loaded frozen TorchScript model from: {model_path}")
+                return True
+            
             # Load with weights_only=False for compatibility with older PyTorch checkpoints
             checkpoint = torch.load(model_path, map_location=self.device, weights_only=False)
             
+            if checkpoint.get('format') == ARTIFACT_FORMAT:
+                self._load_artifact(checkpoint)
+                print(f"[EmbeddingService] Loaded inference artifact from: {model_path}")
+                return True
+            
             # Handle different checkpoint formats
             if 'state_dict' in checkpoint:
                 state_dict = checkpoint['state_dict']
@@ -98,7 +358,11 @@ class FashionEmbeddingService:
             
             # Filter only the embedding network weights
             filtered_dict = {}
+            masks = None
             for key, value in state_dict.items():
+                if key == 'masks.weight':
+                    masks = value
+                    continue
                 # Handle nested keys from full model
                 if key.startswith('embeddingnet.embeddingnet.'):
                     new_key = key.replace('embeddingnet.embeddingnet.', 'embeddingnet.')
@@ -110,14 +374,118 @@ class FashionEmbeddingService:
                     filtered_dict[f'embeddingnet.{key}'] = value
             
             if filtered_dict:
-                self.model.load_state_dict(filtered_dict, strict=False)
+                missing = self.model.load_state_dict(filtered_dict, strict=False).missing_keys
+                if missing:
+                    print(f"[EmbeddingService] Warning: {len(missing)} weights missing from checkpoint")
+                self.model_version = f"{self._file_digest(model_path)}-{self.embedding_size}"
                 print(f"[EmbeddingService] Loaded checkpoint from: {model_path}")
-            else:
-                print(f"[EmbeddingService] Warning: No compatible weights found in checkpoint")
+                if masks is not None:
+                    self.type_space = create_type_space(masks.detach().cpu().numpy())
+                    print(f"[EmbeddingService] Loaded {self.type_space.n_conditions} type-specific masks")
+                elif any(key.startswith('masks.') for key in state_dict):
+                    print("[EmbeddingService] Fully connected type projections are not supported, "
+                          "scoring in the general space")
+                return True
+            
+            print(f"[EmbeddingService] Warning: No compatible weights found in checkpoint")
+            return False
                 
         except Exception as e:
             print(f"[EmbeddingService] Failed to load checkpoint: {e}")
-            print("[EmbeddingService] Using ImageNet pretrained weights instead")
+            return False
+    
+    def _load_artifact(self, artifact: dict):
+        """Restore the exact inference state written by `save_artifact`."""
+        if artifact['embedding_size'] != self.embedding_size:
+            raise ValueError(
+                f"Artifact has {artifact['embedding_size']} dimensions, expected {self.embedding_size}"
+            )
+        self.model.load_state_dict(artifact['state_dict'])
+        self._load_metadata(artifact)
+    
+    def _load_metadata(self, metadata: dict):
+        """Restore the model version and type masks saved with an artifact."""
+        self.model_version = metadata['model_version']
+        if metadata.get('masks') is not None:
+            typespaces = {tuple(key.split('|')): index for key, index in metadata['typespaces'].items()}
+            self.type_space = TypeSpace(np.asarray(metadata['masks'], dtype=np.float32), typespaces)
+    
+    def _metadata(self) -> dict:
+        metadata = {
+            'format': ARTIFACT_FORMAT,
+            'embedding_size': self.embedding_size,
+            'model_version': self.model_version,
+            'masks': None,
+            'typespaces': None,
+        }
+        if self.type_space is not None:
+            metadata['masks'] = self.type_space.masks.tolist()
+            metadata['typespaces'] = {'|'.join(pair): index for pair, index in self.type_space.typespaces.items()}
+        return metadata
+    
+    def save_artifact(self, path: str):
+        """
+        Write the loaded weights, type masks and version to one file.
+        
+        Pointing EMBEDDING_MODEL_PATH at it starts the service without
+        downloading ImageNet weights or re-filtering the training checkpoint.
+        """
+        artifact = {
+            **self._metadata(),
+            'state_dict': {k: v.cpu() for k, v in self.model.state_dict().items()},
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        torch.save(artifact, path)
+    
+    def save_frozen_artifact(self,
+                             path: str,
+                             channels_last: bool = True,
+                             batch_size: int = 8,
+                             tolerance: float = 1e-3) -> dict:
+        """
+        Fold BatchNorm, trace, freeze and save the model as TorchScript.
+        
+        The saved file is reloaded and checked against the eager model on a
+        random batch; it is removed again if the outputs disagree.
+        
+        Args:
+            path: File to write
+            channels_last: Trace for channels_last inputs
+            batch_size: Batch size of the equivalence check
+            tolerance: Largest allowed absolute difference per embedding value
+            
+        Returns:
+            Equivalence metrics ('max_abs_diff', 'min_cosine')
+        """
+        if isinstance(self.model, torch.jit.ScriptModule):
+            raise ValueError("Model is already a frozen TorchScript graph")
+        eager = copy.deepcopy(self.model).cpu().eval()
+        example = torch.randn(batch_size, 3, 112, 112)
+        with torch.no_grad():
+            reference = eager(example)
+        
+        frozen = freeze_model(eager, example, channels_last=channels_last)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        save_frozen(frozen, path, {**self._metadata(), 'channels_last': channels_last})
+        
+        # Check the artifact exactly as the service will load and run it
+        loaded, _ = load_frozen(path, torch.device('cpu'))
+        memory_format = torch.channels_last if channels_last else torch.contiguous_format
+        with torch.no_grad():
+            metrics = compare_outputs(reference, loaded(example.contiguous(memory_format=memory_format)))
+        if metrics['max_abs_diff'] > tolerance:
+            os.remove(path)
+            raise ValueError(f"Frozen model diverges from the eager model: {metrics}")
+        return metrics
+    
+    @staticmethod
+    def _file_digest(path: str) -> str:
+        """Short content hash of a checkpoint file."""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()[:16]
     
     def preprocess_image(self, image: Image.Image) -> torch.Tensor:
         """
@@ -129,13 +497,7 @@ class FashionEmbeddingService:
         Returns:
             Preprocessed tensor ready for the model
         """
-        # Convert to RGB if necessary
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Apply transforms
-        tensor = self.transform(image)
-        return tensor
+        return self.preprocess_batch([image])[0]
     
     def generate_embedding(self, image: Image.Image) -> list[float]:
         """
@@ -147,16 +509,7 @@ class FashionEmbeddingService:
         Returns:
             64-dimensional embedding as a list of floats
         """
-        # Preprocess
-        tensor = self.preprocess_image(image)
-        tensor = tensor.unsqueeze(0).to(self.device)  # Add batch dimension
-        
-        # Generate embedding
-        with torch.no_grad():
-            embedding = self.model(tensor)
-        
-        # Convert to list
-        return embedding.cpu().numpy().flatten().tolist()
+        return self.generate_embeddings_batch([image])[0]
     
     def generate_embeddings_batch(self, images: list[Image.Image]) -> list[list[float]]:
         """
@@ -171,20 +524,21 @@ class FashionEmbeddingService:
         if not images:
             return []
         
-        # Preprocess all images
-        tensors = [self.preprocess_image(img) for img in images]
-        batch = torch.stack(tensors).to(self.device)
+        # Preprocess all images into one normalized batch
+        with stage("preprocess"):
+            batch = self.preprocess_batch(images).to(self.device, memory_format=self.memory_format)
         
-        # Generate embeddings
-        with torch.no_grad():
+        # Generate embeddings (no autograd bookkeeping at all, unlike no_grad)
+        with stage("forward"), torch.inference_mode():
             embeddings = self.model(batch)
         
         # Convert to list of lists
-        return embeddings.cpu().numpy().tolist()
+        with stage("postprocess"):
+            return embeddings.cpu().numpy().tolist()
     
     def compute_similarity(self, 
-                          embedding1: list[float], 
-                          embedding2: list[float]) -> float:
+                          embedding1: EmbeddingLike, 
+                          embedding2: EmbeddingLike) -> float:
         """
         Compute cosine similarity between two embeddings.
         
@@ -195,8 +549,8 @@ class FashionEmbeddingService:
         Returns:
             Cosine similarity score (-1 to 1)
         """
-        e1 = np.array(embedding1)
-        e2 = np.array(embedding2)
+        e1 = decode_embedding(embedding1).astype(np.float64)
+        e2 = decode_embedding(embedding2).astype(np.float64)
         
         # Cosine similarity
         dot_product = np.dot(e1, e2)
@@ -209,8 +563,8 @@ class FashionEmbeddingService:
         return float(dot_product / (norm1 * norm2))
     
     def compute_compatibility_score(self,
-                                    embedding1: list[float],
-                                    embedding2: list[float]) -> float:
+                                    embedding1: EmbeddingLike,
+                                    embedding2: EmbeddingLike) -> float:
         """
         Compute compatibility score between two items.
         Transforms cosine similarity to a 0-100 score.
@@ -224,41 +578,143 @@ class FashionEmbeddingService:
         """
         similarity = self.compute_similarity(embedding1, embedding2)
         # Transform from [-1, 1] to [0, 100]
-        score = (similarity + 1) * 50
-        return round(score, 2)
+        return similarity_to_score(similarity)
     
+    def type_condition(self,
+                       category1: Optional[str],
+                       category2: Optional[str]) -> Optional[int]:
+        """Type-space condition for a category pair, or None to score in the general space."""
+        if self.type_space is None:
+            return None
+        return self.type_space.condition(category1, category2)
+    
+    def score_candidates(self,
+                         target: np.ndarray,
+                         matrix: np.ndarray,
+                         target_category: Optional[str] = None,
+                         candidate_categories: Optional[list[Optional[str]]] = None) -> np.ndarray:
+        """
+        Similarity of a target to every candidate row.
+        
+        Without categories (or without type masks) this is the plain cosine
+        similarity. Otherwise rows are grouped by category pair and each group
+        is scored with one matmul in its type-specific subspace.
+        
+        Args:
+            target: (D,) target embedding
+            matrix: (N x D) candidate embeddings
+            target_category: Category of the target item
+            candidate_categories: Category of each candidate row (None entries
+                fall back to the general space)
+            
+        Returns:
+            (N,) similarities
+        """
+        if self.type_space is None or not target_category or candidate_categories is None:
+            return cosine_similarities(target, matrix)
+        
+        conditions = [self.type_condition(target_category, c) for c in candidate_categories]
+        conditions = np.array([-1 if c is None else c for c in conditions], dtype=np.int64)
+        sims = np.empty(matrix.shape[0], dtype=np.float32)
+        for condition in np.unique(conditions).tolist():
+            rows = np.flatnonzero(conditions == condition)
+            if condition < 0:
+                sims[rows] = cosine_similarities(target, matrix[rows])
+            else:
+                sims[rows] = self.type_space.similarities(target, matrix[rows], condition)
+        return sims
+    
+    @stage("search")
     def find_most_compatible(self,
-                            target_embedding: list[float],
+                            target_embedding: EmbeddingLike,
                             candidate_embeddings: list[dict],
-                            top_k: int = 5) -> list[dict]:
+                            top_k: int = 5,
+                            target_category: Optional[str] = None,
+                            candidate_category: Optional[str] = None) -> list[dict]:
         """
         Find the most compatible items from a list of candidates.
         
+        Candidates are stacked into one float32 matrix, scored with a single
+        matmul and the best `top_k` are selected with argpartition. When a
+        category pair is known and the checkpoint has type masks, scoring
+        happens in that pair's type-specific subspace.
+        
         Args:
-            target_embedding: The embedding to match against
+            target_embedding: The embedding to match against (list or base64 float32)
             candidate_embeddings: List of dicts with 'id' and 'embedding' keys
+                ('embedding' may be a float list or a base64 float32 string,
+                an optional 'category' overrides `candidate_category`)
             top_k: Number of results to return
+            target_category: Category of the target item (e.g. 'tops')
+            candidate_category: Category of the candidates (e.g. 'footwear')
             
         Returns:
             List of dicts with 'id', 'similarity', and 'compatibility_score'
         """
-        results = []
+        if not candidate_embeddings:
+            return []
         
-        for candidate in candidate_embeddings:
-            similarity = self.compute_similarity(target_embedding, candidate['embedding'])
-            score = self.compute_compatibility_score(target_embedding, candidate['embedding'])
-            
+        target = decode_embedding(target_embedding)
+        matrix = np.empty((len(candidate_embeddings), target.shape[0]), dtype=np.float32)
+        for row, candidate in enumerate(candidate_embeddings):
+            matrix[row] = decode_embedding(candidate['embedding'])
+        
+        categories = [c.get('category') or candidate_category for c in candidate_embeddings]
+        sims = self.score_candidates(target, matrix, target_category, categories)
+        
+        results = []
+        for idx in top_k_indices(rank_similarities(sims), top_k):
+            candidate = candidate_embeddings[idx]
+            similarity = float(sims[idx])
             results.append({
                 'id': candidate['id'],
                 'similarity': round(similarity, 4),
-                'compatibility_score': score,
+                'compatibility_score': similarity_to_score(similarity),
                 **{k: v for k, v in candidate.items() if k not in ['id', 'embedding']}
             })
         
-        # Sort by similarity descending
-        results.sort(key=lambda x: x['similarity'], reverse=True)
+        return results
+    
+    @stage("search")
+    def find_most_compatible_packed(self,
+                                    target_embedding: EmbeddingLike,
+                                    candidate_ids: list,
+                                    candidate_matrix: np.ndarray,
+                                    top_k: int = 5,
+                                    target_category: Optional[str] = None,
+                                    candidate_category: Optional[str] = None) -> list[dict]:
+        """
+        Find the most compatible items from a packed candidate matrix.
+        
+        Args:
+            target_embedding: The embedding to match against
+            candidate_ids: One id per matrix row
+            candidate_matrix: (N x D) float32 candidate embeddings
+            top_k: Number of results to return
+            target_category: Category of the target item
+            candidate_category: Category shared by all candidates
+            
+        Returns:
+            List of dicts with 'id', 'similarity', and 'compatibility_score'
+        """
+        if len(candidate_ids) != candidate_matrix.shape[0]:
+            raise ValueError(
+                f"Got {len(candidate_ids)} candidate ids for {candidate_matrix.shape[0]} embeddings"
+            )
+        
+        categories = [candidate_category] * len(candidate_ids) if candidate_category else None
+        sims = self.score_candidates(
+            decode_embedding(target_embedding), candidate_matrix, target_category, categories
+        )
         
-        return results[:top_k]
+        return [
+            {
+                'id': candidate_ids[idx],
+                'similarity': round(float(sims[idx]), 4),
+                'compatibility_score': similarity_to_score(float(sims[idx])),
+            }
+            for idx in top_k_indices(rank_similarities(sims), top_k)
+        ]
 
 
 # Singleton instance for the service
@@ -271,6 +727,14 @@ def get_embedding_service() -> FashionEmbeddingService:
     
     if _embedding_service is None:
         model_path = os.getenv('EMBEDDING_MODEL_PATH')
-        _embedding_service = FashionEmbeddingService(model_path=model_path)
+        _embedding_service = FashionEmbeddingService(
+            model_path=model_path,
+            quantization=quantization_mode('EMBEDDING_QUANTIZATION')
+        )
     
     return _embedding_service
+
+
+def warm_up_embedding(service: FashionEmbeddingService):
+    """One dummy forward pass so the first request does not pay for kernel setup."""
+    service.generate_embeddings_batch([Image.new('RGB', (112, 112))])
@@ -0,0 +1,37 @@
+"""
+Environment Settings
+Tolerant parsing of numeric settings from the environment.
+
+`.env.example` lists optional settings with an empty value (`NAME=`), and
+python-dotenv exports those as empty strings. An empty or unset variable
+means "use the default"; a value that is not a number is reported and
+ignored instead of failing startup.
+"""
+
+import os
+from typing import Callable, Optional, TypeVar
+
+
+Number = TypeVar("Number", int, float)
+
+
+def _env_number(name: str, parse: Callable[[str], Number], kind: str,
+                default: Optional[Number]) -> Optional[Number]:
+    value = os.getenv(name, "").strip()
+    if not value:
+        return default
+    try:
+        return parse(value)
+    except ValueError:
+        print(f"[Config] Ignoring {name}={value!r}: not {kind}, using {default}")
+        return default
+
+
+def env_int(name: str, default: Optional[int] = None) -> Optional[int]:
+    """Integer setting; empty, unset or invalid values give `default`."""
+    return _env_number(name, int, "an integer", default)
+
+
+def env_float(name: str, default: Optional[float] = None) -> Optional[float]:
+    """Float setting; empty, unset or invalid values give `default`."""
+    return _env_number(name, float, "a number", default)
@@ -0,0 +1,160 @@
+"""
+Inference Executors
+Bounded thread pools that keep CPU-bound work (model forward passes, image
+decoding and encoding) off the asyncio event loop, with admission control.
+"""
+
+import asyncio
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from .env_settings import env_int
+from .metrics import EXECUTOR_WAIT
+from .profiling import current_profile
+from .tracing import record_stage
+
+
+class ServiceSaturated(Exception):
+    """Raised when a pool or queue is full and the request should be retried later."""
+
+    def __init__(self, name: str, retry_after: int = 1):
+        super().__init__(f"{name} is saturated, retry later")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class ModelExecutor:
+    """
+    Thread pool dedicated to one model (or one kind of CPU work).
+
+    At most `max_workers` jobs run concurrently and at most `max_queue` more
+    may wait; anything beyond that is rejected with ServiceSaturated instead
+    of queuing forever. Torch and Pillow release the GIL, so threads give
+    real parallelism while sharing a single copy of the model weights.
+    """
+
+    def __init__(self, name: str, max_workers: int = 1, max_queue: int = 8):
+        """
+        Initialize the executor.
+
+        Args:
+            name: Pool name used in thread names, errors and stats
+            max_workers: Number of jobs allowed to run concurrently
+            max_queue: Number of jobs allowed to wait for a free worker
+        """
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.pool = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix=f"{name}-worker"
+        )
+        # Only touched from the event loop thread, so no lock is needed
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    def is_saturated(self) -> bool:
+        return self.in_flight >= self.capacity
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run `fn(*args, **kwargs)` on this pool and await its result.
+
+        Raises:
+            ServiceSaturated: If the pool and its queue are full
+        """
+        if self.is_saturated():
+            self.rejected += 1
+            raise ServiceSaturated(self.name)
+
+        self.in_flight += 1
+        submitted = time.perf_counter()
+        loop = asyncio.get_running_loop()
+
+        def job():
+            waited = time.perf_counter() - submitted
+            EXECUTOR_WAIT.observe(waited, pool=self.name)
+            record_stage("queue", waited)
+            profile = current_profile()
+            if profile is not None:
+                return profile.run(self.name, fn, *args, **kwargs)
+            return fn(*args, **kwargs)
+
+        try:
+            # Run in the caller's context, so stage timings reach the right request
+            future = self.pool.submit(contextvars.copy_context().run, job)
+        except BaseException:
+            self.in_flight -= 1
+            raise
+        # The slot is held until the job itself is done (or dropped from the queue),
+        # not until the caller stops waiting: a cancelled caller leaves its job running
+        future.add_done_callback(lambda _: self._release(loop))
+        return await asyncio.wrap_future(future)
+
+    def _release(self, loop: asyncio.AbstractEventLoop):
+        def release():
+            self.in_flight -= 1
+            self.completed += 1
+
+        try:
+            loop.call_soon_threadsafe(release)
+        except RuntimeError:
+            # Loop already closed (shutdown); nobody reads the counters any more
+            pass
+
+    def get_stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+def _create_executor(name: str, env_prefix: str, default_workers: int, default_queue: int) -> ModelExecutor:
+    return ModelExecutor(
+        name=name,
+        max_workers=env_int(f"{env_prefix}_WORKERS", default_workers),
+        max_queue=env_int(f"{env_prefix}_MAX_QUEUE", default_queue),
+    )
+
+
+# Singleton executors, one per model plus one for generic CPU work
+_executors: dict[str, ModelExecutor] = {}
+
+_EXECUTOR_DEFAULTS = {
+    # name: (env prefix, workers, queue)
+    "segmentation": ("SEGMENTATION", 1, 8),
+    "embedding": ("EMBEDDING", 1, 64),
+    # Image decoding/encoding and vector math
+    "cpu": ("CPU_POOL", min(4, os.cpu_count() or 1), 64),
+}
+
+
+def get_executor(name: str) -> ModelExecutor:
+    """Get or create the named executor ('segmentation', 'embedding' or 'cpu')."""
+    if name not in _executors:
+        env_prefix, workers, queue = _EXECUTOR_DEFAULTS[name]
+        _executors[name] = _create_executor(name, env_prefix, workers, queue)
+    return _executors[name]
+
+
+def get_executor_stats() -> dict:
+    """Stats for every executor created so far."""
+    return {name: executor.get_stats() for name, executor in _executors.items()}
+
+
+def shutdown_executors(wait: bool = False):
+    """Shut down all executors (used on application shutdown)."""
+    for executor in _executors.values():
+        executor.pool.shutdown(wait=wait, cancel_futures=True)
+    _executors.clear()
@@ -0,0 +1,56 @@
+"""
+Model Export
+Writes local inference artifacts so the service can start without network access.
+
+    python -m bg_remove_service.export_models \
+        --embedding-output models/embedding.pt --rmbg-output models/rmbg-1.4
+
+Then set EMBEDDING_MODEL_PATH=models/embedding.pt and RMBG_MODEL_PATH=models/rmbg-1.4
+(and HF_HUB_OFFLINE=1 to make sure nothing is fetched).
+
+With --embedding-format torchscript the embedding network is written as a frozen,
+BatchNorm-folded, channels_last TorchScript graph instead (checked against eager).
+"""
+
+import argparse
+import os
+
+from .embedding_service import FashionEmbeddingService
+from .segmentation import load_segmentation_pipeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("--checkpoint", default=os.getenv("EMBEDDING_MODEL_PATH"),
+                        help="Training checkpoint to export (default: EMBEDDING_MODEL_PATH)")
+    parser.add_argument("--embedding-output", help="Path of the embedding artifact to write")
+    parser.add_argument("--embedding-format", choices=["artifact", "torchscript"], default="artifact",
+                        help="Eager state-dict artifact or frozen TorchScript graph")
+    parser.add_argument("--no-channels-last", action="store_true",
+                        help="Trace the TorchScript graph for contiguous (NCHW) inputs")
+    parser.add_argument("--rmbg-output", help="Directory to save the RMBG-1.4 model into")
+    args = parser.parse_args()
+
+    if not args.embedding_output and not args.rmbg_output:
+        parser.error("nothing to export, pass --embedding-output and/or --rmbg-output")
+
+    if args.embedding_output:
+        service = FashionEmbeddingService(model_path=args.checkpoint, device="cpu")
+        if args.embedding_format == "torchscript":
+            metrics = service.save_frozen_artifact(
+                args.embedding_output, channels_last=not args.no_channels_last
+            )
+            print(f"Frozen model matches eager: {metrics}")
+        else:
+            service.save_artifact(args.embedding_output)
+        print(f"Wrote embedding {args.embedding_format} ({service.model_version}) to {args.embedding_output}")
+
+    if args.rmbg_output:
+        # Loads from the Hub (or cache) unless RMBG_MODEL_PATH is already set
+        pipe = load_segmentation_pipeline()
+        pipe.save_pretrained(args.rmbg_output)
+        print(f"Saved RMBG-1.4 to {args.rmbg_output}")
+
+
+if __name__ == "__main__":
+    main()
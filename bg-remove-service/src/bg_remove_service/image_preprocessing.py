@@ -0,0 +1,106 @@
+"""
+Batched Embedding Preprocessing
+Replaces the per-image torchvision Resize/CenterCrop/ToTensor/Normalize chain.
+
+- JPEGs are decoded at reduced size with Pillow's draft mode (DCT scaling),
+  so a 12 MP phone photo is never fully decoded just to become 112x112
+- resize and center crop are one Pillow call (`resize(box=...)`), and only
+  the cropped region is resampled
+- pixels are written straight into a reusable uint8 (N, H, W, 3) buffer
+- the batch is converted and normalized with one fused tensor op
+"""
+
+import io
+import threading
+from typing import Optional
+
+import numpy as np
+import torch
+from PIL import Image
+
+from .tracing import stage
+
+
+EMBEDDING_INPUT_SIZE = 112
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+# Bumped whenever preprocessing changes the pixels the model sees
+PREPROCESSING_VERSION = "batched-box-resize-1"
+
+# (x / 255 - mean) / std  ==  x * scale + bias, per channel
+_SCALE = torch.tensor([1.0 / (255.0 * s) for s in IMAGENET_STD]).view(1, 3, 1, 1)
+_BIAS = torch.tensor([-m / s for m, s in zip(IMAGENET_MEAN, IMAGENET_STD)]).view(1, 3, 1, 1)
+
+
+@stage("decode")
+def decode_for_embedding(data: bytes, size: int = EMBEDDING_INPUT_SIZE) -> Image.Image:
+    """
+    Decode image bytes for embedding, at reduced size when the format allows it.
+
+    JPEG draft mode picks the largest DCT scale (1/2, 1/4, 1/8) that keeps both
+    sides >= `size`, so the shorter side still covers the model input.
+    """
+    image = Image.open(io.BytesIO(data))
+    if image.format == "JPEG":
+        image.draft("RGB", (size, size))
+    if image.mode != "RGB":
+        return image.convert("RGB")
+    image.load()
+    return image
+
+
+def center_crop_box(width: int, height: int, size: int = EMBEDDING_INPUT_SIZE) -> tuple[float, float, float, float]:
+    """
+    Source region that Resize(size) followed by CenterCrop(size) keeps.
+
+    Mirrors torchvision: the shorter side is scaled to `size`, the longer one to
+    int(size * long / short), and the crop offset is rounded.
+    """
+    if width <= height:
+        resized_w, resized_h = size, int(size * height / width)
+    else:
+        resized_w, resized_h = int(size * width / height), size
+    left = int(round((resized_w - size) / 2.0))
+    top = int(round((resized_h - size) / 2.0))
+    scale_x, scale_y = width / resized_w, height / resized_h
+    return (left * scale_x, top * scale_y, (left + size) * scale_x, (top + size) * scale_y)
+
+
+class EmbeddingPreprocessor:
+    """Turns PIL images into one normalized (N, 3, size, size) float batch."""
+
+    def __init__(self, size: int = EMBEDDING_INPUT_SIZE):
+        self.size = size
+        # One buffer per worker thread, grown to the largest batch seen
+        self._local = threading.local()
+
+    def _buffer(self, batch_size: int) -> np.ndarray:
+        buffer: Optional[np.ndarray] = getattr(self._local, "buffer", None)
+        if buffer is None or buffer.shape[0] < batch_size:
+            buffer = np.empty((batch_size, self.size, self.size, 3), dtype=np.uint8)
+            self._local.buffer = buffer
+        return buffer[:batch_size]
+
+    def __call__(self, images: list[Image.Image]) -> torch.Tensor:
+        """
+        Args:
+            images: PIL Images of any size and mode
+
+        Returns:
+            (N, 3, size, size) float32 batch, ImageNet-normalized
+        """
+        buffer = self._buffer(len(images))
+        for i, image in enumerate(images):
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            box = center_crop_box(image.width, image.height, self.size)
+            # reducing_gap lets Pillow box-reduce large images first, which is much cheaper
+            buffer[i] = np.asarray(
+                image.resize((self.size, self.size), Image.BILINEAR, box=box, reducing_gap=3.0)
+            )
+
+        batch = torch.from_numpy(buffer).permute(0, 3, 1, 2)
+        # One fused multiply-add does ToTensor's /255 and Normalize for the whole batch
+        return torch.addcmul(_BIAS, batch.float(), _SCALE)
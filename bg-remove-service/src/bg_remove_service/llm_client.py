@@ -0,0 +1,267 @@
+"""
+OpenRouter Client
+Shared async client for vision-LLM calls with connection pooling, bounded
+concurrency, per-call timeouts and retry with jittered exponential backoff.
+Structured (JSON-schema) output is requested when the provider accepts it,
+and replies can be streamed token by token.
+"""
+
+import asyncio
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Optional
+
+import httpx
+from openai import APIConnectionError, APIStatusError, APITimeoutError, AsyncOpenAI
+
+from .env_settings import env_float, env_int
+from .metrics import LLM_LATENCY
+from .tracing import log
+
+
+DEFAULT_BASE_URL = "https://openrouter.ai/api/v1"
+DEFAULT_MODEL = "google/gemma-3-4b-it:free"
+
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits, server errors, timeouts and dropped connections are worth retrying."""
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, (APIConnectionError, APITimeoutError, asyncio.TimeoutError))
+
+
+# Phrases in a 400 that mean the provider or model does not support `response_format`
+_RESPONSE_FORMAT_ERRORS = ("response_format", "response format", "json_schema", "json schema", "structured output")
+
+
+def rejects_response_format(error: APIStatusError) -> bool:
+    """Whether a 400 is about `response_format` itself rather than the rest of the request."""
+    if error.status_code != 400:
+        return False
+    text = f"{error.message} {error.body}".lower()
+    return any(phrase in text for phrase in _RESPONSE_FORMAT_ERRORS)
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    """Read a Retry-After header (in seconds) from a failed response, if any."""
+    if not isinstance(error, APIStatusError):
+        return None
+    value = error.response.headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class LLMClient:
+    """
+    Async chat-completions client shared by every request.
+
+    One pooled HTTP client keeps connections alive between calls; a semaphore
+    bounds how many calls are in flight so a large batch fans out without
+    tripping the provider's rate limits.
+    """
+
+    def __init__(self,
+                 api_key: str,
+                 base_url: str = DEFAULT_BASE_URL,
+                 model: str = DEFAULT_MODEL,
+                 max_concurrency: int = 8,
+                 timeout: float = 60.0,
+                 max_retries: int = 3,
+                 backoff_base: float = 0.5,
+                 backoff_max: float = 8.0,
+                 structured_output: bool = True,
+                 http_client: Optional[httpx.AsyncClient] = None):
+        """
+        Initialize the client.
+
+        Args:
+            api_key: OpenRouter API key
+            base_url: API base URL (point at a local stub server for testing)
+            model: Default model for chat completions
+            max_concurrency: Maximum calls in flight at once
+            timeout: Per-call timeout in seconds (per attempt)
+            max_retries: Retries after the first attempt on 429/5xx/timeouts
+            backoff_base: Base delay in seconds for exponential backoff
+            backoff_max: Upper bound on a single backoff delay
+            structured_output: Send `response_format` when a caller passes one; turned
+                off automatically if the provider says it is unsupported
+            http_client: Optional preconfigured httpx client (e.g. a mock transport)
+        """
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_concurrency = max(1, max_concurrency)
+        self.structured_output = structured_output
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        self.http_client = http_client or httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+                keepalive_expiry=30.0,
+            ),
+            timeout=httpx.Timeout(timeout),
+        )
+        # Retries are handled here so the backoff policy is in one place
+        self.client = AsyncOpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            http_client=self.http_client,
+            max_retries=0,
+            timeout=timeout,
+        )
+
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def backoff_delay(self, attempt: int, error: Optional[Exception] = None) -> float:
+        """Full-jitter exponential backoff, honouring Retry-After when given."""
+        retry_after = _retry_after_seconds(error) if error is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def _with_retries(self, attempt_fn) -> Any:
+        """Run one call attempt at a time, retrying transient failures with backoff."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await attempt_fn()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    self.failures += 1
+                    raise
+                self.retries += 1
+                await asyncio.sleep(self.backoff_delay(attempt, e))
+
+    async def _create(self, messages: list[dict], **kwargs):
+        """One call attempt; latency (until the stream opens, for streams) and tokens go to /metrics."""
+        self.calls += 1
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            response = await asyncio.wait_for(
+                self.client.chat.completions.create(messages=messages, **kwargs),
+                timeout=self.timeout,
+            )
+            outcome = "ok"
+        finally:
+            LLM_LATENCY.observe(time.perf_counter() - started, outcome=outcome)
+
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            self.prompt_tokens += usage.prompt_tokens or 0
+            self.completion_tokens += usage.completion_tokens or 0
+        return response
+
+    async def _with_response_format(self, call, response_format: Optional[dict], kwargs: dict) -> Any:
+        """
+        Make the call with `response_format` if structured output is on.
+        A 400 saying `response_format` is unsupported disables structured output for
+        this client, and the call is repeated without it; other errors are raised.
+        """
+        if response_format is None or not self.structured_output:
+            return await call(**kwargs)
+        try:
+            return await call(response_format=response_format, **kwargs)
+        except APIStatusError as e:
+            if not rejects_response_format(e):
+                raise
+            self.structured_output = False
+            log("LLM", f"Provider rejected response_format, continuing without it: {e}", level="warning")
+            return await call(**kwargs)
+
+    async def chat(self, messages: list[dict], response_format: Optional[dict] = None, **kwargs) -> Any:
+        """
+        Create a chat completion, retrying transient failures.
+
+        Args:
+            messages: Chat messages in OpenAI format
+            response_format: Structured output request (e.g. a JSON schema), used when supported
+            **kwargs: Extra arguments for `chat.completions.create`
+
+        Returns:
+            The chat completion response
+        """
+        kwargs.setdefault("model", self.model)
+
+        async def call(**call_kwargs):
+            async def attempt():
+                # Only hold a concurrency slot while a call is actually in flight
+                async with self._semaphore:
+                    return await self._create(messages, **call_kwargs)
+            return await self._with_retries(attempt)
+
+        return await self._with_response_format(call, response_format, kwargs)
+
+    async def chat_stream(self,
+                          messages: list[dict],
+                          response_format: Optional[dict] = None,
+                          **kwargs) -> AsyncIterator[str]:
+        """
+        Stream a chat completion's text as it is generated.
+        Failures are retried only until the stream opens; `timeout` applies to
+        the wait for each chunk.
+
+        Yields:
+            Text deltas
+        """
+        kwargs.setdefault("model", self.model)
+
+        async def call(**call_kwargs):
+            return await self._with_retries(lambda: self._create(messages, stream=True, **call_kwargs))
+
+        # The slot is held for the whole stream, since the call is in flight until it ends
+        async with self._semaphore:
+            stream = await self._with_response_format(call, response_format, kwargs)
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(stream.__anext__(), timeout=self.timeout)
+                    except StopAsyncIteration:
+                        break
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                await stream.close()
+
+    def get_stats(self) -> dict:
+        return {
+            "model": self.model,
+            "max_concurrency": self.max_concurrency,
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "structured_output": self.structured_output,
+        }
+
+    async def aclose(self):
+        await self.http_client.aclose()
+
+
+def create_llm_client() -> Optional[LLMClient]:
+    """Create the shared client from environment variables (None if no API key)."""
+    api_key = os.getenv("OPENROUTER_API_KEY")
+    if not api_key:
+        return None
+
+    return LLMClient(
+        api_key=api_key,
+        base_url=os.getenv("OPENROUTER_BASE_URL", DEFAULT_BASE_URL),
+        model=os.getenv("OPENROUTER_MODEL", DEFAULT_MODEL),
+        max_concurrency=env_int("LLM_MAX_CONCURRENCY", 8),
+        timeout=env_float("LLM_TIMEOUT_SECONDS", 60.0),
+        max_retries=env_int("LLM_MAX_RETRIES", 3),
+        backoff_base=env_float("LLM_BACKOFF_BASE_SECONDS", 0.5),
+        backoff_max=env_float("LLM_BACKOFF_MAX_SECONDS", 8.0),
+        structured_output=os.getenv("LLM_STRUCTURED_OUTPUT", "true").lower() == "true",
+    )
@@ -0,0 +1,154 @@
+"""
+Vision-LLM Image Preparation
+Shrinks photos before they are sent for attribute extraction, and finds
+near-duplicate shots within a batch so each is sent only once.
+
+Pre-send pipeline (LLM_IMAGE_* settings):
+- JPEGs are decoded at reduced size with Pillow's draft mode
+- EXIF orientation is applied, so the model sees the photo upright
+- the longest side is bounded (vision models downscale anyway, but bill
+  image tokens by the size that was uploaded)
+- transparency is flattened onto white, then the image is re-encoded as
+  JPEG or WebP at the configured quality instead of PNG
+
+Duplicates are found with a 64-bit difference hash (dHash): two images whose
+hashes differ in at most LLM_DEDUPE_MAX_DISTANCE bits are treated as the same shot.
+"""
+
+import base64
+import io
+import os
+from typing import Optional
+
+from PIL import Image, ImageOps
+
+from .env_settings import env_int
+from .tracing import stage
+
+
+LLM_IMAGE_FORMATS = ("jpeg", "webp", "png")
+
+MEDIA_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp", "png": "image/png"}
+
+# dHash grid: compares horizontally adjacent pixels of a (size+1) x size thumbnail
+HASH_SIZE = 8
+
+
+class LLMImageEncoder:
+    """Decodes uploads and encodes them as compact data URLs for the vision LLM."""
+
+    def __init__(self,
+                 max_side: int = 1024,
+                 format: str = "jpeg",
+                 quality: int = 85,
+                 dedupe_max_distance: int = 4):
+        """
+        Args:
+            max_side: Longest side in pixels after downscaling (0 keeps the original size)
+            format: Re-encode format, one of LLM_IMAGE_FORMATS
+            quality: JPEG/WebP quality (1-100)
+            dedupe_max_distance: Max dHash bit difference for two images to count
+                as the same shot (-1 disables dedupe)
+        """
+        format = format.lower()
+        if format not in LLM_IMAGE_FORMATS:
+            raise ValueError(f"Unknown LLM image format '{format}', expected one of {LLM_IMAGE_FORMATS}")
+        if not 1 <= quality <= 100:
+            raise ValueError(f"LLM image quality must be between 1 and 100, got {quality}")
+
+        self.max_side = max(0, max_side)
+        self.format = format
+        self.quality = quality
+        self.dedupe_max_distance = dedupe_max_distance
+
+    @property
+    def media_type(self) -> str:
+        return MEDIA_TYPES[self.format]
+
+    @property
+    def version(self) -> str:
+        """Identifies what the model is shown; part of the attribute cache version."""
+        return f"{self.format}-q{self.quality}-max{self.max_side}"
+
+    @stage("decode")
+    def decode(self, data: bytes) -> Image.Image:
+        """
+        Decode an upload into an upright RGB image no larger than max_side (CPU-bound).
+        """
+        image = Image.open(io.BytesIO(data))
+        if image.format == "JPEG" and self.max_side:
+            # Reduced-size DCT decode; both sides stay >= max_side
+            image.draft("RGB", (self.max_side, self.max_side))
+        image = ImageOps.exif_transpose(image)
+
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            flattened = Image.new("RGB", image.size, (255, 255, 255))
+            flattened.paste(image, mask=image.getchannel("A"))
+            image = flattened
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+
+        if self.max_side and max(image.size) > self.max_side:
+            image.thumbnail((self.max_side, self.max_side), Image.BICUBIC, reducing_gap=3.0)
+        image.load()
+        return image
+
+    @stage("encode")
+    def encode(self, image: Image.Image) -> str:
+        """Encode an image as a base64 data URL in the configured format (CPU-bound)."""
+        buffered = io.BytesIO()
+        if self.format == "png":
+            image.save(buffered, format="PNG", compress_level=1)
+        else:
+            image.save(buffered, format=self.format.upper(), quality=self.quality)
+        return f"data:{self.media_type};base64,{base64.b64encode(buffered.getvalue()).decode()}"
+
+
+def dhash(image: Image.Image, size: int = HASH_SIZE) -> int:
+    """
+    Difference hash: one bit per horizontally adjacent pixel pair of a
+    (size+1) x size grayscale thumbnail, set when brightness increases.
+    Robust to rescaling and re-compression, not to crops or rotations.
+    """
+    pixels = image.convert("L").resize((size + 1, size), Image.BILINEAR).tobytes()
+    bits = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            bits = (bits << 1) | (pixels[offset + col] < pixels[offset + col + 1])
+    return bits
+
+
+def duplicate_groups(hashes: list[Optional[int]], max_distance: int) -> dict[int, list[int]]:
+    """
+    Group near-identical images.
+
+    Args:
+        hashes: One dHash per image (None for images that failed to decode)
+        max_distance: Max differing bits within a group (-1 puts every image alone)
+
+    Returns:
+        Representative index -> indices it stands for (including itself), in input order
+    """
+    groups: dict[int, list[int]] = {}
+    for idx, value in enumerate(hashes):
+        if value is None:
+            continue
+        for rep in groups:
+            if max_distance >= 0 and (value ^ hashes[rep]).bit_count() <= max_distance:
+                groups[rep].append(idx)
+                break
+        else:
+            groups[idx] = [idx]
+    return groups
+
+
+def create_llm_image_encoder() -> LLMImageEncoder:
+    """Create the pre-send pipeline from environment variables."""
+    return LLMImageEncoder(
+        max_side=env_int("LLM_IMAGE_MAX_SIDE", 1024),
+        format=os.getenv("LLM_IMAGE_FORMAT") or "jpeg",
+        quality=env_int("LLM_IMAGE_QUALITY", 85),
+        dedupe_max_distance=env_int("LLM_DEDUPE_MAX_DISTANCE", 4),
+    )
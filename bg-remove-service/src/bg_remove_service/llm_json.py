@@ -0,0 +1,217 @@
+"""
+Tolerant LLM JSON Parsing
+Recovers the JSON in a model reply instead of failing the whole (paid) call.
+
+- prose and markdown code fences around the JSON are skipped
+- trailing commas are dropped
+- a truncated reply is cut back to its last complete element and closed
+- items are validated one by one, so one bad item does not discard the rest
+- `IncrementalArrayParser` yields array elements while tokens are still arriving
+"""
+
+import json
+from typing import Any, Optional, Type
+
+from pydantic import BaseModel, ValidationError
+
+
+_CLOSERS = {"[": "]", "{": "}"}
+
+# Cut-backs tried before a reply is given up on
+_MAX_REPAIRS = 8
+
+
+class _Scanner:
+    """
+    Character-level JSON structure tracker (strings, escapes, bracket depth).
+    Just enough state to find element boundaries; json.loads does the real parsing.
+    """
+
+    def __init__(self):
+        self.stack: list[str] = []
+        self.in_string = False
+        self.escaped = False
+
+    def step(self, char: str) -> Optional[str]:
+        """
+        Advance over one character.
+        Returns 'open', 'close' or 'comma' for structural characters outside strings.
+        """
+        if self.in_string:
+            if self.escaped:
+                self.escaped = False
+            elif char == "\\":
+                self.escaped = True
+            elif char == '"':
+                self.in_string = False
+            return None
+        if char == '"':
+            self.in_string = True
+        elif char in _CLOSERS:
+            self.stack.append(char)
+            return "open"
+        elif char in "]}" and self.stack:
+            self.stack.pop()
+            return "close"
+        elif char == ",":
+            return "comma"
+        return None
+
+
+def _strip_trailing_comma(chars: list[str]):
+    """Remove a dangling comma (and whitespace after it) from the end of the output."""
+    end = len(chars)
+    while end and chars[end - 1].isspace():
+        end -= 1
+    if end and chars[end - 1] == ",":
+        del chars[end - 1:]
+
+
+def _json_start(text: str, opener: Optional[str]) -> int:
+    """Index of the first '[' or '{' (or of `opener`, if given), or -1."""
+    candidates = [text.find(c) for c in ([opener] if opener else list(_CLOSERS))]
+    candidates = [i for i in candidates if i >= 0]
+    return min(candidates) if candidates else -1
+
+
+def repair_json(text: str, opener: Optional[str] = None) -> tuple[str, bool]:
+    """
+    Cut the first JSON array/object out of a model reply and make it loadable.
+
+    Args:
+        text: Raw model output
+        opener: '[' or '{' to look only for that kind of container
+
+    Returns:
+        (JSON text, whether anything besides surrounding prose had to be fixed)
+
+    Raises:
+        ValueError: If the reply contains no JSON container
+    """
+    start = _json_start(text, opener)
+    if start < 0:
+        raise ValueError("No JSON found in model response")
+
+    scanner = _Scanner()
+    chars: list[str] = []
+    repaired = False
+    # Output length and open containers after the last complete element
+    safe_length, safe_stack = 0, []
+
+    for char in text[start:]:
+        event = scanner.step(char)
+        if event == "close":
+            before = len(chars)
+            _strip_trailing_comma(chars)
+            repaired |= len(chars) != before
+            chars.append(char)
+            if not scanner.stack:
+                return "".join(chars), repaired
+            safe_length, safe_stack = len(chars), list(scanner.stack)
+        else:
+            chars.append(char)
+            if event == "comma":
+                safe_length, safe_stack = len(chars) - 1, list(scanner.stack)
+
+    # Truncated: keep everything up to the last complete element and close the rest
+    chars = chars[:safe_length]
+    _strip_trailing_comma(chars)
+    chars.extend(_CLOSERS[opened] for opened in reversed(safe_stack))
+    return "".join(chars), True
+
+
+def parse_json_reply(text: str, opener: Optional[str] = None) -> tuple[Any, bool]:
+    """
+    Parse the JSON in a model reply, repairing it if needed.
+
+    Returns:
+        (parsed value, whether the JSON had to be repaired)
+
+    Raises:
+        ValueError: If no JSON can be recovered (json.JSONDecodeError is a ValueError)
+    """
+    candidate, repaired = repair_json(text, opener)
+    for _ in range(_MAX_REPAIRS):
+        try:
+            return json.loads(candidate), repaired
+        except json.JSONDecodeError as e:
+            error = e
+        # Some other defect inside the container: keep what precedes it
+        candidate, repaired = repair_json(candidate[:error.pos], opener)[0], True
+    raise error
+
+
+def validate_items(model: Type[BaseModel], values: Any) -> tuple[list[BaseModel], int]:
+    """
+    Validate each element of a list on its own.
+
+    Returns:
+        (valid items, number of elements that were dropped)
+    """
+    if not isinstance(values, list):
+        raise ValueError(f"Expected a JSON array of items, got {type(values).__name__}")
+    items, dropped = [], 0
+    for value in values:
+        try:
+            items.append(model.model_validate(value))
+        except ValidationError:
+            dropped += 1
+    return items, dropped
+
+
+class IncrementalArrayParser:
+    """
+    Parse the elements of the first JSON array in a token stream as they complete.
+
+    Prose before the array (and a wrapping object such as {"items": [...]}) is
+    skipped; elements are repaired like `parse_json_reply`, or skipped if they
+    cannot be.
+    """
+
+    def __init__(self):
+        self._scanner = _Scanner()
+        # Stack depth of the array whose elements we emit (None until it is found)
+        self._array_depth: Optional[int] = None
+        self._element: list[str] = []
+        self.done = False
+
+    def feed(self, chunk: str) -> list[Any]:
+        """Consume more text; returns the elements completed by it."""
+        completed = []
+        for char in chunk:
+            if self.done:
+                break
+            event = self._scanner.step(char)
+            depth = len(self._scanner.stack)
+
+            if self._array_depth is None:
+                if event == "open" and self._scanner.stack[-1] == "[":
+                    self._array_depth = depth
+                continue
+
+            if depth < self._array_depth:
+                # The array itself closed
+                self._flush(completed)
+                self.done = True
+            elif event == "comma" and depth == self._array_depth:
+                self._flush(completed)
+            else:
+                self._element.append(char)
+                if event == "close" and depth == self._array_depth:
+                    self._flush(completed)
+        return completed
+
+    def _flush(self, completed: list[Any]):
+        text = "".join(self._element).strip()
+        self._element = []
+        if not text:
+            return
+        try:
+            completed.append(json.loads(text))
+        except json.JSONDecodeError:
+            if text[0] not in _CLOSERS:
+                return
+            try:
+                completed.append(parse_json_reply(text)[0])
+            except ValueError:
+                pass
@@ -1,27 +1,75 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
-from fastapi.responses import Response
+from fastapi import Depends, FastAPI, File, UploadFile, HTTPException, Form, Header, Request
+from fastapi.responses import Response, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Optional
-import torch
-from transformers import pipeline
+from typing import Optional, Union
+import asyncio
 from PIL import Image
 import io
 import os
 import base64
-from openai import OpenAI
+import secrets
 
 from dotenv import load_dotenv
 import json
 
 # Embedding service import
-from .embedding_service import get_embedding_service
+from .embedding_service import (
+    decode_embedding,
+    decode_embedding_matrix,
+    get_embedding_service,
+    similarity_to_score,
+    warm_up_embedding,
+)
+from .batching import MicroBatcher
+from .executors import ServiceSaturated, get_executor, get_executor_stats, shutdown_executors
+from .segmentation import (
+    RMBG_INPUT_SIZE,
+    SEGMENTATION_BATCH_SIZE,
+    SEGMENTATION_MODEL,
+    load_segmentation_pipeline,
+    predict_masks,
+    warm_up_segmentation,
+)
+from .model_registry import (
+    eager_loading,
+    get_model_status,
+    models_ready,
+    register_model,
+    warm_up_models,
+)
+from .llm_client import create_llm_client
+from .llm_image import create_llm_image_encoder, dhash, duplicate_groups
+from .llm_json import IncrementalArrayParser, parse_json_reply, validate_items
+from .quantization import quantization_mode
+from .runtime_config import apply_runtime_config, get_runtime_config
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY, stat_samples
+from .tracing import TracingMiddleware, log, request_parsed, stage
+from .profiling import ProfileSession, ProfilingMiddleware, current_profile, get_profiler
+from .output_codec import PNG_CODEC, OutputCodec
+from .image_preprocessing import PREPROCESSING_VERSION, decode_for_embedding
+from .streaming import as_completed, ndjson_response, wants_stream
+from .binary_responses import (
+    FLOAT32_MEDIA_TYPE,
+    MULTIPART_MEDIA_TYPE,
+    accepts,
+    float32_response,
+    multipart_response,
+)
+from .embedding_index import get_embedding_index
+from .type_space import typespaces_configured
+from .env_settings import env_float, env_int
+from .result_cache import content_key, get_result_cache, version_key
+import numpy as np
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Initialize FastAPI app
-app = FastAPI(title="AI Service - Background Removal, Attribute Extraction & Embeddings")
+# Initialize FastAPI app; `request_parsed` records how long reading and parsing each body took
+app = FastAPI(
+    title="AI Service - Background Removal, Attribute Extraction & Embeddings",
+    dependencies=[Depends(request_parsed)],
+)
 
 # Configure CORS
 app.add_middleware(
@@ -35,27 +83,70 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Samples requests for on-demand profiling (see /admin/profile)
+app.add_middleware(ProfilingMiddleware)
+# Outermost, so its timings and request id cover everything else
+app.add_middleware(TracingMiddleware)
+
+@app.exception_handler(ServiceSaturated)
+async def service_saturated_handler(request, exc: ServiceSaturated):
+    """Reject instead of queuing forever when an inference pool is full."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
-# Use GPU if available, otherwise CPU
-device = 0 if torch.cuda.is_available() else -1
 
-# Initialize the background removal pipeline
-pipe = pipeline(
-    "image-segmentation",
-    model="briaai/RMBG-1.4",
-    trust_remote_code=True,
-    device=device,
-    use_fast=True
-)
+@app.on_event("shutdown")
+async def shutdown():
+    if _embedding_batcher is not None:
+        await _embedding_batcher.close()
+    shutdown_executors()
+    if llm_client is not None:
+        await llm_client.aclose()
+    if result_cache is not None:
+        result_cache.close()
+    get_embedding_index().close()
 
-# Initialize OpenRouter client
-openai_client = None
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-if OPENROUTER_API_KEY:
-    openai_client = OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=OPENROUTER_API_KEY
-    )
+
+# Models are built on first use (or at startup with MODEL_LOADING=eager),
+# so importing this module stays fast and does not touch the network
+def load_embedding_service():
+    """Build the embedding service and give the index its type masks, when any pair maps to one."""
+    service = get_embedding_service()
+    type_space = service.type_space
+    get_embedding_index().set_type_space(type_space if type_space is not None and type_space.active else None)
+    return service
+
+
+segmentation_model = register_model("segmentation", load_segmentation_pipeline, warm_up_segmentation)
+embedding_model = register_model("embedding", load_embedding_service, warm_up_embedding)
+
+
+@app.on_event("startup")
+async def configure_runtime():
+    """Set torch threads (and CPU pinning) before any model runs; a serve worker has already done so."""
+    apply_runtime_config()
+
+
+@app.on_event("startup")
+async def start_model_warmup():
+    """In eager mode, load and warm up every model in the background; /ready reports progress."""
+    if eager_loading():
+        asyncio.get_running_loop().run_in_executor(None, warm_up_models)
+
+
+async def load_model(model):
+    """Return a loaded model, building it off the event loop on first use."""
+    if model.loaded:
+        return model.get()
+    return await asyncio.get_running_loop().run_in_executor(None, model.get)
+
+# Initialize OpenRouter client (shared async client with pooled connections)
+llm_client = create_llm_client()
+# Downscale/re-encode settings for images sent to the LLM
+llm_image_encoder = create_llm_image_encoder()
 
 
 # Pydantic models for responses
@@ -106,67 +197,241 @@ Return ONLY a valid JSON array of items. Example:
 If no clothing items are visible, return an empty array: []
 """
 
+# Several photos in one call: the instructions are paid for once per pack
+PACKED_EXTRACTION_PROMPT = """You are given {count} clothing/fashion images, labelled "Image 0" to "Image {last}".
+Analyze EACH image separately and extract all visible clothing items in it.
 
-def image_to_base64(image: Image.Image) -> str:
-    """Convert PIL Image to base64 string."""
-    buffered = io.BytesIO()
-    image.save(buffered, format="PNG")
-    return base64.b64encode(buffered.getvalue()).decode()
+For EACH distinct clothing item, provide:
+- category: One of "tops", "bottoms", "footwear", "accessories"
+- color: The primary color (use common color names like black, white, gray, red, blue, green, yellow, pink, purple, orange, brown, beige, navy)
+- name: A descriptive name for the item (e.g., "White Cotton T-Shirt", "Blue Denim Jeans")
+- brand: The brand name if visible/identifiable, otherwise null
+- material: The material if identifiable (e.g., cotton, linen, polyester, denim, leather), otherwise null
+- size: The size if visible on tags/labels, otherwise null
+- estimated_price: Estimated price in Vietnamese Dong (VND), otherwise null
 
+Return ONLY a valid JSON object with one key per image label ("0" to "{last}"), each mapping
+to the JSON array of items in that image. Use an empty array for an image with no clothing.
+Example for 2 images:
+{{
+  "0": [{{"category": "tops", "color": "white", "name": "White Cotton T-Shirt", "brand": null, "material": "cotton", "size": null, "estimated_price": 350000}}],
+  "1": []
+}}
+"""
 
-async def extract_attributes_from_image(image: Image.Image) -> list[ExtractedItem]:
-    """Use OpenRouter (Qwen) to extract clothing attributes from an image."""
-    if not openai_client:
-        raise HTTPException(
-            status_code=503,
-            detail="OpenRouter API not configured. Set OPENROUTER_API_KEY environment variable."
-        )
+# Images per packed extraction call in /batch/extract-attributes (1 disables packing)
+LLM_PACK_SIZE = max(1, env_int("LLM_PACK_SIZE", 1))
+
+# Images of a streamed embedding batch that are read, decoded and embedded at once
+STREAM_EMBEDDING_WINDOW = max(1, env_int("STREAM_EMBEDDING_WINDOW", 32))
+
+# JSON schema of one ExtractedItem, for providers that support structured output
+ITEM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "category": {"type": "string", "enum": ["tops", "bottoms", "footwear", "accessories"]},
+        "color": {"type": "string"},
+        "name": {"type": "string"},
+        "brand": {"type": ["string", "null"]},
+        "material": {"type": ["string", "null"]},
+        "size": {"type": ["string", "null"]},
+        "estimated_price": {"type": ["integer", "null"]},
+    },
+    "required": ["category", "color", "name", "brand", "material", "size", "estimated_price"],
+    "additionalProperties": False,
+}
+
+
+def items_response_format(keys: tuple[str, ...] = ("items",)) -> dict:
+    """
+    `response_format` asking for an object with an item array under each key.
+    Schemas need an object at the top level, so a single image's array goes under 'items'.
+    """
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "clothing_items",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {key: {"type": "array", "items": ITEM_SCHEMA} for key in keys},
+                "required": list(keys),
+                "additionalProperties": False,
+            },
+        },
+    }
 
-    try:
-        # Convert image to bytes for OpenRouter
-        img_bytes = io.BytesIO()
-        image.save(img_bytes, format="PNG")
-        img_bytes.seek(0)
-        base64_image = base64.b64encode(img_bytes.getvalue()).decode()
 
-        # Call OpenRouter with image
-        response = openai_client.chat.completions.create(
-            model="google/gemma-3-4b-it:free",
-            messages=[
+# ===========================================
+# RESULT CACHE
+# ===========================================
+
+# Content-addressed cache in front of every model (None when disabled)
+result_cache = get_result_cache()
+
+if result_cache is not None:
+    # Versions change with the model/prompt, which invalidates older entries.
+    # Cut-out keys also carry the output codec (see `remove_background_from_images`).
+    result_cache.register("cutout", version_key(
+        SEGMENTATION_MODEL, str(RMBG_INPUT_SIZE), quantization_mode("SEGMENTATION_QUANTIZATION")
+    ))
+    if llm_client is not None:
+        result_cache.register("attributes", version_key(
+            EXTRACTION_PROMPT, PACKED_EXTRACTION_PROMPT, json.dumps(ITEM_SCHEMA, sort_keys=True),
+            llm_client.model, llm_image_encoder.version
+        ))
+
+
+@stage("cache")
+def cache_lookup(namespace: str, image: Image.Image, variant: str = "") -> tuple[str, Optional[bytes]]:
+    """Hash the image pixels and look the result up (CPU-bound)."""
+    key = content_key(image)
+    if variant:
+        key = f"{key}:{variant}"
+    return key, result_cache.get(namespace, key)
+
+
+async def cached_result(namespace: str,
+                        image: Image.Image,
+                        variant: str = "") -> tuple[Optional[str], Optional[bytes]]:
+    """
+    Return (cache key, cached value) for an image; (None, None) when caching is off.
+    `variant` separates results of the same image that differ by request options.
+    """
+    if result_cache is None:
+        return None, None
+    return await get_executor("cpu").run(cache_lookup, namespace, image, variant)
+
+
+def store_result(namespace: str, key: Optional[str], value: bytes):
+    """Store a result under a key returned by `cached_result`."""
+    if result_cache is not None and key is not None:
+        result_cache.set(namespace, key, value)
+
+
+@stage("decode")
+def decode_image(contents: bytes, mode: Optional[str] = None) -> Image.Image:
+    """Decode uploaded bytes into a fully loaded PIL Image (CPU-bound)."""
+    image = Image.open(io.BytesIO(contents))
+    if mode and image.mode != mode:
+        return image.convert(mode)
+    image.load()
+    return image
+
+
+async def keep_uploads(files: list[UploadFile]) -> list[UploadFile]:
+    """
+    Take over the spooled files of uploads that a streamed response reads later:
+    FastAPI before 0.118 closes the form's files before the response body runs.
+
+    Nothing is copied: Starlette spools each upload to disk past 1 MB, and the form
+    is left holding empty placeholders. The caller closes the returned files.
+    """
+    kept = []
+    for file in files:
+        kept.append(UploadFile(file.file, size=file.size, filename=file.filename, headers=file.headers))
+        file.file = io.BytesIO()
+    return kept
+
+
+async def close_uploads(files: list[UploadFile]):
+    for file in files:
+        await file.close()
+
+
+async def decode_upload(file: UploadFile, mode: Optional[str] = None) -> Image.Image:
+    """Read an upload and decode it on the CPU pool."""
+    contents = await file.read()
+    return await get_executor("cpu").run(decode_image, contents, mode)
+
+
+async def decode_embedding_upload(file: UploadFile) -> Image.Image:
+    """Read an upload for embedding; JPEGs are decoded at reduced size (draft mode)."""
+    contents = await file.read()
+    return await get_executor("cpu").run(decode_for_embedding, contents)
+
+
+async def decode_llm_upload(file: UploadFile) -> Image.Image:
+    """Read an upload for the LLM: upright, RGB and downscaled to LLM_IMAGE_MAX_SIDE."""
+    contents = await file.read()
+    return await get_executor("cpu").run(llm_image_encoder.decode, contents)
+
+
+def parse_extracted_items(values) -> tuple[list[ExtractedItem], int]:
+    """
+    Validate extracted items one by one; accepts a bare array or {"items": [...]}.
+    Returns (valid items, number of invalid items dropped).
+    """
+    if isinstance(values, dict) and "items" in values:
+        values = values["items"]
+    return validate_items(ExtractedItem, values)
+
+
+def extraction_messages(image_url: str) -> list[dict]:
+    """Chat messages asking for the items in one image."""
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": EXTRACTION_PROMPT},
                 {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": EXTRACTION_PROMPT},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{base64_image}"
-                            }
-                        }
-                    ]
+                    "type": "image_url",
+                    "image_url": {
+                        "url": image_url
+                    }
                 }
             ]
-        )
+        }
+    ]
 
-        response_text = response.choices[0].message.content
 
+def cache_items(cache_key: Optional[str], items: list[ExtractedItem]):
+    store_result("attributes", cache_key, json.dumps([item.model_dump() for item in items]).encode())
 
-        # Parse JSON response
-        response_text = response_text.strip()
-        # Handle markdown code blocks
-        if response_text.startswith("```"):
-            response_text = response_text.split("```")[1]
-            if response_text.startswith("json"):
-                response_text = response_text[4:]
-            response_text = response_text.strip()
 
-        items_data = json.loads(response_text)
-        return [ExtractedItem(**item) for item in items_data]
+async def extract_attributes_from_image(image: Image.Image) -> list[ExtractedItem]:
+    """
+    Use OpenRouter (Qwen) to extract clothing attributes from an image.
+    The image should come from `decode_llm_upload`.
+    """
+    if not llm_client:
+        raise HTTPException(
+            status_code=503,
+            detail="OpenRouter API not configured. Set OPENROUTER_API_KEY environment variable."
+        )
 
-    except json.JSONDecodeError as e:
+    try:
+        cache_key, cached = await cached_result("attributes", image)
+        if cached is not None:
+            return [ExtractedItem(**item) for item in json.loads(cached)]
+
+        # Re-encode compactly (JPEG/WebP) for OpenRouter
+        image_url = await get_executor("cpu").run(llm_image_encoder.encode, image)
+
+        # Call OpenRouter with image
+        with stage("llm"):
+            response = await llm_client.chat(
+                messages=extraction_messages(image_url),
+                response_format=items_response_format(),
+            )
+
+        # Salvage what we can from prose, trailing commas, truncation or bad items
+        values, repaired = parse_json_reply(response.choices[0].message.content)
+        items, dropped = parse_extracted_items(values)
+        if repaired or dropped:
+            log("Extraction", f"Recovered {len(items)} items from a malformed reply", level="warning",
+                dropped=dropped)
+        else:
+            # Only complete replies are cached; a partial one is retried next time
+            cache_items(cache_key, items)
+        return items
+
+    except ServiceSaturated:
+        raise
+    except ValueError as e:
         raise HTTPException(
             status_code=500,
-            detail=f"Failed to parse Gemini response: {str(e)}"
+            detail=f"Failed to parse model response: {str(e)}"
         )
     except Exception as e:
         raise HTTPException(
@@ -175,13 +440,167 @@ async def extract_attributes_from_image(image: Image.Image) -> list[ExtractedIte
         )
 
 
-async def remove_background_from_image(image: Image.Image) -> bytes:
-    """Remove background from image using the segmentation pipeline."""
-    result_image = pipe(image)
-    img_byte_arr = io.BytesIO()
-    result_image.save(img_byte_arr, format="PNG")
-    img_byte_arr.seek(0)
-    return img_byte_arr.getvalue()
+async def stream_extracted_items(image: Image.Image):
+    """
+    Yield each extracted item as soon as the model has finished writing it.
+    Failures after the stream has started are reported as a final {"error": ...} line.
+    """
+    try:
+        cache_key, cached = await cached_result("attributes", image)
+        if cached is not None:
+            for item in json.loads(cached):
+                yield ExtractedItem(**item)
+            return
+
+        image_url = await get_executor("cpu").run(llm_image_encoder.encode, image)
+        parser = IncrementalArrayParser()
+        items, dropped = [], 0
+        with stage("llm"):
+            async for text in llm_client.chat_stream(
+                messages=extraction_messages(image_url),
+                response_format=items_response_format(),
+            ):
+                valid, invalid = validate_items(ExtractedItem, parser.feed(text))
+                dropped += invalid
+                for item in valid:
+                    items.append(item)
+                    yield item
+
+        if parser.done and not dropped:
+            cache_items(cache_key, items)
+        else:
+            log("Extraction", f"Streamed {len(items)} items from an incomplete reply", level="warning",
+                dropped=dropped)
+    except Exception as e:
+        yield {"error": str(e)}
+
+
+def parse_packed_items(response_text: str, count: int) -> tuple[list[Optional[list[ExtractedItem]]], bool]:
+    """
+    Split a packed reply into per-image item lists.
+    An image whose entry is missing or not an array gets None, so it can be retried alone.
+
+    Returns:
+        (item lists, whether the reply parsed cleanly with no invalid items)
+    """
+    try:
+        data, repaired = parse_json_reply(response_text, opener="{")
+    except ValueError:
+        return [None] * count, False
+    if not isinstance(data, dict):
+        return [None] * count, False
+
+    results, clean = [], not repaired
+    for position in range(count):
+        try:
+            items, dropped = validate_items(ExtractedItem, data.get(str(position)))
+        except ValueError:
+            results.append(None)
+            continue
+        results.append(items)
+        clean = clean and not dropped
+    return results, clean
+
+
+async def extract_attributes_packed(images: list[Image.Image]) -> list[Optional[list[ExtractedItem]]]:
+    """
+    Extract attributes for several images with one LLM call.
+    Cached images are not sent. Returns one item list per image, or None for an
+    image the packed reply did not answer validly; API errors are raised.
+    """
+    if not llm_client:
+        raise HTTPException(
+            status_code=503,
+            detail="OpenRouter API not configured. Set OPENROUTER_API_KEY environment variable."
+        )
+
+    lookups = await asyncio.gather(*(cached_result("attributes", image) for image in images))
+    results = [
+        None if cached is None else [ExtractedItem(**item) for item in json.loads(cached)]
+        for _, cached in lookups
+    ]
+    misses = [i for i, result in enumerate(results) if result is None]
+    if not misses:
+        return results
+
+    cpu_executor = get_executor("cpu")
+    image_urls = await asyncio.gather(*(cpu_executor.run(llm_image_encoder.encode, images[i]) for i in misses))
+    content = [{
+        "type": "text",
+        "text": PACKED_EXTRACTION_PROMPT.format(count=len(misses), last=len(misses) - 1),
+    }]
+    for position, image_url in enumerate(image_urls):
+        content.append({"type": "text", "text": f"Image {position}:"})
+        content.append({"type": "image_url", "image_url": {"url": image_url}})
+
+    with stage("llm"):
+        response = await llm_client.chat(
+            messages=[{"role": "user", "content": content}],
+            response_format=items_response_format(tuple(str(position) for position in range(len(misses)))),
+        )
+    parsed, clean = parse_packed_items(response.choices[0].message.content, len(misses))
+
+    for i, items in zip(misses, parsed):
+        results[i] = items
+        if items is not None and clean:
+            cache_items(lookups[i][0], items)
+    return results
+
+
+def segment_images(images: list[Image.Image]) -> list[np.ndarray]:
+    """Predict alpha mattes with batched RMBG-1.4 forward passes (CPU-bound)."""
+    pipe = segmentation_model.get()
+    return predict_masks(pipe.model, images, pipe.device)
+
+
+async def remove_background_from_images(images: list[Image.Image],
+                                        codec: OutputCodec = PNG_CODEC) -> list[bytes]:
+    """
+    Remove background from several RGB images.
+    Returns one encoded cut-out (or alpha matte, for the 'mask' codec) per image.
+    """
+    lookups = await asyncio.gather(*(cached_result("cutout", image, codec.cache_tag) for image in images))
+    outputs = [cached for _, cached in lookups]
+
+    # Only images not seen before go through the model
+    misses = [i for i, output in enumerate(outputs) if output is None]
+    if misses:
+        masks = await get_executor("segmentation").run(
+            segment_images, [images[i] for i in misses]
+        )
+        # Compositing and encoding run on the CPU pool, off the model workers
+        cpu_executor = get_executor("cpu")
+        encoded = await asyncio.gather(
+            *(cpu_executor.run(codec.encode, images[i], mask) for i, mask in zip(misses, masks))
+        )
+        for i, output in zip(misses, encoded):
+            outputs[i] = output
+            store_result("cutout", lookups[i][0], output)
+
+    return outputs
+
+
+async def remove_background_from_image(image: Image.Image, codec: OutputCodec = PNG_CODEC) -> bytes:
+    """Remove background from image using the segmentation model."""
+    return (await remove_background_from_images([image], codec))[0]
+
+
+def output_codec(format: str = "png",
+                 quality: Optional[int] = None,
+                 lossless: bool = False,
+                 compress_level: Optional[int] = None,
+                 method: Optional[int] = None) -> OutputCodec:
+    """Cut-out codec from the request's query parameters (a FastAPI dependency)."""
+    try:
+        return OutputCodec(format, quality, lossless, compress_level, method)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def output_filename(filename: Optional[str], codec: OutputCodec) -> str:
+    """Name of a cut-out file, with the extension of its output format."""
+    stem = os.path.splitext(filename or "image")[0]
+    return f"nobg_{stem}.{codec.extension}"
 
 
 @app.get("/")
@@ -189,7 +608,7 @@ async def root():
     return {
         "message": "AI Service is running",
         "features": ["background-removal", "attribute-extraction", "fashion-embedding"],
-        "ai_configured": openai_client is not None,
+        "ai_configured": llm_client is not None,
         "embedding_service": "active"
     }
 
@@ -198,32 +617,213 @@ async def root():
 async def health():
     return {
         "status": "healthy", 
-        "ai_configured": openai_client is not None,
+        "ai_configured": llm_client is not None,
         "embedding_service": "active"
     }
 
 
+@app.get("/ready")
+async def ready():
+    """
+    Readiness probe: which models are loaded and how long each took, whether
+    type-aware scoring is active, and the effective torch threading settings.
+    With MODEL_LOADING=eager this is 503 until warm-up has finished.
+    """
+    is_ready = models_ready()
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={
+            "ready": is_ready,
+            "loading": "eager" if eager_loading() else "lazy",
+            "models": get_model_status(),
+            "type_space": type_space_status(),
+            "runtime": get_runtime_config(),
+        }
+    )
+
+
+def type_space_status() -> dict:
+    """Whether category pairs are scored in their own subspaces (known once the embedding model is loaded)."""
+    if not embedding_model.loaded:
+        return {"loaded": False, "typespaces_configured": typespaces_configured()}
+    type_space = embedding_model.get().type_space
+    return {
+        "loaded": True,
+        "active": type_space is not None and type_space.active,
+        "conditions": type_space.n_conditions if type_space is not None else 0,
+        "pairs": len(type_space.typespaces) if type_space is not None else 0,
+    }
+
+
+@app.get("/stats/executors")
+async def executor_stats():
+    """Concurrency limits, in-flight jobs and rejections for each inference pool."""
+    return get_executor_stats()
+
+
+@app.get("/stats/cache")
+async def cache_stats():
+    """Hit/miss/eviction counters for the result cache."""
+    if result_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **result_cache.get_stats()}
+
+
+@app.get("/stats/llm")
+async def llm_stats():
+    """Call, retry and failure counts for the shared OpenRouter client."""
+    if llm_client is None:
+        return {"configured": False}
+    return {"configured": True, **llm_client.get_stats()}
+
+
+def collect_service_metrics() -> list:
+    """Pool, model, batcher, cache and LLM counters for /metrics, read at scrape time."""
+    executors = get_executor_stats()
+    models = get_model_status()
+    families = [
+        ("executor_in_flight", "gauge", "Jobs running or queued in each inference pool.",
+         stat_samples(executors, "in_flight", "pool")),
+        ("executor_capacity", "gauge", "Workers plus queue slots of each inference pool.",
+         [({"pool": name}, s["max_workers"] + s["max_queue"]) for name, s in executors.items()]),
+        ("executor_completed_total", "counter", "Jobs finished by each inference pool.",
+         stat_samples(executors, "completed", "pool")),
+        ("executor_rejected_total", "counter", "Jobs rejected with 503 because a pool was full.",
+         stat_samples(executors, "rejected", "pool")),
+        ("model_loaded", "gauge", "Whether each model is loaded.",
+         [({"model": name}, float(s["loaded"])) for name, s in models.items()]),
+        ("model_load_seconds", "gauge", "Time each model took to load.",
+         stat_samples(models, "load_seconds", "model")),
+        ("model_warmup_seconds", "gauge", "Time each model's warm-up inference took.",
+         stat_samples(models, "warmup_seconds", "model")),
+    ]
+
+    if _embedding_batcher is not None:
+        batcher = {"embedding": _embedding_batcher.get_stats()}
+        families += [
+            ("batcher_queue_depth", "gauge", "Requests waiting for a micro-batch.",
+             stat_samples(batcher, "queue_depth", "batcher")),
+            ("batcher_requests_total", "counter", "Requests submitted to the micro-batcher.",
+             stat_samples(batcher, "requests", "batcher")),
+            ("batcher_batches_total", "counter", "Batched forward passes run.",
+             stat_samples(batcher, "batches", "batcher")),
+            ("batcher_rejected_total", "counter", "Requests rejected because the batch queue was full.",
+             stat_samples(batcher, "rejected", "batcher")),
+        ]
+
+    if result_cache is not None:
+        cache = result_cache.get_stats()
+        namespaces = cache["namespaces"]
+        families += [
+            ("cache_hits_total", "counter", "Result cache hits (memory or disk).",
+             stat_samples(namespaces, "hits", "namespace")),
+            ("cache_disk_hits_total", "counter", "Result cache hits served from the sqlite tier.",
+             stat_samples(namespaces, "disk_hits", "namespace")),
+            ("cache_misses_total", "counter", "Result cache misses.",
+             stat_samples(namespaces, "misses", "namespace")),
+            ("cache_evictions_total", "counter", "Entries evicted from the memory tier.",
+             stat_samples(namespaces, "evictions", "namespace")),
+            ("cache_memory_bytes", "gauge", "Bytes held in the memory tier.", [({}, cache["memory_bytes"])]),
+            ("cache_memory_entries", "gauge", "Entries held in the memory tier.", [({}, cache["memory_entries"])]),
+        ]
+
+    if llm_client is not None:
+        llm = llm_client.get_stats()
+        families += [
+            ("llm_calls_total", "counter", "OpenRouter call attempts.", [({}, llm["calls"])]),
+            ("llm_retries_total", "counter", "OpenRouter calls retried after a transient error.",
+             [({}, llm["retries"])]),
+            ("llm_failures_total", "counter", "OpenRouter calls that failed after all retries.",
+             [({}, llm["failures"])]),
+            ("llm_tokens_total", "counter", "Tokens reported by OpenRouter.",
+             [({"kind": "prompt"}, llm["prompt_tokens"]), ({"kind": "completion"}, llm["completion_tokens"])]),
+        ]
+    return families
+
+
+REGISTRY.register_collector(collect_service_metrics)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: request and per-stage latency histograms, pools, cache, models and LLM."""
+    return Response(content=REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Admin endpoints are hidden (404) unless ADMIN_TOKEN is set, and need it as X-Admin-Token."""
+    expected = os.getenv("ADMIN_TOKEN", "")
+    if not expected:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token.encode(), expected.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+class ProfileRequest(BaseModel):
+    """Request to profile the next requests to one endpoint."""
+    endpoint: str
+    count: int = 1
+    python: bool = True
+    torch: bool = True
+    min_latency_ms: Optional[float] = None
+    sample_rate: float = 1.0
+    ttl_seconds: float = 600
+
+
+@app.post("/admin/profile", dependencies=[Depends(require_admin)])
+async def start_profiling(request: ProfileRequest):
+    """
+    Profile the next `count` requests to `endpoint` with cProfile and torch.profiler.
+
+    With `min_latency_ms`, matching requests are profiled until `count` of them
+    were at least that slow. Replaces any running session.
+    """
+    routes = {getattr(route, "path", None) for route in app.routes}
+    if request.endpoint not in routes or request.endpoint.startswith("/admin"):
+        raise HTTPException(status_code=400, detail=f"Unknown endpoint: {request.endpoint}")
+    try:
+        session = ProfileSession(**request.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return get_profiler().start(session)
+
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)])
+async def profiling_status():
+    """The running profiling session and the captures written to PROFILE_DIR."""
+    return get_profiler().status()
+
+
+@app.delete("/admin/profile", dependencies=[Depends(require_admin)])
+async def stop_profiling():
+    """End the running profiling session."""
+    return {"stopped": get_profiler().stop()}
+
+
 @app.post("/remove-bg")
-async def remove_background(file: UploadFile = File(...)):
+async def remove_background(file: UploadFile = File(...),
+                            codec: OutputCodec = Depends(output_codec)):
     """
     Remove background from uploaded image.
-    Returns the processed image as PNG with transparent background.
+    Returns the processed image as PNG with transparent background, or in the
+    format chosen with `?format=webp|avif|mask` (see README, "Cut-out output formats").
     """
     if not file.content_type or not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
 
     try:
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
-        result_bytes = await remove_background_from_image(image)
+        image = await decode_upload(file, mode="RGB")
+        result_bytes = await remove_background_from_image(image, codec)
 
         return Response(
             content=result_bytes,
-            media_type="image/png",
+            media_type=codec.media_type,
             headers={
-                "Content-Disposition": f"attachment; filename=nobg_{file.filename}"
+                "Content-Disposition": f"attachment; filename={output_filename(file.filename, codec)}"
             }
         )
+    except ServiceSaturated:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -232,21 +832,32 @@ async def remove_background(file: UploadFile = File(...)):
 
 
 @app.post("/extract-attributes", response_model=ExtractionResponse)
-async def extract_attributes(file: UploadFile = File(...)):
+async def extract_attributes(request: Request,
+                             file: UploadFile = File(...),
+                             stream: bool = False):
     """
     Extract clothing item attributes from an image using OpenRouter/Qwen AI.
     Can detect multiple items in a single image.
+    With `?stream=true` each item is sent as an NDJSON line while the model is
+    still generating the rest.
     """
     if not file.content_type or not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
 
     try:
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
+        image = await decode_llm_upload(file)
+        if wants_stream(request, stream):
+            if not llm_client:
+                raise HTTPException(
+                    status_code=503,
+                    detail="OpenRouter API not configured. Set OPENROUTER_API_KEY environment variable."
+                )
+            return ndjson_response(stream_extracted_items(image))
+
         items = await extract_attributes_from_image(image)
 
         return ExtractionResponse(items=items, image_index=0)
-    except HTTPException:
+    except (HTTPException, ServiceSaturated):
         raise
     except Exception as e:
         raise HTTPException(
@@ -255,70 +866,231 @@ async def extract_attributes(file: UploadFile = File(...)):
         )
 
 
-@app.post("/batch/remove-bg")
-async def batch_remove_background(files: list[UploadFile] = File(...)):
+async def remove_background_items(files: list[tuple[int, UploadFile]],
+                                  codec: OutputCodec = PNG_CODEC) -> list[dict]:
     """
-    Batch background removal for multiple images.
-    Returns a list of processed images as base64-encoded PNGs.
+    Decode and cut out (index, upload) pairs with batched forward passes.
+    Returns one result dict per file, in input order; successful items carry
+    the raw encoded bytes in 'data' (see `base64_item` for JSON output).
     """
-    results = []
+    results = {}
+    images = []
+    image_indices = []
 
-    for idx, file in enumerate(files):
+    for idx, file in files:
         if not file.content_type or not file.content_type.startswith("image/"):
-            results.append({
+            results[idx] = {
                 "index": idx,
                 "filename": file.filename,
                 "success": False,
                 "error": "File must be an image"
-            })
+            }
             continue
 
         try:
-            contents = await file.read()
-            image = Image.open(io.BytesIO(contents))
-            result_bytes = await remove_background_from_image(image)
-
-            results.append({
-                "index": idx,
-                "filename": file.filename,
-                "success": True,
-                "data": base64.b64encode(result_bytes).decode()
-            })
+            images.append(await decode_upload(file, mode="RGB"))
+            image_indices.append(idx)
+        except ServiceSaturated:
+            raise
         except Exception as e:
-            results.append({
+            results[idx] = {
                 "index": idx,
                 "filename": file.filename,
                 "success": False,
                 "error": str(e)
-            })
+            }
+
+    if images:
+        try:
+            outputs = await remove_background_from_images(images, codec)
+        except ServiceSaturated:
+            raise
+        except Exception as e:
+            outputs = [e] * len(images)
+
+        filenames = {idx: file.filename for idx, file in files}
+        for idx, output in zip(image_indices, outputs):
+            if isinstance(output, Exception):
+                results[idx] = {
+                    "index": idx,
+                    "filename": filenames[idx],
+                    "success": False,
+                    "error": str(output)
+                }
+            else:
+                results[idx] = {
+                    "index": idx,
+                    "filename": filenames[idx],
+                    "success": True,
+                    "media_type": codec.media_type,
+                    "data": output
+                }
+
+    return [results[idx] for idx, _ in files]
+
 
-    return {"results": results, "total": len(files)}
+def base64_item(item: dict) -> dict:
+    """JSON-safe copy of a cut-out result, with the PNG bytes base64-encoded."""
+    if "data" not in item:
+        return item
+    return {**item, "data": base64.b64encode(item["data"]).decode()}
+
+
+async def stream_remove_background(files: list[UploadFile], codec: OutputCodec = PNG_CODEC):
+    """
+    Cut out one segmentation batch at a time and yield each result as it is done.
+    Only one chunk of upload bytes, decoded images and PNGs is held in memory at
+    once; each chunk's uploads are closed as soon as it is done.
+    """
+    indexed = list(enumerate(files))
+    try:
+        for start in range(0, len(indexed), SEGMENTATION_BATCH_SIZE):
+            chunk = indexed[start:start + SEGMENTATION_BATCH_SIZE]
+            try:
+                items = await remove_background_items(chunk, codec)
+            except ServiceSaturated as e:
+                # Headers are already sent, so report saturation per item
+                items = [
+                    {"index": idx, "filename": file.filename, "success": False, "error": str(e)}
+                    for idx, file in chunk
+                ]
+            finally:
+                await close_uploads([file for _, file in chunk])
+            for item in items:
+                yield item
+    finally:
+        # The client may disconnect mid-stream
+        await close_uploads(files)
+
+
+@app.post("/batch/remove-bg")
+async def batch_remove_background(request: Request,
+                                  files: list[UploadFile] = File(...),
+                                  stream: bool = False,
+                                  codec: OutputCodec = Depends(output_codec)):
+    """
+    Batch background removal for multiple images.
+    All valid images go through RMBG-1.4 together in batched forward passes.
+    Returns a list of processed images as base64-encoded PNGs, NDJSON
+    (one result per line, as soon as ready) with `?stream=true`, or raw image
+    parts with `Accept: multipart/mixed`. `?format=` selects the output codec
+    as for /remove-bg.
+
+    Streamed responses read the spooled uploads (in memory up to 1 MB each, on
+    disk beyond) one segmentation batch at a time, so peak memory is bounded by
+    SEGMENTATION_BATCH_SIZE images rather than by the request size.
+    """
+    if accepts(request, MULTIPART_MEDIA_TYPE):
+        # Parts are written one segmentation batch at a time
+        return multipart_response(stream_remove_background(await keep_uploads(files), codec))
+
+    if wants_stream(request, stream):
+        files = await keep_uploads(files)
+
+        async def json_items():
+            async for item in stream_remove_background(files, codec):
+                yield base64_item(item)
+
+        return ndjson_response(json_items())
+
+    results = await remove_background_items(list(enumerate(files)), codec)
+    return {"results": [base64_item(item) for item in results], "total": len(files)}
 
 
 @app.post("/batch/extract-attributes", response_model=BatchExtractionResponse)
-async def batch_extract_attributes(files: list[UploadFile] = File(...)):
+async def batch_extract_attributes(request: Request,
+                                   files: list[UploadFile] = File(...),
+                                   stream: bool = False):
     """
     Batch attribute extraction for multiple images.
-    Each image can contain multiple items.
+    Each image can contain multiple items. Near-identical shots (by perceptual
+    hash) are sent to the LLM once and share the result. With LLM_PACK_SIZE > 1,
+    that many images go into each LLM call.
+    With `?stream=true` each image's result is sent as an NDJSON line as soon as it is ready.
     """
-    results = []
-    total_items = 0
-
-    for idx, file in enumerate(files):
+    async def prepare_one(idx: int, file: UploadFile) -> tuple[Optional[Image.Image], Optional[int]]:
         if not file.content_type or not file.content_type.startswith("image/"):
-            results.append(ExtractionResponse(items=[], image_index=idx))
-            continue
+            return None, None
 
         try:
-            contents = await file.read()
-            image = Image.open(io.BytesIO(contents))
-            items = await extract_attributes_from_image(image)
-            total_items += len(items)
-            results.append(ExtractionResponse(items=items, image_index=idx))
+            image = await decode_llm_upload(file)
+            return image, await get_executor("cpu").run(dhash, image)
+        except ServiceSaturated:
+            raise
+        except Exception as e:
+            log("Extraction", f"Failed to decode image {idx}: {e}", level="error", image_index=idx)
+            return None, None
+
+    prepared = await asyncio.gather(*(prepare_one(idx, file) for idx, file in enumerate(files)))
+    groups = duplicate_groups([hash_ for _, hash_ in prepared], llm_image_encoder.dedupe_max_distance)
+    # Images that are not in any group failed to decode
+    unsent = [idx for idx, (image, _) in enumerate(prepared) if image is None]
+
+    reps = list(groups)
+    packs = [reps[i:i + LLM_PACK_SIZE] for i in range(0, len(reps), LLM_PACK_SIZE)]
+
+    def group_responses(rep: int, items: list[ExtractedItem]) -> list[ExtractionResponse]:
+        return [ExtractionResponse(items=items, image_index=idx) for idx in groups[rep]]
+
+    async def extract_group(rep: int) -> list[ExtractionResponse]:
+        try:
+            items = await extract_attributes_from_image(prepared[rep][0])
+        except ServiceSaturated:
+            raise
         except Exception as e:
             # Log error but continue with other images
-            print(f"Error processing image {idx}: {str(e)}")
-            results.append(ExtractionResponse(items=[], image_index=idx))
+            log("Extraction", f"Failed to extract image {rep}: {e}", level="error", image_index=rep)
+            items = []
+        return group_responses(rep, items)
+
+    async def extract_pack(pack: list[int]) -> list[ExtractionResponse]:
+        if len(pack) == 1:
+            return await extract_group(pack[0])
+
+        try:
+            packed = await extract_attributes_packed([prepared[rep][0] for rep in pack])
+        except ServiceSaturated:
+            raise
+        except Exception as e:
+            log("Extraction", f"Failed to extract images {pack}: {e}", level="error", image_indices=pack)
+            # Fall back to one call per image below rather than reporting no items
+            packed = [None] * len(pack)
+
+        responses = []
+        for rep, items in zip(pack, packed):
+            if items is not None:
+                responses.extend(group_responses(rep, items))
+        # Images the packed reply did not answer validly are retried one call each
+        retries = [rep for rep, items in zip(pack, packed) if items is None]
+        if retries:
+            log("Extraction", f"No valid packed result for images {retries}, retrying individually",
+                level="warning", image_indices=retries)
+            for group in await asyncio.gather(*(extract_group(rep) for rep in retries)):
+                responses.extend(group)
+        return responses
+
+    if wants_stream(request, stream):
+        async def stream_pack(pack: list[int]) -> list[ExtractionResponse]:
+            try:
+                return await extract_pack(pack)
+            except ServiceSaturated:
+                return [response for rep in pack for response in group_responses(rep, [])]
+
+        async def responses():
+            for idx in unsent:
+                yield ExtractionResponse(items=[], image_index=idx)
+            async for group in as_completed(stream_pack(pack) for pack in packs):
+                for response in group:
+                    yield response
+
+        return ndjson_response(responses())
+
+    # Fan out all LLM calls at once; the shared client bounds concurrency
+    results = [ExtractionResponse(items=[], image_index=idx) for idx in range(len(files))]
+    for group in await asyncio.gather(*(extract_pack(pack) for pack in packs)):
+        for response in group:
+            results[response.image_index] = response
+    total_items = sum(len(result.items) for result in results)
 
     return BatchExtractionResponse(results=results, total_items=total_items)
 
@@ -349,10 +1121,14 @@ class BatchEmbeddingResponse(BaseModel):
     successful: int
 
 
+# Embeddings may be sent as float lists or as base64 of little-endian float32 bytes
+EmbeddingInput = Union[list[float], str]
+
+
 class CompatibilityRequest(BaseModel):
     """Request for compatibility scoring."""
-    embedding1: list[float]
-    embedding2: list[float]
+    embedding1: EmbeddingInput
+    embedding2: EmbeddingInput
 
 
 class CompatibilityResponse(BaseModel):
@@ -362,10 +1138,20 @@ class CompatibilityResponse(BaseModel):
 
 
 class FindCompatibleRequest(BaseModel):
-    """Request to find compatible items."""
-    target_embedding: list[float]
-    candidates: list[dict]
+    """
+    Request to find compatible items.
+    Candidates are either a list of {'id', 'embedding', ...} dicts, or a packed
+    base64 float32 matrix (one row per candidate) plus the matching ids.
+    """
+    target_embedding: EmbeddingInput
+    candidates: list[dict] = []
+    candidate_ids: Optional[list[Union[str, int]]] = None
+    candidate_matrix: Optional[str] = None
     top_k: int = 5
+    # Score in the type-specific subspace of this category pair (e.g. 'tops' / 'footwear');
+    # a candidate's own 'category' overrides candidate_category
+    target_category: Optional[str] = None
+    candidate_category: Optional[str] = None
 
 
 class FindCompatibleResponse(BaseModel):
@@ -373,26 +1159,87 @@ class FindCompatibleResponse(BaseModel):
     results: list[dict]
 
 
+# Coalesces concurrent /generate-embedding calls into batched forward passes
+_embedding_batcher: Optional[MicroBatcher] = None
+
+
+def get_embedding_batcher() -> MicroBatcher:
+    """Get or create the micro-batching scheduler for embedding generation."""
+    global _embedding_batcher
+
+    if _embedding_batcher is None:
+        embedding_service = embedding_model.get()
+        executor = get_executor("embedding")
+        # The batcher queue is the admission point for the embedding pool
+        _embedding_batcher = MicroBatcher(
+            batch_fn=embedding_service.generate_embeddings_batch,
+            max_batch_size=env_int("EMBEDDING_BATCH_MAX_SIZE", 16),
+            max_wait_ms=env_float("EMBEDDING_BATCH_MAX_WAIT_MS", 5.0),
+            executor=executor,
+            max_queue=executor.max_queue,
+            name="embedding",
+        )
+        if result_cache is not None:
+            result_cache.register(
+                "embedding", version_key(embedding_service.model_version, PREPROCESSING_VERSION)
+            )
+
+    return _embedding_batcher
+
+
+async def embed_image(image: Image.Image) -> list[float]:
+    """Generate an embedding through the cache and the micro-batching scheduler."""
+    await load_model(embedding_model)
+    batcher = get_embedding_batcher()
+    cache_key, cached = await cached_result("embedding", image)
+    if cached is not None:
+        return np.frombuffer(cached, dtype=np.float32).tolist()
+
+    # Waiting for a batch plus the shared forward pass (itself recorded as background stages)
+    with stage("embed"):
+        if current_profile() is not None:
+            # A profiled request runs its own forward pass, so it lands in its profile
+            embedding = (await get_executor("embedding").run(batcher.batch_fn, [image]))[0]
+        else:
+            embedding = await batcher.submit(image)
+    store_result("embedding", cache_key, np.asarray(embedding, dtype=np.float32).tobytes())
+    return embedding
+
+
+@app.get("/stats/embedding-batcher")
+async def embedding_batcher_stats():
+    """Queue depth and batch-size histograms for the embedding scheduler."""
+    if _embedding_batcher is None:
+        return {"name": "embedding", "active": False}
+    return {"active": True, **_embedding_batcher.get_stats()}
+
+
 @app.post("/generate-embedding", response_model=EmbeddingResponse)
-async def generate_embedding(file: UploadFile = File(...)):
+async def generate_embedding(request: Request, file: UploadFile = File(...)):
     """
     Generate a 64-dimensional fashion embedding for an image.
     Uses ResNet-18 backbone trained on fashion compatibility.
+    With `Accept: application/octet-stream` the embedding is returned as
+    packed little-endian float32 bytes instead of JSON.
     """
     if not file.content_type or not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
 
     try:
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
-        
-        embedding_service = get_embedding_service()
-        embedding = embedding_service.generate_embedding(image)
+        # Decode here so a corrupt upload fails alone instead of inside a shared batch
+        image = await decode_embedding_upload(file)
         
+        embedding = await embed_image(image)
+
+        if accepts(request, FLOAT32_MEDIA_TYPE):
+            return float32_response([embedding])
+
         return EmbeddingResponse(
             embedding=embedding,
             dimensions=len(embedding)
         )
+    except ServiceSaturated:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -401,45 +1248,77 @@ async def generate_embedding(file: UploadFile = File(...)):
 
 
 @app.post("/batch/generate-embedding", response_model=BatchEmbeddingResponse)
-async def batch_generate_embedding(files: list[UploadFile] = File(...)):
+async def batch_generate_embedding(request: Request,
+                                   files: list[UploadFile] = File(...),
+                                   stream: bool = False):
     """
     Generate embeddings for multiple images in batch.
     More efficient than calling single endpoint multiple times.
+    With `?stream=true` each embedding is sent as an NDJSON line as soon as it is ready;
+    the spooled uploads (in memory up to 1 MB each, on disk beyond) are then read at most
+    STREAM_EMBEDDING_WINDOW at a time, which bounds the bytes and decoded images held.
+    With `Accept: application/octet-stream` the result is one packed (N, 64)
+    little-endian float32 matrix in input order; failed rows are zero-filled
+    and listed in the X-Failed-Indices header.
     """
-    results = []
-    successful = 0
-    
-    embedding_service = get_embedding_service()
-    
-    for idx, file in enumerate(files):
+    async def embed_one(idx: int, file: UploadFile) -> BatchEmbeddingItem:
         if not file.content_type or not file.content_type.startswith("image/"):
-            results.append(BatchEmbeddingItem(
+            return BatchEmbeddingItem(
                 index=idx,
                 filename=file.filename,
                 success=False,
                 error="File must be an image"
-            ))
-            continue
-        
+            )
+
         try:
-            contents = await file.read()
-            image = Image.open(io.BytesIO(contents))
-            embedding = embedding_service.generate_embedding(image)
-            
-            results.append(BatchEmbeddingItem(
+            image = await decode_embedding_upload(file)
+            embedding = await embed_image(image)
+
+            return BatchEmbeddingItem(
                 index=idx,
                 filename=file.filename,
                 success=True,
                 embedding=embedding
-            ))
-            successful += 1
+            )
+        except ServiceSaturated:
+            raise
         except Exception as e:
-            results.append(BatchEmbeddingItem(
+            return BatchEmbeddingItem(
                 index=idx,
                 filename=file.filename,
                 success=False,
                 error=str(e)
-            ))
+            )
+
+    if wants_stream(request, stream):
+        files = await keep_uploads(files)
+        window = asyncio.Semaphore(STREAM_EMBEDDING_WINDOW)
+
+        async def stream_one(idx: int, file: UploadFile) -> BatchEmbeddingItem:
+            try:
+                async with window:
+                    return await embed_one(idx, file)
+            except ServiceSaturated as e:
+                return BatchEmbeddingItem(index=idx, filename=file.filename, success=False, error=str(e))
+            finally:
+                await file.close()
+
+        async def items():
+            try:
+                # A window of images is in flight at once, so the scheduler still fills batches
+                async for item in as_completed(stream_one(idx, file) for idx, file in enumerate(files)):
+                    yield item
+            finally:
+                await close_uploads(files)
+
+        return ndjson_response(items())
+
+    # Submit every image at once so the scheduler can coalesce them
+    results = await asyncio.gather(*(embed_one(idx, file) for idx, file in enumerate(files)))
+    successful = sum(1 for item in results if item.success)
+
+    if accepts(request, FLOAT32_MEDIA_TYPE):
+        return float32_response([item.embedding for item in results])
     
     return BatchEmbeddingResponse(
         results=results,
@@ -455,20 +1334,16 @@ async def compute_compatibility(request: CompatibilityRequest):
     Returns both raw cosine similarity and a 0-100 compatibility score.
     """
     try:
-        embedding_service = get_embedding_service()
+        embedding_service = await load_model(embedding_model)
         
         similarity = embedding_service.compute_similarity(
             request.embedding1,
             request.embedding2
         )
-        compatibility_score = embedding_service.compute_compatibility_score(
-            request.embedding1,
-            request.embedding2
-        )
         
         return CompatibilityResponse(
             similarity=round(similarity, 4),
-            compatibility_score=compatibility_score
+            compatibility_score=similarity_to_score(similarity)
         )
     except Exception as e:
         raise HTTPException(
@@ -481,18 +1356,38 @@ async def compute_compatibility(request: CompatibilityRequest):
 async def find_compatible(request: FindCompatibleRequest):
     """
     Find the most compatible items from a list of candidates.
-    Each candidate should have 'id' and 'embedding' fields.
+    Each candidate should have 'id' and 'embedding' fields, or the candidates
+    can be sent packed as `candidate_matrix` + `candidate_ids`.
     """
     try:
-        embedding_service = get_embedding_service()
+        embedding_service = await load_model(embedding_model)
         
-        results = embedding_service.find_most_compatible(
-            target_embedding=request.target_embedding,
-            candidate_embeddings=request.candidates,
-            top_k=request.top_k
-        )
+        # Scoring thousands of candidates is CPU-bound: keep it off the event loop
+        if request.candidate_matrix is not None:
+            target = decode_embedding(request.target_embedding)
+            results = await get_executor("cpu").run(
+                lambda: embedding_service.find_most_compatible_packed(
+                    target_embedding=target,
+                    candidate_ids=request.candidate_ids or [],
+                    candidate_matrix=decode_embedding_matrix(request.candidate_matrix, target.shape[0]),
+                    top_k=request.top_k,
+                    target_category=request.target_category,
+                    candidate_category=request.candidate_category
+                )
+            )
+        else:
+            results = await get_executor("cpu").run(
+                embedding_service.find_most_compatible,
+                target_embedding=request.target_embedding,
+                candidate_embeddings=request.candidates,
+                top_k=request.top_k,
+                target_category=request.target_category,
+                candidate_category=request.candidate_category
+            )
         
         return FindCompatibleResponse(results=results)
+    except ServiceSaturated:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -500,7 +1395,155 @@ async def find_compatible(request: FindCompatibleRequest):
         )
 
 
+# ===========================================
+# EMBEDDING INDEX ENDPOINTS
+# ===========================================
+
+class IndexItem(BaseModel):
+    """Item stored in the embedding index."""
+    id: Union[str, int]
+    embedding: EmbeddingInput
+    owner_id: Optional[str] = None
+    category: Optional[str] = None
+
+
+class IndexUpsertRequest(BaseModel):
+    """Request to insert or replace indexed items."""
+    items: list[IndexItem]
+
+
+class IndexDeleteRequest(BaseModel):
+    """Request to remove items from the index."""
+    ids: list[Union[str, int]]
+
+
+class IndexMutationResponse(BaseModel):
+    """Response for index upserts and deletes."""
+    count: int
+    total: int
+
+
+class IndexQueryRequest(BaseModel):
+    """
+    Query the index with a target embedding or the id of an indexed item.
+    Candidates can be filtered by owner and category.
+    """
+    target_embedding: Optional[EmbeddingInput] = None
+    target_id: Optional[Union[str, int]] = None
+    top_k: int = 5
+    owner_id: Optional[str] = None
+    category: Optional[str] = None
+    exclude_ids: list[Union[str, int]] = []
+    # Approximate (IVF) search for marketplace-scale indexes
+    approximate: bool = False
+    nprobe: Optional[int] = None
+    # Score each candidate in the subspace of (target_category, its category);
+    # defaults to the stored category when querying by target_id
+    target_category: Optional[str] = None
+
+
+@app.on_event("startup")
+async def open_embedding_index():
+    """Map the persisted index at startup so the first query does not pay for it."""
+    await get_executor("cpu").run(get_embedding_index)
+
+
+@app.get("/stats/index")
+async def index_stats():
+    """Size and capacity of the embedding index."""
+    return get_embedding_index().get_stats()
+
+
+@app.post("/index/upsert", response_model=IndexMutationResponse)
+async def index_upsert(request: IndexUpsertRequest):
+    """Insert or replace item embeddings in the persistent index."""
+    index = get_embedding_index()
+    try:
+        count = await get_executor("cpu").run(
+            index.upsert, [item.model_dump() for item in request.items]
+        )
+        return IndexMutationResponse(count=count, total=len(index))
+    except ServiceSaturated:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to update index: {str(e)}"
+        )
+
+
+@app.post("/index/delete", response_model=IndexMutationResponse)
+async def index_delete(request: IndexDeleteRequest):
+    """Remove items from the persistent index."""
+    index = get_embedding_index()
+    try:
+        count = await get_executor("cpu").run(index.delete, [str(item_id) for item_id in request.ids])
+        return IndexMutationResponse(count=count, total=len(index))
+    except ServiceSaturated:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to update index: {str(e)}"
+        )
+
+
+@app.post("/index/build-ann")
+async def index_build_ann():
+    """(Re)train the IVF index on the current items."""
+    index = get_embedding_index()
+    try:
+        return await get_executor("cpu").run(index.build_ann)
+    except ServiceSaturated:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/index/query", response_model=FindCompatibleResponse)
+async def index_query(request: IndexQueryRequest):
+    """
+    Find the most compatible indexed items.
+    Only the target (or a target item id) is sent; candidates come from the index.
+    """
+    index = get_embedding_index()
+
+    def run_query():
+        if (request.target_category is not None or request.target_id is not None) \
+                and not embedding_model.loaded and typespaces_configured():
+            # The masks come with the embedding model, which attaches them to the index when it loads
+            embedding_model.get()
+        return index.query(
+            target_embedding=request.target_embedding,
+            target_id=str(request.target_id) if request.target_id is not None else None,
+            top_k=request.top_k,
+            owner_id=request.owner_id,
+            category=request.category,
+            exclude_ids=[str(item_id) for item_id in request.exclude_ids],
+            approximate=request.approximate,
+            nprobe=request.nprobe,
+            target_category=request.target_category,
+        )
+
+    try:
+        results = await get_executor("cpu").run(run_query)
+        return FindCompatibleResponse(results=results)
+    except ServiceSaturated:
+        raise
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to query index: {str(e)}"
+        )
+
+
 if __name__ == "__main__":
     import uvicorn
-    port = int(os.getenv("PORT", 8001))
+    port = env_int("PORT", 8001)
     uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
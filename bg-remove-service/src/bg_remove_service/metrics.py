@@ -0,0 +1,182 @@
+"""
+Prometheus Metrics
+Counters and histograms in the Prometheus text exposition format, served at /metrics.
+
+Request-path code records into the module-level metrics below. Everything that
+already keeps its own counters (inference pools, result cache, LLM client,
+micro-batcher, model registry) is read by a collector at scrape time instead,
+so /metrics and the /stats endpoints never disagree.
+
+Implemented without a client library: the service only needs counters, gauges
+and fixed-bucket histograms.
+"""
+
+import math
+import threading
+from typing import Callable, Iterable
+
+
+PREFIX = "ai_service_"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; covers a cache hit through a 12 MP cut-out or a slow LLM call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# (labels, value) pairs of one metric family
+Samples = list[tuple[dict, float]]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _family(name: str, kind: str, help: str, lines: Iterable[str]) -> list[str]:
+    return [f"# HELP {name} {help}", f"# TYPE {name} {kind}", *lines]
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = PREFIX + name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        return _family(self.name, "counter", self.help, (
+            f"{self.name}{_labels(dict(zip(self.labelnames, key)))} {_number(value)}"
+            for key, value in sorted(values.items())
+        ))
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    def __init__(self,
+                 name: str,
+                 help: str,
+                 labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = PREFIX + name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # label values -> (per-bucket counts incl. +Inf, sum)
+        self._series: dict[tuple, tuple[list[int], float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            counts, total = self._series.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._series[key] = (counts, total + value)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            series = {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+        lines = []
+        for key, (counts, total) in sorted(series.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels({**labels, 'le': _number(bound)})} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(labels)} {cumulative}")
+        return _family(self.name, "histogram", self.help, lines)
+
+
+class Registry:
+    """Metrics recorded in-process plus collectors that report gauges and counters on scrape."""
+
+    def __init__(self):
+        self._metrics: list = []
+        self._collectors: list[Callable[[], list[tuple[str, str, str, Samples]]]] = []
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self,
+                  name: str,
+                  help: str,
+                  labelnames: tuple[str, ...] = (),
+                  buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], list[tuple[str, str, str, Samples]]]):
+        """
+        Add a function returning (name, 'gauge'|'counter', help, samples) families,
+        called on every scrape. Names get the metric prefix.
+        """
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                print(f"[Metrics] Collector {getattr(collector, '__name__', collector)} failed: {e}")
+                continue
+            for name, kind, help, samples in families:
+                name = PREFIX + name
+                lines.extend(_family(name, kind, help, (
+                    f"{name}{_labels(labels)} {_number(value)}"
+                    for labels, value in samples if value is not None
+                )))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "HTTP requests by route and status.", ("method", "endpoint", "status"))
+HTTP_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "Time until the response is complete.", ("method", "endpoint"))
+STAGE_LATENCY = REGISTRY.histogram(
+    "stage_duration_seconds",
+    "Time spent in one processing stage (parse, decode, preprocess, forward, postprocess, encode, ...).",
+    ("endpoint", "stage"))
+EXECUTOR_WAIT = REGISTRY.histogram(
+    "executor_queue_wait_seconds", "Time a job waited for a free inference pool worker.", ("pool",))
+LLM_LATENCY = REGISTRY.histogram(
+    "llm_call_duration_seconds", "OpenRouter call latency per attempt.", ("outcome",))
+
+
+def stat_samples(stats: dict, key: str, label: str) -> Samples:
+    """One sample per entry of a {label value: stats dict} mapping."""
+    return [({label: name}, values.get(key)) for name, values in stats.items()]
@@ -0,0 +1,130 @@
+"""
+Inference Optimization
+Turns the eager embedding network into a frozen TorchScript graph for serving:
+
+1. BatchNorm is folded into the preceding convolution (one op instead of two)
+2. weights are converted to channels_last, which oneDNN convolutions prefer on CPU
+3. the graph is traced and frozen (weights become constants)
+4. after loading, the graph is optimized for inference on the target machine
+   (prepacked oneDNN weights cannot be serialized, so this step is not saved)
+
+The result is saved with the service metadata (version, type masks) embedded,
+so one file replaces the eager checkpoint in EMBEDDING_MODEL_PATH.
+"""
+
+import json
+import time
+import zipfile
+from typing import Optional
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+from .resnet18 import BasicBlock, ResNet
+
+
+# Name of the metadata entry stored next to the TorchScript graph
+METADATA_FILE = "fashion_metadata.json"
+
+
+def _fold(conv: nn.Conv2d, bn: nn.Module) -> nn.Conv2d:
+    return fuse_conv_bn_eval(conv, bn) if isinstance(bn, nn.BatchNorm2d) else conv
+
+
+def fold_batchnorm(model: nn.Module) -> nn.Module:
+    """
+    Fold every BatchNorm2d of the ResNet backbone into its convolution, in place.
+    The BatchNorm modules are replaced by Identity so forward() is unchanged.
+    """
+    model.eval()
+    for module in model.modules():
+        if isinstance(module, (ResNet, BasicBlock)):
+            module.conv1 = _fold(module.conv1, module.bn1)
+            module.bn1 = nn.Identity()
+        if isinstance(module, BasicBlock):
+            module.conv2 = _fold(module.conv2, module.bn2)
+            module.bn2 = nn.Identity()
+            if module.downsample is not None:
+                module.downsample = nn.Sequential(_fold(module.downsample[0], module.downsample[1]))
+    return model
+
+
+def freeze_model(model: nn.Module,
+                 example_input: torch.Tensor,
+                 channels_last: bool = True) -> torch.jit.ScriptModule:
+    """
+    Fold BatchNorm, trace and freeze a model (the serializable part of the pipeline).
+
+    Args:
+        model: Eager model in eval mode (modified in place by BN folding)
+        example_input: (B, 3, H, W) input used for tracing
+        channels_last: Convert weights and the traced input to channels_last
+
+    Returns:
+        Frozen TorchScript module
+    """
+    model = fold_batchnorm(model.eval())
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+        example_input = example_input.contiguous(memory_format=torch.channels_last)
+
+    with torch.no_grad():
+        return torch.jit.freeze(torch.jit.trace(model, example_input))
+
+
+def optimize_frozen(module: torch.jit.ScriptModule) -> torch.jit.ScriptModule:
+    """Apply inference-only graph rewrites (prepacked convolutions) to a frozen module."""
+    return torch.jit.optimize_for_inference(module)
+
+
+def save_frozen(module: torch.jit.ScriptModule, path: str, metadata: dict):
+    """Save a frozen module with the service metadata embedded as an extra file."""
+    torch.jit.save(module, path, _extra_files={METADATA_FILE: json.dumps(metadata)})
+
+
+def is_frozen_artifact(path: str) -> bool:
+    """True when a file was written by `save_frozen` (a TorchScript zip with our metadata)."""
+    if not zipfile.is_zipfile(path):
+        return False
+    with zipfile.ZipFile(path) as archive:
+        return any(name.endswith(f"/extra/{METADATA_FILE}") for name in archive.namelist())
+
+
+def load_frozen(path: str, device: torch.device) -> tuple[torch.jit.ScriptModule, dict]:
+    """Load a frozen module, optimize it for this machine and return it with its metadata."""
+    extra_files = {METADATA_FILE: ""}
+    module = torch.jit.load(path, map_location=device, _extra_files=extra_files)
+    return optimize_frozen(module), json.loads(extra_files[METADATA_FILE])
+
+
+def compare_outputs(reference: torch.Tensor, candidate: torch.Tensor) -> dict:
+    """Numerical agreement of two embedding batches."""
+    reference = reference.detach().cpu().numpy()
+    candidate = candidate.detach().cpu().numpy()
+    ref_norm = np.linalg.norm(reference, axis=1)
+    cand_norm = np.linalg.norm(candidate, axis=1)
+    cosine = (reference * candidate).sum(axis=1) / np.maximum(ref_norm * cand_norm, 1e-12)
+    return {
+        "max_abs_diff": float(np.abs(reference - candidate).max()),
+        "min_cosine": float(cosine.min()),
+    }
+
+
+def measure_latency(model,
+                    batch: torch.Tensor,
+                    iterations: int = 20,
+                    warmup: int = 3,
+                    memory_format: Optional[torch.memory_format] = None) -> float:
+    """Median forward latency in milliseconds."""
+    if memory_format is not None:
+        batch = batch.contiguous(memory_format=memory_format)
+    timings = []
+    with torch.inference_mode():
+        for i in range(warmup + iterations):
+            start = time.perf_counter()
+            model(batch)
+            if i >= warmup:
+                timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
@@ -0,0 +1,122 @@
+"""
+Model Registry
+Lazy, thread-safe model loading with per-model load timings for readiness probes.
+
+Models are built on first use (MODEL_LOADING=lazy, the default) so the process
+starts serving /health immediately. With MODEL_LOADING=eager every registered
+model is loaded and warmed up in the background at startup, and /ready reports
+not-ready until that has finished.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Callable, Optional
+
+
+class LazyModel:
+    """A model that is built on the first `get()` and then shared by every caller."""
+
+    def __init__(self,
+                 name: str,
+                 loader: Callable[[], Any],
+                 warmup: Optional[Callable[[Any], None]] = None):
+        """
+        Args:
+            name: Model name used in logs and /ready
+            loader: Builds and returns the model
+            warmup: Optional dummy inference run once after loading in eager mode
+        """
+        self.name = name
+        self.loader = loader
+        self.warmup = warmup
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+        self._model: Any = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def get(self) -> Any:
+        """Return the model, loading it first if needed (blocking; call from a worker thread)."""
+        if self._model is not None:
+            return self._model
+
+        with self._lock:
+            if self._model is None:
+                start = time.perf_counter()
+                try:
+                    model = self.loader()
+                except Exception as e:
+                    self.error = str(e)
+                    raise
+                self.load_seconds = round(time.perf_counter() - start, 3)
+                self.error = None
+                self._model = model
+                print(f"[ModelRegistry] Loaded {self.name} in {self.load_seconds}s")
+        return self._model
+
+    def warm_up(self):
+        """Load the model and run its warm-up inference once."""
+        model = self.get()
+        if self.warmup is not None and self.warmup_seconds is None:
+            start = time.perf_counter()
+            self.warmup(model)
+            self.warmup_seconds = round(time.perf_counter() - start, 3)
+
+    def get_status(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "error": self.error,
+        }
+
+
+_models: dict[str, LazyModel] = {}
+
+
+def register_model(name: str,
+                   loader: Callable[[], Any],
+                   warmup: Optional[Callable[[Any], None]] = None) -> LazyModel:
+    """Register a lazily loaded model under a name (idempotent)."""
+    if name not in _models:
+        _models[name] = LazyModel(name, loader, warmup)
+    return _models[name]
+
+
+def get_model(name: str) -> LazyModel:
+    return _models[name]
+
+
+def eager_loading() -> bool:
+    """True when MODEL_LOADING=eager asks for models to be loaded at startup."""
+    return os.getenv("MODEL_LOADING", "lazy").lower() == "eager"
+
+
+def load_models() -> list[Any]:
+    """Load every registered model without running inference (e.g. before forking workers)."""
+    return [model.get() for model in _models.values()]
+
+
+def warm_up_models():
+    """Load and warm up every registered model, logging (not raising) failures."""
+    for model in _models.values():
+        try:
+            model.warm_up()
+        except Exception as e:
+            print(f"[ModelRegistry] Failed to load {model.name}: {e}")
+
+
+def get_model_status() -> dict:
+    return {name: model.get_status() for name, model in _models.items()}
+
+
+def models_ready() -> bool:
+    """Ready once every model is loaded (eager) or immediately (lazy)."""
+    if not eager_loading():
+        return True
+    return all(model.loaded for model in _models.values())
@@ -0,0 +1,372 @@
+"""
+On-demand Profiling
+Profile live requests to one endpoint without restarting or redeploying the service.
+
+An operator arms a session through the admin API (`POST /admin/profile`) and the
+next `count` requests to that endpoint are profiled. Each capture is written to
+PROFILE_DIR as:
+- `<name>.pstats`: cProfile of the request's inference-pool jobs and of the
+  event loop while it ran (open with `python -m pstats` or snakeviz)
+- `<name>.trace.json`: torch.profiler operator trace of the segmentation and
+  embedding jobs (open in chrome://tracing or Perfetto)
+
+With `min_latency_ms`, every matching request is profiled but only those slower
+than the threshold are kept, which shows what the slow requests have in common.
+
+torch.profiler only sees the thread it is enabled on, so every model job is traced
+on its worker thread and the pieces are merged per request. Before Python 3.12
+cProfile works the same way. From 3.12 it runs on sys.monitoring: only one profile
+may be enabled in the process, and it sees every thread. The event-loop profile
+then also covers the request's pool jobs, and other sampled requests go without
+cProfile while it runs.
+"""
+
+import asyncio
+import contextvars
+import cProfile
+import json
+import os
+import pstats
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+from .tracing import current_request_id, current_trace, log
+
+
+# Pools whose jobs run a torch model; the rest (decode, encode, search) get cProfile only
+TORCH_POOLS = ("segmentation", "embedding")
+
+# Captures remembered for the status endpoint
+MAX_CAPTURES = 50
+
+# From 3.12 one cProfile at a time per process, seeing every thread
+PROCESS_WIDE_CPROFILE = sys.version_info >= (3, 12)
+
+
+def profile_dir() -> str:
+    return os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "ai-service-profiles"))
+
+
+def _slug(value: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_-]+", "_", value).strip("_")[:64] or "root"
+
+
+class ProfileSession:
+    """What to profile: one endpoint, how many captures and which profilers."""
+
+    def __init__(self,
+                 endpoint: str,
+                 count: int = 1,
+                 python: bool = True,
+                 torch: bool = True,
+                 min_latency_ms: Optional[float] = None,
+                 sample_rate: float = 1.0,
+                 ttl_seconds: float = 600):
+        """
+        Args:
+            endpoint: Request path to profile, e.g. '/remove-bg'
+            count: Captures to keep before the session ends
+            python: Record cProfile stats
+            torch: Record torch.profiler operator traces for model jobs
+            min_latency_ms: Only keep requests at least this slow (None keeps every sampled request)
+            sample_rate: Fraction of matching requests to profile
+            ttl_seconds: End the session after this long even if captures are missing
+        """
+        if count < 1:
+            raise ValueError("count must be at least 1")
+        if not 0 < sample_rate <= 1:
+            raise ValueError("sample_rate must be in (0, 1]")
+        if not (python or torch):
+            raise ValueError("enable at least one of python and torch")
+
+        self.id = uuid.uuid4().hex[:12]
+        self.endpoint = endpoint
+        self.count = count
+        self.python = python
+        self.torch = torch
+        self.min_latency_ms = min_latency_ms
+        self.sample_rate = sample_rate
+        self.started = time.time()
+        self.expires = self.started + ttl_seconds
+        self.remaining = count
+        self.profiled = 0
+        # Profiled but faster than min_latency_ms
+        self.discarded = 0
+
+    @property
+    def active(self) -> bool:
+        return self.remaining > 0 and time.time() < self.expires
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "endpoint": self.endpoint,
+            "active": self.active,
+            "count": self.count,
+            "captured": self.count - self.remaining,
+            "profiled": self.profiled,
+            "discarded": self.discarded,
+            "python": self.python,
+            "torch": self.torch,
+            "min_latency_ms": self.min_latency_ms,
+            "sample_rate": self.sample_rate,
+            "expires_in_seconds": max(0.0, round(self.expires - time.time(), 1)),
+        }
+
+
+# torch.profiler cannot run on two threads at once, so at most one job records a trace
+_torch_lock = threading.Lock()
+
+
+def start_cprofile() -> Optional[cProfile.Profile]:
+    """An enabled cProfile, or None if another profile is already active (Python 3.12+)."""
+    python_profile = cProfile.Profile()
+    try:
+        python_profile.enable()
+    except ValueError:
+        return None
+    return python_profile
+
+
+class RequestProfile:
+    """Profiles collected for one sampled request."""
+
+    def __init__(self, session: ProfileSession, path: str, request_id: Optional[str]):
+        self.session = session
+        self.path = path
+        self.request_id = request_id or uuid.uuid4().hex
+        self.python_profiles: list[cProfile.Profile] = []
+        self.torch_profiles: list = []
+        # Model jobs that ran while another thread held the torch profiler
+        self.torch_skipped = 0
+        # Set while this request's event-loop profile sees every thread (Python 3.12+)
+        self.process_wide = False
+        # Pool jobs that ran while another request held the process-wide cProfile
+        self.python_skipped = 0
+        self._lock = threading.Lock()
+
+    def add_python(self, profile: cProfile.Profile):
+        with self._lock:
+            self.python_profiles.append(profile)
+
+    def run(self, pool: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run one pool job on the current thread under the session's profilers."""
+        with ExitStack() as stack:
+            if self.session.torch and pool in TORCH_POOLS:
+                if _torch_lock.acquire(blocking=False):
+                    stack.callback(_torch_lock.release)
+                    from torch.profiler import ProfilerActivity, profile
+                    torch_profile = stack.enter_context(
+                        profile(activities=[ProfilerActivity.CPU], record_shapes=True))
+                    with self._lock:
+                        self.torch_profiles.append(torch_profile)
+                else:
+                    with self._lock:
+                        self.torch_skipped += 1
+            if self.session.python and not self.process_wide:
+                python_profile = start_cprofile()
+                if python_profile is not None:
+                    stack.callback(python_profile.disable)
+                    self.add_python(python_profile)
+                else:
+                    with self._lock:
+                        self.python_skipped += 1
+            return fn(*args, **kwargs)
+
+    def write(self, directory: str, name: str) -> dict:
+        """Save the merged profiles; returns the paths written."""
+        os.makedirs(directory, exist_ok=True)
+        files = {}
+        if self.python_profiles:
+            path = os.path.join(directory, f"{name}.pstats")
+            pstats.Stats(*self.python_profiles).dump_stats(path)
+            files["pstats"] = path
+        if self.torch_profiles:
+            path = os.path.join(directory, f"{name}.trace.json")
+            _write_chrome_trace(self.torch_profiles, path)
+            files["trace"] = path
+        return files
+
+
+def _write_chrome_trace(profiles: list, path: str):
+    """Merge the traces of several jobs (one per worker thread) into one Chrome trace."""
+    merged: dict = {}
+    for torch_profile in profiles:
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+            part = f.name
+        try:
+            torch_profile.export_chrome_trace(part)
+            with open(part) as f:
+                trace = json.load(f)
+        finally:
+            os.remove(part)
+        if not merged:
+            merged = trace
+        else:
+            merged.setdefault("traceEvents", []).extend(trace.get("traceEvents", []))
+    with open(path, "w") as f:
+        json.dump(merged, f)
+
+
+_current: contextvars.ContextVar[Optional[RequestProfile]] = contextvars.ContextVar("request_profile", default=None)
+
+
+def current_profile() -> Optional[RequestProfile]:
+    """The profile of the current request, if it was sampled."""
+    return _current.get()
+
+
+class Profiler:
+    """Holds the armed session and the captures written so far (one per process)."""
+
+    def __init__(self):
+        self.session: Optional[ProfileSession] = None
+        self.captures: list[dict] = []
+        self._lock = threading.Lock()
+
+    def start(self, session: ProfileSession) -> dict:
+        """Arm `session`, replacing any running one."""
+        with self._lock:
+            self.session = session
+        log("Profiling", f"Profiling {session.count} request(s) to {session.endpoint}",
+            session=session.id, min_latency_ms=session.min_latency_ms)
+        return session.to_dict()
+
+    def stop(self) -> Optional[dict]:
+        """Disarm the running session; requests already sampled are still written."""
+        with self._lock:
+            session, self.session = self.session, None
+        if session is None:
+            return None
+        session.expires = min(session.expires, time.time())
+        return session.to_dict()
+
+    def status(self) -> dict:
+        with self._lock:
+            session = self.session
+            captures = list(self.captures)
+        return {
+            "directory": profile_dir(),
+            "session": session.to_dict() if session is not None else None,
+            "captures": captures,
+        }
+
+    def begin(self, path: str) -> Optional[RequestProfile]:
+        """Decide whether the request to `path` is sampled."""
+        session = self.session
+        if session is None or not session.active or path != session.endpoint:
+            return None
+        if session.sample_rate < 1 and random.random() >= session.sample_rate:
+            return None
+        return RequestProfile(session, path, current_request_id())
+
+    def claim(self, profile: RequestProfile, elapsed_ms: float, stages: dict) -> Optional[dict]:
+        """
+        Count a finished request against its session.
+
+        Returns:
+            The capture record if the request is kept, None if it was too fast
+            or the session already has its captures
+        """
+        session = profile.session
+        with self._lock:
+            session.profiled += 1
+            if session.min_latency_ms is not None and elapsed_ms < session.min_latency_ms:
+                session.discarded += 1
+                return None
+            if session.remaining <= 0:
+                return None
+            session.remaining -= 1
+
+            name = f"{datetime.now():%Y%m%d-%H%M%S}_{_slug(profile.path)}_{_slug(profile.request_id)[:32]}"
+            capture = {
+                "name": name,
+                "session": session.id,
+                "endpoint": profile.path,
+                "request_id": profile.request_id,
+                "latency_ms": round(elapsed_ms, 3),
+                "stages": stages,
+                "torch_jobs_skipped": profile.torch_skipped,
+                "python_jobs_skipped": profile.python_skipped,
+                "files": {},
+            }
+            self.captures = [*self.captures, capture][-MAX_CAPTURES:]
+            if session.remaining == 0 and self.session is session:
+                self.session = None
+        return capture
+
+    def save(self, profile: RequestProfile, capture: dict):
+        """Write a claimed capture to disk (blocking; run off the event loop)."""
+        try:
+            capture["files"] = profile.write(profile_dir(), capture["name"])
+            log("Profiling", f"Saved profile of {capture['endpoint']} ({capture['latency_ms']:.0f} ms)",
+                files=list(capture["files"].values()))
+        except Exception as e:
+            capture["error"] = str(e)
+            log("Profiling", f"Failed to write profile {capture['name']}: {e}", level="error")
+
+
+_profiler: Optional[Profiler] = None
+
+
+def get_profiler() -> Profiler:
+    """Get or create the process-wide profiler."""
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+    return _profiler
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that samples requests for the armed profiling session.
+
+    Must sit inside TracingMiddleware so sampled requests already have their id.
+    The event loop is profiled for one sampled request at a time; that profile
+    also sees whatever other requests did on the loop meanwhile (and, from
+    Python 3.12, on the pool threads).
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._loop_profiled = False
+
+    async def __call__(self, scope, receive, send):
+        profile = get_profiler().begin(scope["path"]) if scope["type"] == "http" else None
+        if profile is None:
+            await self.app(scope, receive, send)
+            return
+
+        profiler = get_profiler()
+        token = _current.set(profile)
+        loop_profile = None
+        if profile.session.python and not self._loop_profiled:
+            loop_profile = start_cprofile()
+            if loop_profile is not None:
+                self._loop_profiled = True
+                profile.process_wide = PROCESS_WIDE_CPROFILE
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if loop_profile is not None:
+                loop_profile.disable()
+                profile.process_wide = False
+                profile.add_python(loop_profile)
+                self._loop_profiled = False
+            _current.reset(token)
+
+            trace = current_trace()
+            capture = profiler.claim(profile, elapsed_ms, trace.stage_ms() if trace else {})
+            if capture is not None:
+                # Writing traces takes a while; the response is already sent
+                asyncio.get_running_loop().run_in_executor(None, profiler.save, profile, capture)
@@ -0,0 +1,127 @@
+"""
+Int8 Quantization
+Optional int8 inference for the embedding and segmentation models on CPU.
+
+Modes (EMBEDDING_QUANTIZATION / SEGMENTATION_QUANTIZATION):
+- none: fp32 (default)
+- dynamic: Linear layers get int8 weights, activations are quantized on the fly.
+  No calibration is needed, but convolutional models barely change.
+- static: FX graph-mode post-training quantization of convolutions and linears.
+  Activation ranges are calibrated on images from QUANTIZATION_CALIBRATION_DIR.
+
+Quantized outputs differ from fp32. Measure the drift with
+benchmarks/quantization_accuracy.py before enabling a mode.
+"""
+
+import copy
+import os
+from typing import Callable, Optional
+
+import torch
+import torch.nn as nn
+from PIL import Image
+
+from .env_settings import env_int
+
+
+QUANTIZATION_MODES = ("none", "dynamic", "static")
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def quantization_mode(env_var: str) -> str:
+    """Read and validate a quantization mode from the environment."""
+    mode = (os.getenv(env_var) or "none").lower()
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"{env_var}={mode} is not one of {QUANTIZATION_MODES}")
+    return mode
+
+
+def _select_engine():
+    """Use the x86 (fbgemm + oneDNN) kernels when this build has them."""
+    engines = torch.backends.quantized.supported_engines
+    for engine in ("x86", "fbgemm", "qnnpack"):
+        if engine in engines:
+            torch.backends.quantized.engine = engine
+            return engine
+    raise RuntimeError("This PyTorch build has no quantized CPU engine")
+
+
+def calibration_images(directory: Optional[str] = None, limit: Optional[int] = None) -> list[Image.Image]:
+    """
+    Load RGB calibration images, sorted by file name for reproducibility.
+
+    Args:
+        directory: Folder of images (default: QUANTIZATION_CALIBRATION_DIR)
+        limit: Maximum number of images (default: QUANTIZATION_CALIBRATION_SIZE or 32)
+    """
+    directory = directory or os.getenv("QUANTIZATION_CALIBRATION_DIR")
+    limit = limit or env_int("QUANTIZATION_CALIBRATION_SIZE", 32)
+    if not directory or not os.path.isdir(directory):
+        raise ValueError("Static quantization needs QUANTIZATION_CALIBRATION_DIR with sample images")
+
+    names = sorted(n for n in os.listdir(directory) if n.lower().endswith(IMAGE_EXTENSIONS))
+    images = []
+    for name in names[:limit]:
+        with Image.open(os.path.join(directory, name)) as image:
+            images.append(image.convert("RGB"))
+    if not images:
+        raise ValueError(f"No calibration images found in {directory}")
+    return images
+
+
+def quantize_dynamic(model: nn.Module) -> nn.Module:
+    """Int8 weights for every Linear layer; returns a quantized copy."""
+    _select_engine()
+    return torch.ao.quantization.quantize_dynamic(
+        copy.deepcopy(model).eval(), {nn.Linear}, dtype=torch.qint8
+    )
+
+
+def quantize_static(model: nn.Module,
+                    calibration_batches: list[torch.Tensor],
+                    forward: Optional[Callable[[nn.Module, torch.Tensor], object]] = None) -> nn.Module:
+    """
+    FX graph-mode post-training static quantization; returns a quantized copy.
+
+    Args:
+        model: fp32 model in eval mode
+        calibration_batches: Preprocessed input batches used to observe activation ranges
+        forward: How to call the model on a batch (default: model(batch))
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    engine = _select_engine()
+    forward = forward or (lambda m, batch: m(batch))
+    prepared = prepare_fx(
+        copy.deepcopy(model).eval(),
+        get_default_qconfig_mapping(engine),
+        example_inputs=(calibration_batches[0],),
+    )
+    with torch.no_grad():
+        for batch in calibration_batches:
+            forward(prepared, batch)
+    return convert_fx(prepared)
+
+
+def quantize_model(model: nn.Module,
+                   mode: str,
+                   calibration_batches: Optional[Callable[[], list[torch.Tensor]]] = None) -> nn.Module:
+    """
+    Quantize a model in the given mode ('none' returns it unchanged).
+
+    Args:
+        model: fp32 model in eval mode
+        mode: One of QUANTIZATION_MODES
+        calibration_batches: Builds the calibration batches (only called for 'static')
+    """
+    if mode == "none":
+        return model
+    if mode == "dynamic":
+        return quantize_dynamic(model)
+    if mode == "static":
+        if calibration_batches is None:
+            raise ValueError("Static quantization needs calibration data")
+        return quantize_static(model, calibration_batches())
+    raise ValueError(f"Unknown quantization mode '{mode}', expected one of {QUANTIZATION_MODES}")
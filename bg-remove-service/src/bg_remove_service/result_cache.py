@@ -0,0 +1,307 @@
+"""
+Result Cache
+Content-addressed cache for expensive model outputs (cut-outs, embeddings,
+extracted attributes). Keys are a hash of the decoded image pixels plus the
+model/prompt version, so re-uploads of the same photo skip inference.
+
+Two tiers:
+- an in-process LRU bounded by total value size in bytes
+- an optional sqlite file that survives restarts
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from PIL import Image
+
+from .env_settings import env_int
+
+
+# When the disk tier is over its limit it is trimmed to this fraction of it,
+# so the (full-scan) resync of the totals runs once per ~10% of churn
+DISK_LOW_WATER = 0.9
+
+# Rows deleted per eviction query
+TRIM_BATCH = 64
+
+
+def content_key(image: Image.Image) -> str:
+    """
+    Hash the decoded pixels of an image.
+    Two uploads that decode to the same pixels share a key regardless of file format.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def version_key(*parts: str) -> str:
+    """Short stable hash of the things that determine a result (model, prompt, options)."""
+    return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()[:16]
+
+
+class NamespaceStats:
+    def __init__(self):
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stores = 0
+
+    def to_dict(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "stores": self.stores,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class ResultCache:
+    """
+    Two-tier byte cache partitioned into namespaces ('mask', 'embedding', ...).
+
+    Each namespace is registered with its current version; entries written
+    under an older version are never returned and are purged from disk.
+    """
+
+    def __init__(self,
+                 max_bytes: int = 256 * 1024 * 1024,
+                 disk_path: Optional[str] = None,
+                 max_disk_bytes: int = 2 * 1024 * 1024 * 1024):
+        """
+        Initialize the cache.
+
+        Args:
+            max_bytes: Size limit of the in-memory tier (sum of value sizes)
+            disk_path: Path of the sqlite file for the on-disk tier (None disables it)
+            max_disk_bytes: Size limit of the on-disk tier
+        """
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_path = disk_path
+
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self._versions: dict[str, str] = {}
+        self._stats: dict[str, NamespaceStats] = {}
+        # Called from the event loop and from pool threads
+        self._lock = threading.Lock()
+
+        self._db: Optional[sqlite3.Connection] = None
+        # Running totals of the disk tier, so writes never scan the table
+        self._disk_entries = 0
+        self._disk_bytes = 0
+        if disk_path:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            self._db = self._connect()
+            self._sync_disk_totals()
+            # A sqlite connection must not be used across fork (see `serve`); workers open their own
+            os.register_at_fork(after_in_child=self._reconnect)
+
+    def _reconnect(self):
+        self._db = self._connect()
+        self._lock = threading.Lock()
+        self._sync_disk_totals()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.disk_path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        # Several worker processes may write at once
+        db.execute("PRAGMA busy_timeout=5000")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " namespace TEXT NOT NULL,"
+            " version TEXT NOT NULL,"
+            " value BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " accessed REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        db.commit()
+        return db
+
+    def _sync_disk_totals(self):
+        self._disk_entries, self._disk_bytes = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+
+    def register(self, namespace: str, version: str):
+        """
+        Declare the current version of a namespace.
+        Entries from any other version (old checkpoint, edited prompt) are dropped.
+        """
+        with self._lock:
+            if self._versions.get(namespace) == version:
+                return
+            self._versions[namespace] = version
+            self._stats.setdefault(namespace, NamespaceStats())
+
+            prefix = f"{namespace}:"
+            current = f"{namespace}:{version}:"
+            for key in [k for k in self._memory if k.startswith(prefix) and not k.startswith(current)]:
+                self._memory_bytes -= len(self._memory.pop(key))
+
+            if self._db is not None:
+                self._db.execute(
+                    "DELETE FROM entries WHERE namespace = ? AND version != ?",
+                    (namespace, version)
+                )
+                self._db.commit()
+                self._sync_disk_totals()
+
+    def _full_key(self, namespace: str, key: str) -> str:
+        if namespace not in self._versions:
+            raise KeyError(f"Cache namespace not registered: {namespace}")
+        return f"{namespace}:{self._versions[namespace]}:{key}"
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        """Look up a value, promoting disk hits into memory."""
+        with self._lock:
+            full_key = self._full_key(namespace, key)
+            stats = self._stats[namespace]
+
+            value = self._memory.get(full_key)
+            if value is not None:
+                self._memory.move_to_end(full_key)
+                stats.hits += 1
+                return value
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value FROM entries WHERE key = ?", (full_key,)
+                ).fetchone()
+                if row is not None:
+                    value = bytes(row[0])
+                    self._db.execute(
+                        "UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), full_key)
+                    )
+                    self._db.commit()
+                    self._put_memory(namespace, full_key, value)
+                    stats.hits += 1
+                    stats.disk_hits += 1
+                    return value
+
+            stats.misses += 1
+            return None
+
+    def set(self, namespace: str, key: str, value: bytes):
+        """Store a value in memory and (if enabled) on disk."""
+        with self._lock:
+            full_key = self._full_key(namespace, key)
+            self._stats[namespace].stores += 1
+            self._put_memory(namespace, full_key, value)
+
+            if self._db is not None:
+                previous = self._db.execute(
+                    "SELECT size FROM entries WHERE key = ?", (full_key,)
+                ).fetchone()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO entries (key, namespace, version, value, size, accessed)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (full_key, namespace, self._versions[namespace], value, len(value), time.time())
+                )
+                if previous is None:
+                    self._disk_entries += 1
+                    self._disk_bytes += len(value)
+                else:
+                    self._disk_bytes += len(value) - previous[0]
+                if self._disk_bytes > self.max_disk_bytes:
+                    self._trim_disk()
+                self._db.commit()
+
+    def _put_memory(self, namespace: str, full_key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        previous = self._memory.pop(full_key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._memory[full_key] = value
+        self._memory_bytes += len(value)
+
+        while self._memory_bytes > self.max_bytes:
+            evicted_key, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            evicted_namespace = evicted_key.split(":", 1)[0]
+            if evicted_namespace in self._stats:
+                self._stats[evicted_namespace].evictions += 1
+
+    def _trim_disk(self):
+        """
+        Drop least recently used rows, a batch at a time, until the disk tier is
+        back under its low-water mark. Other worker processes write to the same
+        file, so the running totals are re-read first.
+        """
+        self._sync_disk_totals()
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+        target = int(self.max_disk_bytes * DISK_LOW_WATER)
+        while self._disk_bytes > target:
+            rows = self._db.execute(
+                "SELECT key, size FROM entries ORDER BY accessed LIMIT ?", (TRIM_BATCH,)
+            ).fetchall()
+            if not rows:
+                break
+            stale = []
+            for key, size in rows:
+                if self._disk_bytes <= target:
+                    break
+                stale.append((key,))
+                self._disk_entries -= 1
+                self._disk_bytes -= size
+            self._db.executemany("DELETE FROM entries WHERE key = ?", stale)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "max_bytes": self.max_bytes,
+                "disk_enabled": self._db is not None,
+                "namespaces": {
+                    namespace: {"version": self._versions[namespace], **ns_stats.to_dict()}
+                    for namespace, ns_stats in self._stats.items()
+                },
+            }
+            if self._db is not None:
+                # This process's view; other workers' writes show up after the next trim
+                stats["disk_entries"] = self._disk_entries
+                stats["disk_bytes"] = self._disk_bytes
+                stats["max_disk_bytes"] = self.max_disk_bytes
+            return stats
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+# Singleton instance for the service
+_result_cache: Optional[ResultCache] = None
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """Get or create the singleton cache (None when RESULT_CACHE_ENABLED=false)."""
+    global _result_cache
+
+    if _result_cache is None:
+        if os.getenv("RESULT_CACHE_ENABLED", "true").lower() in ("0", "false", "no"):
+            return None
+        _result_cache = ResultCache(
+            max_bytes=env_int("RESULT_CACHE_MAX_BYTES", 256 * 1024 * 1024),
+            disk_path=os.getenv("RESULT_CACHE_PATH") or None,
+            max_disk_bytes=env_int("RESULT_CACHE_DISK_MAX_BYTES", 2 * 1024 * 1024 * 1024),
+        )
+
+    return _result_cache
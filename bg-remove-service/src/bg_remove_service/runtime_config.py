@@ -0,0 +1,181 @@
+"""
+Runtime Configuration
+Process-wide torch CPU settings, applied once before the first inference.
+
+Left alone, torch starts one intra-op thread per host core, even when the
+container is limited to fewer cores, and those threads compete with the inference
+pools and with other pods on the node. Settings (environment):
+- TORCH_NUM_THREADS: intra-op threads (default: the CPUs this process may use,
+  i.e. its affinity mask capped by the cgroup CPU quota)
+- TORCH_INTEROP_THREADS: inter-op threads (default 1; the models have no
+  parallel branches worth a second pool)
+- CPU_AFFINITY: pin the process to a core list ("0-3,8") or to the cores of a
+  NUMA node ("node:1"), so weights and activations stay in local memory
+
+Allocator settings (MALLOC_ARENA_MAX, an LD_PRELOADed jemalloc/tcmalloc) have to
+be in place before the interpreter starts; they are only reported here.
+"""
+
+import math
+import os
+import threading
+from typing import Optional
+
+import torch
+
+from .env_settings import env_int
+
+
+_lock = threading.Lock()
+_applied: Optional[dict] = None
+
+
+def parse_cpu_list(spec: str) -> set[int]:
+    """Parse a Linux CPU list such as '0-3,8,10-11'."""
+    cpus = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def numa_node_cpus(node: int) -> set[int]:
+    """Cores of a NUMA node, from sysfs."""
+    with open(f"/sys/devices/system/node/node{node}/cpulist") as f:
+        return parse_cpu_list(f.read())
+
+
+def cpu_quota() -> Optional[float]:
+    """CPUs allowed by the cgroup CFS quota (v2 or v1), or None when unlimited."""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        return quota / period if quota > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def affinity() -> Optional[list[int]]:
+    """Sorted cores this process may run on (None where the OS cannot tell)."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return None
+
+
+def available_cpus() -> int:
+    """CPUs this process can actually use: its affinity mask, capped by the CPU quota."""
+    cpus = len(affinity() or []) or os.cpu_count() or 1
+    quota = cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return cpus
+
+
+def resolve_affinity(spec: str) -> set[int]:
+    """
+    Cores named by a CPU_AFFINITY value.
+
+    Raises:
+        ValueError: If the value cannot be parsed or names no usable core
+    """
+    try:
+        if spec.startswith("node:"):
+            cpus = numa_node_cpus(int(spec[len("node:"):]))
+        else:
+            cpus = parse_cpu_list(spec)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Invalid CPU_AFFINITY '{spec}': {e}") from e
+    allowed = set(affinity() or cpus)
+    if not cpus & allowed:
+        raise ValueError(f"CPU_AFFINITY '{spec}' names no core this process may use")
+    return cpus & allowed
+
+
+def pin_cpus(cpus: set[int]):
+    """Restrict this process (all of its threads) to the given cores."""
+    if not hasattr(os, "sched_setaffinity"):
+        print("[Runtime] CPU pinning is not supported on this platform, ignoring")
+        return
+    os.sched_setaffinity(0, cpus)
+
+
+def configure_threads(threads: int, interop_threads: int = 1):
+    """Set intra-op and inter-op thread counts for this process."""
+    torch.set_num_threads(max(1, threads))
+    try:
+        torch.set_num_interop_threads(max(1, interop_threads))
+    except RuntimeError:
+        # Can only be set before the first inter-op parallel work in this process
+        pass
+
+
+def allocator_settings() -> dict:
+    """Memory allocator in use and the glibc malloc tunables from the environment."""
+    preload = os.getenv("LD_PRELOAD", "")
+    allocator = next((name for name in ("jemalloc", "tcmalloc", "mimalloc") if name in preload), "glibc")
+    return {
+        "allocator": allocator,
+        "malloc_arena_max": os.getenv("MALLOC_ARENA_MAX"),
+        "malloc_trim_threshold": os.getenv("MALLOC_TRIM_THRESHOLD_"),
+    }
+
+
+def apply_runtime_config(threads: Optional[int] = None, cpus: Optional[set[int]] = None) -> dict:
+    """
+    Apply the runtime settings once per process; later calls return the first result.
+
+    Args:
+        threads: Intra-op threads, overriding TORCH_NUM_THREADS (e.g. per serve worker)
+        cpus: Cores to pin to, overriding CPU_AFFINITY
+
+    Returns:
+        The effective settings (see `get_runtime_config`)
+    """
+    global _applied
+    with _lock:
+        if _applied is not None:
+            return get_runtime_config()
+
+        spec = os.getenv("CPU_AFFINITY", "").strip()
+        if cpus is None and spec:
+            cpus = resolve_affinity(spec)
+        if cpus:
+            pin_cpus(cpus)
+
+        # Empty (as in .env.example) or 0 means "use the available CPUs"
+        threads = threads or env_int("TORCH_NUM_THREADS") or available_cpus()
+        configure_threads(threads, env_int("TORCH_INTEROP_THREADS", 1))
+
+        _applied = {"pinned": bool(cpus)}
+        settings = get_runtime_config()
+        print(f"[Runtime] {settings['num_threads']} intra-op / {settings['interop_threads']} inter-op threads"
+              + (f", pinned to cores {settings['affinity']}" if cpus else ""))
+        return settings
+
+
+def get_runtime_config() -> dict:
+    """Effective torch threading, CPU and allocator settings of this process."""
+    return {
+        "applied": _applied is not None,
+        "num_threads": torch.get_num_threads(),
+        "interop_threads": torch.get_num_interop_threads(),
+        "available_cpus": available_cpus(),
+        "cpu_quota": cpu_quota(),
+        "affinity": affinity(),
+        "pinned": bool(_applied and _applied["pinned"]),
+        "mkldnn": torch.backends.mkldnn.is_available(),
+        **allocator_settings(),
+    }
@@ -0,0 +1,186 @@
+"""
+Batched Background Removal
+Runs RMBG-1.4 on several images in one forward pass.
+Pre/post-processing mirrors the model's own `image-segmentation` pipeline,
+so cut-outs match the single-image path pixel for pixel (up to float error).
+"""
+
+import os
+from typing import Optional
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from PIL import Image
+
+from .env_settings import env_int
+from .quantization import calibration_images, quantization_mode, quantize_model
+from .tracing import stage
+
+
+# RMBG-1.4 squashes every input to a fixed square, so all images share one
+# input shape and aspect-ratio bucketing is not needed.
+RMBG_INPUT_SIZE = (1024, 1024)
+RMBG_MEAN = 0.5
+RMBG_STD = 1.0
+
+# Images per forward pass; bounded because activations at 1024x1024 are large
+SEGMENTATION_BATCH_SIZE = env_int("SEGMENTATION_BATCH_SIZE", 4)
+
+SEGMENTATION_MODEL = "briaai/RMBG-1.4"
+
+
+def load_segmentation_pipeline():
+    """
+    Build the RMBG-1.4 `image-segmentation` pipeline.
+
+    RMBG_MODEL_PATH points at a local copy (written by `export_models`), which
+    loads without contacting the Hugging Face Hub; otherwise the model is
+    fetched from (or found in the cache of) the Hub.
+    """
+    # transformers is slow to import; only pay for it when the model is needed
+    from transformers import pipeline
+
+    local_path = os.getenv("RMBG_MODEL_PATH")
+    model = local_path if local_path and os.path.isdir(local_path) else SEGMENTATION_MODEL
+    pipe = pipeline(
+        "image-segmentation",
+        model=model,
+        trust_remote_code=True,
+        device=0 if torch.cuda.is_available() else -1,
+        use_fast=True,
+        model_kwargs={"local_files_only": model == local_path},
+    )
+
+    mode = quantization_mode("SEGMENTATION_QUANTIZATION")
+    if mode != "none":
+        quantize_segmentation(pipe, mode)
+    return pipe
+
+
+def quantize_segmentation(pipe, mode: str):
+    """
+    Replace the pipeline's model with an int8 version (CPU only).
+    Static mode calibrates on QUANTIZATION_CALIBRATION_DIR at the model's input size.
+    """
+    if pipe.device.type != "cpu":
+        print(f"[Segmentation] Quantization '{mode}' is CPU only, skipping")
+        return
+
+    def calibration_batches() -> list[torch.Tensor]:
+        images = calibration_images()
+        return [preprocess_batch(images[i:i + 2]) for i in range(0, len(images), 2)]
+
+    pipe.model = quantize_model(pipe.model.eval(), mode, calibration_batches)
+    print(f"[Segmentation] Using int8 {mode} quantization")
+
+
+def warm_up_segmentation(pipe):
+    """One small forward pass so the first request does not pay for kernel setup."""
+    remove_background_batch(pipe.model, [Image.new("RGB", (64, 64))], pipe.device)
+
+
+def preprocess_batch(images: list[Image.Image],
+                     out: Optional[torch.Tensor] = None) -> torch.Tensor:
+    """
+    Resize and normalize images into one (B, 3, H, W) tensor.
+
+    Args:
+        images: RGB PIL Images of any size
+        out: Optional preallocated tensor to write into
+
+    Returns:
+        Normalized input batch for RMBG-1.4
+    """
+    if out is None:
+        out = torch.empty((len(images), 3, *RMBG_INPUT_SIZE), dtype=torch.float32)
+
+    for i, image in enumerate(images):
+        pixels = torch.from_numpy(np.array(image, dtype=np.uint8))
+        pixels = pixels.permute(2, 0, 1).unsqueeze(0).float()
+        out[i] = F.interpolate(pixels, size=RMBG_INPUT_SIZE, mode="bilinear")[0]
+
+    # Normalize the whole batch in one op
+    out.div_(255.0).sub_(RMBG_MEAN).div_(RMBG_STD)
+    return out
+
+
+def postprocess_mask(mask: torch.Tensor, size: tuple[int, int]) -> np.ndarray:
+    """
+    Resize one predicted mask back to the image's native resolution.
+
+    Args:
+        mask: (1, H, W) model output for one image
+        size: (width, height) of the original image
+
+    Returns:
+        uint8 alpha matte of shape (height, width)
+    """
+    width, height = size
+    mask = F.interpolate(mask.unsqueeze(0), size=(height, width), mode="bilinear")[0, 0]
+    lo, hi = torch.min(mask), torch.max(mask)
+    mask = (mask - lo) / torch.clamp(hi - lo, min=1e-8)
+    return (mask * 255).cpu().numpy().astype(np.uint8)
+
+
+def apply_mask(image: Image.Image, mask: np.ndarray) -> Image.Image:
+    """Composite the image onto a transparent canvas using the alpha matte."""
+    matte = Image.fromarray(mask)
+    result = Image.new("RGBA", matte.size, (0, 0, 0, 0))
+    result.paste(image, mask=matte)
+    return result
+
+
+def predict_masks(model: torch.nn.Module,
+                  images: list[Image.Image],
+                  device: torch.device,
+                  batch_size: int = SEGMENTATION_BATCH_SIZE) -> list[np.ndarray]:
+    """
+    Predict alpha mattes for a list of images, `batch_size` per forward pass.
+
+    Args:
+        model: The RMBG-1.4 model (e.g. `pipeline.model`)
+        images: PIL Images (converted to RGB here)
+        device: Device the model lives on
+        batch_size: Maximum images per forward pass
+
+    Returns:
+        One uint8 matte per image at its native resolution
+    """
+    images = [img if img.mode == "RGB" else img.convert("RGB") for img in images]
+    masks = []
+    buffer = None
+
+    for start in range(0, len(images), batch_size):
+        chunk = images[start:start + batch_size]
+        # Reuse the input buffer across full-size chunks
+        if buffer is None or buffer.shape[0] != len(chunk):
+            buffer = torch.empty((len(chunk), 3, *RMBG_INPUT_SIZE), dtype=torch.float32)
+        with stage("preprocess"):
+            batch = preprocess_batch(chunk, out=buffer).to(device)
+
+        with stage("forward"), torch.inference_mode():
+            outputs = model(batch)
+        # RMBG returns ([side outputs...], [features...]); the first side output is the matte
+        predictions = outputs[0][0]
+
+        with stage("postprocess"):
+            for i, image in enumerate(chunk):
+                masks.append(postprocess_mask(predictions[i], image.size))
+
+    return masks
+
+
+def remove_background_batch(model: torch.nn.Module,
+                            images: list[Image.Image],
+                            device: torch.device,
+                            batch_size: int = SEGMENTATION_BATCH_SIZE) -> list[Image.Image]:
+    """
+    Remove the background from several images with batched forward passes.
+
+    Returns:
+        RGBA cut-outs, one per input image, at native resolution
+    """
+    images = [img if img.mode == "RGB" else img.convert("RGB") for img in images]
+    masks = predict_masks(model, images, device, batch_size)
+    return [apply_mask(img, mask) for img, mask in zip(images, masks)]
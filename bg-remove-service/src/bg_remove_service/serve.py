@@ -0,0 +1,219 @@
+"""
+Multi-Worker Server
+Pre-fork serving: the models are loaded once in a parent process, then
+worker processes are forked from it and serve requests on a shared socket.
+
+- weights are shared copy-on-write (inference never writes them), so memory
+  stays roughly flat as workers are added; `--shared-memory` additionally moves
+  them into shared memory so no page can ever be copied
+- each worker runs its own uvicorn event loop with `--threads` intra-op
+  threads, so workers x threads can be matched to the cores
+- `--pin-workers` gives each worker its own `--threads` cores, so their
+  thread pools never share a core
+- a worker that dies is restarted; SIGTERM/SIGINT shut every worker down
+
+Usage:
+    python -m bg_remove_service.serve --workers 4 --threads 2 --port 8001
+"""
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Optional
+
+import torch
+import uvicorn
+from dotenv import load_dotenv
+
+from .env_settings import env_int
+from .runtime_config import affinity, apply_runtime_config, available_cpus, pin_cpus, resolve_affinity
+from .tracing import json_logs
+
+
+def share_weights(model) -> bool:
+    """
+    Move a model's parameters and buffers into shared memory.
+    Returns False for objects that are not (and do not wrap) an nn.Module,
+    and for modules whose storages cannot be shared (e.g. packed int8 weights).
+    """
+    module = model if isinstance(model, torch.nn.Module) else getattr(model, "model", None)
+    if not isinstance(module, torch.nn.Module):
+        return False
+    try:
+        module.share_memory()
+    except RuntimeError as e:
+        print(f"[Serve] Could not move {type(module).__name__} to shared memory ({e}), using copy-on-write")
+        return False
+    return True
+
+
+def preload(shared_memory: bool):
+    """Import the app and load every model in this (parent) process."""
+    from .main import app
+    from .model_registry import load_models
+
+    # Loading runs with one thread: an OpenMP pool started before fork can hang in the children
+    torch.set_num_threads(1)
+    models = load_models()
+    if shared_memory:
+        for model in models:
+            share_weights(model)
+
+    # Keep the garbage collector from touching (and so copying) every inherited object page
+    gc.collect()
+    gc.freeze()
+    return app
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+# Exit status of a worker whose app failed to start; restarting it would not help
+WORKER_BOOT_ERROR = 3
+
+
+def worker_cpus(index: int, threads: int, pin: bool) -> Optional[set[int]]:
+    """The cores worker `index` is pinned to (None when not pinning or cores run out)."""
+    cpus = affinity()
+    if not pin or not cpus:
+        return None
+    cores = cpus[index * threads:(index + 1) * threads]
+    return set(cores) if len(cores) == threads else None
+
+
+def run_worker(app, sock: socket.socket, threads: int, cpus: Optional[set[int]], log_level: str):
+    """Body of a forked worker; never returns."""
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    apply_runtime_config(threads=threads, cpus=cpus)
+    status = 1
+    try:
+        # With LOG_FORMAT=json the app writes its own access log lines
+        server = uvicorn.Server(uvicorn.Config(app, log_level=log_level, access_log=not json_logs()))
+        server.run(sockets=[sock])
+        status = 0 if server.started else WORKER_BOOT_ERROR
+    finally:
+        os._exit(status)
+
+
+def supervise(app,
+              sock: socket.socket,
+              workers: int,
+              threads: int,
+              log_level: str,
+              pin: bool = False) -> int:
+    """
+    Fork the workers, restart any that exit, and stop them all on SIGTERM/SIGINT.
+    Returns the exit status for the parent process.
+    """
+    children: dict[int, int] = {}
+    stopping = False
+    exit_status = 0
+
+    def spawn(index: int):
+        cpus = worker_cpus(index, threads, pin)
+        pid = os.fork()
+        if pid == 0:
+            run_worker(app, sock, threads, cpus, log_level)
+        children[pid] = index
+        print(f"[Serve] Worker {index} started (pid {pid}, {threads} threads"
+              + (f", cores {sorted(cpus)})" if cpus else ")"))
+
+    def stop(signum=None, frame=None):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for index in range(workers):
+        spawn(index)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        if index is None or stopping:
+            continue
+        if os.waitstatus_to_exitcode(status) == WORKER_BOOT_ERROR:
+            print(f"[Serve] Worker {index} failed to start, shutting down")
+            exit_status = 1
+            stop()
+            continue
+        print(f"[Serve] Worker {index} (pid {pid}) exited with status {status}, restarting")
+        # Avoid a tight crash loop
+        time.sleep(1)
+        spawn(index)
+    return exit_status
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    """Command-line options; every default comes from the environment (.env must be loaded first)."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("HOST") or "0.0.0.0")
+    parser.add_argument("--port", type=int, default=env_int("PORT", 8001))
+    parser.add_argument("--workers", type=int, default=env_int("SERVE_WORKERS", 1))
+    parser.add_argument("--threads", type=int, default=env_int("SERVE_THREADS_PER_WORKER", 0),
+                        help="Intra-op threads per worker (default: available CPUs / workers)")
+    parser.add_argument("--shared-memory", action="store_true",
+                        default=os.getenv("SERVE_SHARED_MEMORY", "false").lower() == "true",
+                        help="Move weights into shared memory (needs /dev/shm larger than the models)")
+    parser.add_argument("--pin-workers", action="store_true",
+                        default=os.getenv("SERVE_PIN_WORKERS", "false").lower() == "true",
+                        help="Pin each worker to its own --threads cores")
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL") or "info")
+    return parser.parse_args(argv)
+
+
+def main():
+    # The argument defaults (and CPU_AFFINITY below) come from .env, so load it first
+    load_dotenv()
+    args = parse_args()
+
+    workers = max(1, args.workers)
+
+    if workers == 1:
+        # Nothing to share: serve in this process, loading models as MODEL_LOADING says
+        apply_runtime_config(threads=args.threads or None)
+        from .main import app
+        uvicorn.run(app, host=args.host, port=args.port, log_level=args.log_level, access_log=not json_logs())
+        return
+
+    print("[Serve] Note: /metrics and /admin/profile report the worker that answers the request, "
+          "not the whole server")
+
+    if os.getenv("CPU_AFFINITY"):
+        # Pin the parent, so workers inherit (and --pin-workers splits) the chosen cores
+        pin_cpus(resolve_affinity(os.getenv("CPU_AFFINITY").strip()))
+    threads = args.threads or max(1, available_cpus() // workers)
+    if args.pin_workers and workers * threads > len(affinity() or []):
+        print(f"[Serve] Not enough cores to pin {workers} workers x {threads} threads; "
+              "workers beyond the available cores run unpinned")
+
+    started = time.perf_counter()
+    app = preload(args.shared_memory)
+    print(f"[Serve] Models loaded in {time.perf_counter() - started:.1f}s; "
+          f"starting {workers} workers x {threads} threads on {args.host}:{args.port}")
+    sys.exit(supervise(app, bind_socket(args.host, args.port), workers, threads, args.log_level,
+                       pin=args.pin_workers))
+
+
+if __name__ == "__main__":
+    main()
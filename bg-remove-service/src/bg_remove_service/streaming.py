@@ -0,0 +1,57 @@
+"""
+Streaming Batch Responses
+Opt-in NDJSON output for the batch endpoints: one JSON object per line, written
+as soon as each result is ready (possibly out of order, each carries its index).
+
+Clients opt in with `?stream=true` or `Accept: application/x-ndjson`.
+"""
+
+import asyncio
+import json
+from typing import Any, AsyncIterator, Awaitable, Iterable
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def wants_stream(request: Request, stream: bool = False) -> bool:
+    """True when the caller asked for NDJSON via the query flag or the Accept header."""
+    return stream or NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+async def as_completed(awaitables: Iterable[Awaitable[Any]]) -> AsyncIterator[Any]:
+    """
+    Yield results in completion order.
+    Pending work is cancelled if the consumer stops early (e.g. the client disconnects).
+    """
+    tasks = [asyncio.ensure_future(awaitable) for awaitable in awaitables]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _to_line(item: Any) -> str:
+    if isinstance(item, BaseModel):
+        return item.model_dump_json() + "\n"
+    return json.dumps(item) + "\n"
+
+
+def ndjson_response(items: AsyncIterator[Any]) -> StreamingResponse:
+    """Stream dicts or Pydantic models as NDJSON, one line per item."""
+    async def lines():
+        async for item in items:
+            yield _to_line(item)
+
+    return StreamingResponse(
+        lines(),
+        media_type=NDJSON_MEDIA_TYPE,
+        # Stop reverse proxies from buffering the whole body
+        headers={"X-Accel-Buffering": "no", "Cache-Control": "no-cache"},
+    )
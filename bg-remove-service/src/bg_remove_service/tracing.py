@@ -0,0 +1,190 @@
+"""
+Request Tracing
+Request ids and per-stage timings, carried in a context variable so any code a
+request runs, including jobs on the inference pools, can record spans.
+
+- `stage("decode")` times a block: it is added to the current request's timings
+  and to the stage histogram on /metrics. Spans outside a request (batched
+  forward passes shared by several requests, warm-up) count as endpoint "background".
+- `TracingMiddleware` gives every request an id (the caller's X-Request-ID or a
+  new one, echoed back) and records request metrics. It adds a Server-Timing
+  header when SERVER_TIMING=true or the request sends `X-Server-Timing: true`.
+  With LOG_FORMAT=json it writes one access log line per request.
+- `log()` writes "[Component] message" lines, or JSON objects carrying the
+  request id with LOG_FORMAT=json.
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+from .metrics import HTTP_LATENCY, HTTP_REQUESTS, STAGE_LATENCY
+
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# Spans recorded outside any request
+BACKGROUND = "background"
+
+
+def json_logs() -> bool:
+    return os.getenv("LOG_FORMAT", "text").lower() == "json"
+
+
+def server_timing_default() -> bool:
+    return os.getenv("SERVER_TIMING", "false").lower() == "true"
+
+
+class RequestTrace:
+    """Timings of one request; stages that run more than once (or in parallel) are summed."""
+
+    def __init__(self, request_id: str, scope: dict):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.stages: dict[str, float] = {}
+        self._scope = scope
+        self._lock = threading.Lock()
+
+    @property
+    def endpoint(self) -> str:
+        """Route template (e.g. /batch/remove-bg) once routed, so labels stay bounded."""
+        route = self._scope.get("route")
+        return getattr(route, "path", None) or "unmatched"
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def stage_ms(self) -> dict[str, float]:
+        with self._lock:
+            return {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()}
+
+
+_current: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar("request_trace", default=None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current.get()
+
+
+def current_request_id() -> Optional[str]:
+    trace = _current.get()
+    return trace.request_id if trace is not None else None
+
+
+def record_stage(name: str, seconds: float):
+    """Record an already measured span for the current request (or as background work)."""
+    trace = _current.get()
+    STAGE_LATENCY.observe(seconds, endpoint=trace.endpoint if trace else BACKGROUND, stage=name)
+    if trace is not None:
+        trace.add(name, seconds)
+
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block as one span of stage `name`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+async def request_parsed():
+    """
+    App-wide dependency: FastAPI resolves it after reading and parsing the request
+    body, so the time up to here is the 'parse' stage (upload receive + multipart parsing).
+    """
+    trace = _current.get()
+    if trace is not None:
+        record_stage("parse", time.perf_counter() - trace.started)
+
+
+def log(component: str, message: str, level: str = "info", **fields):
+    """
+    Write one log line tagged with the current request id.
+
+    Args:
+        component: Subsystem, e.g. 'Extraction'
+        message: Human-readable message
+        level: 'info', 'warning' or 'error'
+        **fields: Extra structured fields (JSON mode) or key=value suffixes (text mode)
+    """
+    request_id = current_request_id()
+    if json_logs():
+        record = {
+            "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "level": level,
+            "component": component,
+            "message": message,
+            "request_id": request_id,
+            **fields,
+        }
+        print(json.dumps(record, default=str), flush=True)
+        return
+    suffix = "".join(f" {key}={value}" for key, value in fields.items())
+    if request_id:
+        suffix += f" request_id={request_id}"
+    print(f"[{component}] {message}{suffix}")
+
+
+def server_timing(stages: dict[str, float], total_ms: float) -> str:
+    """Server-Timing header value (durations in milliseconds)."""
+    entries = [f"{name};dur={ms:.1f}" for name, ms in stages.items()]
+    entries.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(entries)
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware that opens a RequestTrace for each HTTP request.
+
+    Written against raw ASGI (not BaseHTTPMiddleware) so streaming responses pass
+    through untouched; the request is measured until its last body chunk is sent.
+    Server-Timing can only carry the stages finished before the headers go out.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope["headers"]}
+        request_id = headers.get(REQUEST_ID_HEADER.lower()) or uuid.uuid4().hex
+        want_timing = server_timing_default() or headers.get("x-server-timing", "").lower() == "true"
+        trace = RequestTrace(request_id[:128], scope)
+        token = _current.set(trace)
+        status = 500
+
+        async def send_traced(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                extra = [(REQUEST_ID_HEADER.encode(), trace.request_id.encode("latin-1"))]
+                if want_timing:
+                    elapsed_ms = (time.perf_counter() - trace.started) * 1000
+                    extra.append((b"server-timing", server_timing(trace.stage_ms(), elapsed_ms).encode()))
+                message = {**message, "headers": [*message.get("headers", []), *extra]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_traced)
+        finally:
+            elapsed = time.perf_counter() - trace.started
+            method, endpoint = scope["method"], trace.endpoint
+            HTTP_REQUESTS.inc(method=method, endpoint=endpoint, status=status)
+            HTTP_LATENCY.observe(elapsed, method=method, endpoint=endpoint)
+            if json_logs():
+                log("Request", f"{method} {scope['path']} {status}",
+                    method=method, path=scope["path"], endpoint=endpoint, status=status,
+                    duration_ms=round(elapsed * 1000, 3), stages=trace.stage_ms())
+            _current.reset(token)
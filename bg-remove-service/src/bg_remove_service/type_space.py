@@ -0,0 +1,152 @@
+"""
+Type-Specific Embedding Spaces
+Inference-time use of the per-pair masks learned by TypeSpecificNet.
+
+TypeSpecificNet projects the general embedding x into the space of a
+category pair c as x * mask_c. Compatibility between, say, tops and
+footwear is then the cosine similarity in that subspace:
+
+    cos_c(a, b) = sum(m_c^2 * a * b) / (|m_c * a| * |m_c * b|)
+
+The per-item norms |m_c * a| for every c come from one matmul, so they can
+be precomputed and cached; a type-aware query then costs one matmul, the
+same as a query in the general space.
+
+Which condition belongs to which pair is decided at training time, so it has
+to come from the training run's typespaces file. Without one, every pair is
+scored in the general (unmasked) space.
+"""
+
+import json
+import os
+import pickle
+from typing import Optional
+
+import numpy as np
+
+
+# App categories that are named differently in the Polyvore type spaces
+CATEGORY_ALIASES = {
+    "footwear": "shoes",
+}
+
+
+def _normalize_category(category: str) -> str:
+    category = category.strip().lower()
+    return CATEGORY_ALIASES.get(category, category)
+
+
+def load_typespaces(path: str) -> dict[tuple[str, str], int]:
+    """
+    Load the category-pair -> condition index mapping used at training time.
+
+    Accepts the `typespaces.p` pickle from the fashion-compatibility repo
+    (dict of (type1, type2) -> index) or a JSON object {"type1|type2": index}.
+    """
+    if path.endswith(".json"):
+        with open(path) as f:
+            raw = {tuple(key.split("|")): value for key, value in json.load(f).items()}
+    else:
+        with open(path, "rb") as f:
+            raw = pickle.load(f)
+
+    return {
+        tuple(sorted(_normalize_category(c) for c in pair)): int(index)
+        for pair, index in raw.items()
+    }
+
+
+class TypeSpace:
+    """
+    The learned mask for every category pair, plus helpers to score in a subspace.
+    """
+
+    def __init__(self, masks: np.ndarray, typespaces: dict[tuple[str, str], int]):
+        """
+        Args:
+            masks: (n_conditions x D) mask weights from the checkpoint ('masks.weight')
+            typespaces: Category pair -> condition index
+        """
+        self.masks = np.asarray(masks, dtype=np.float32)
+        self.squared_masks = self.masks ** 2
+        self.typespaces = typespaces
+
+    @property
+    def n_conditions(self) -> int:
+        return self.masks.shape[0]
+
+    @property
+    def active(self) -> bool:
+        """Whether any category pair maps to one of the masks; otherwise scoring is general-space only."""
+        return any(index < self.n_conditions for index in self.typespaces.values())
+
+    def condition(self, category1: Optional[str], category2: Optional[str]) -> Optional[int]:
+        """Condition index for a category pair (order-insensitive), or None if unknown."""
+        if not category1 or not category2:
+            return None
+        pair = tuple(sorted((_normalize_category(category1), _normalize_category(category2))))
+        index = self.typespaces.get(pair)
+        return index if index is not None and index < self.n_conditions else None
+
+    def masked_norms(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        |m_c * x| for every vector and condition, in one matmul.
+
+        Returns:
+            (N x n_conditions) norms
+        """
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        return np.sqrt(np.maximum((vectors ** 2) @ self.squared_masks.T, 0.0))
+
+    def similarities(self,
+                     target: np.ndarray,
+                     matrix: np.ndarray,
+                     condition: int,
+                     matrix_norms: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Cosine similarity between a target and every row, in one subspace.
+
+        Args:
+            target: (D,) general embedding of the query item
+            matrix: (N x D) general embeddings of the candidates
+            condition: Condition index of the category pair
+            matrix_norms: Precomputed |m_c * row| for this condition (computed if None)
+
+        Returns:
+            (N,) similarities
+        """
+        weights = self.squared_masks[condition]
+        target_norm = float(np.sqrt(np.dot(target ** 2, weights)))
+        if matrix_norms is None:
+            matrix_norms = np.sqrt(np.maximum((matrix ** 2) @ weights, 0.0))
+        if target_norm == 0 or matrix.shape[0] == 0:
+            return np.zeros(matrix.shape[0], dtype=np.float32)
+
+        dots = matrix @ (target * weights)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sims = dots / (matrix_norms * target_norm)
+        sims[matrix_norms == 0] = 0.0
+        return sims
+
+
+def typespaces_configured() -> bool:
+    """Whether TYPESPACES_PATH names an existing file (checked without loading any model)."""
+    path = os.getenv("TYPESPACES_PATH")
+    return bool(path) and os.path.exists(path)
+
+
+def create_type_space(masks: np.ndarray) -> TypeSpace:
+    """
+    Build a TypeSpace from TYPESPACES_PATH. Without that file no pair has a
+    known condition, so every pair is scored in the general space.
+    """
+    path = os.getenv("TYPESPACES_PATH")
+    if typespaces_configured():
+        typespaces = load_typespaces(path)
+        print(f"[TypeSpace] Loaded {len(typespaces)} type spaces from: {path}")
+    else:
+        typespaces = {}
+        reason = f"TYPESPACES_PATH not found: {path}" if path else "TYPESPACES_PATH not set"
+        print(f"[TypeSpace] Warning: {reason}, the pair -> mask mapping is unknown; "
+              "scoring all category pairs in the general (unmasked) space")
+    return TypeSpace(masks, typespaces)
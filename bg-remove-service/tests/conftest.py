@@ -0,0 +1,13 @@
+import pytest
+import torch
+
+from bg_remove_service.embedding_service import FashionEmbeddingService, SimpleEmbeddingNet
+
+
+@pytest.fixture(scope="session")
+def embedding_service(tmp_path_factory) -> FashionEmbeddingService:
+    """The real service on random weights, loaded from a checkpoint so no ImageNet download happens."""
+    torch.manual_seed(0)
+    path = tmp_path_factory.mktemp("checkpoint") / "model.pth"
+    torch.save({"state_dict": SimpleEmbeddingNet(embedding_size=64, pretrained=False).state_dict()}, path)
+    return FashionEmbeddingService(model_path=str(path), device="cpu")
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from bg_remove_service.ann_index import IVFIndex, normalize_rows, spherical_kmeans
+
+
+def clustered(n: int, dimensions: int = 16, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(8, dimensions))
+    return (centers[rng.integers(0, 8, n)] + rng.normal(scale=0.3, size=(n, dimensions))).astype(np.float32)
+
+
+def trained_index(data: np.ndarray, nlist: int = 8) -> IVFIndex:
+    index = IVFIndex(data.shape[1], nlist=nlist, nprobe=2)
+    index.train(data)
+    index.add(np.arange(data.shape[0]), data)
+    return index
+
+
+def test_normalize_rows_keeps_zero_rows():
+    rows = normalize_rows(np.array([[3.0, 4.0], [0.0, 0.0]]))
+    np.testing.assert_allclose(rows, [[0.6, 0.8], [0.0, 0.0]])
+
+
+def test_spherical_kmeans_returns_unit_centroids():
+    centroids = spherical_kmeans(clustered(200), 8)
+    assert centroids.shape == (8, 16)
+    np.testing.assert_allclose(np.linalg.norm(centroids, axis=1), 1.0, rtol=1e-5)
+
+
+def test_probing_every_list_matches_exact_search():
+    data = clustered(500)
+    unit = normalize_rows(data)
+    index = trained_index(data)
+    query = unit[7]
+
+    keys, sims = index.search(query, 5, lambda k: unit[k] @ query, nprobe=index.nlist)
+    exact = np.argsort(-(unit @ query), kind="stable")[:5]
+    assert keys.tolist() == exact.tolist()
+    assert sims[0] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_lists_hold_keys_not_vectors():
+    index = trained_index(clustered(300))
+    for inverted_list in index._lists:
+        assert not hasattr(inverted_list, "vectors")
+    assert sorted(np.concatenate([lst.keys[:lst.size] for lst in index._lists]).tolist()) == list(range(300))
+
+
+def test_remove_and_reinsert():
+    data = clustered(100)
+    index = trained_index(data)
+    assert index.remove(3)
+    assert not index.remove(3)
+    assert 3 not in index.probe(data[3], index.nlist).tolist()
+
+    index.add(np.array([3]), data[3:4])
+    index.add(np.array([3]), data[3:4])
+    assert len(index) == 100
+    assert index.probe(data[3], index.nlist).tolist().count(3) == 1
+
+
+def test_allowed_mask_filters_candidates():
+    data = clustered(200)
+    unit = normalize_rows(data)
+    index = trained_index(data)
+    allowed = np.zeros(200, dtype=bool)
+    allowed[::2] = True
+
+    keys, _ = index.search(unit[1], 10, lambda k: unit[k] @ unit[1], nprobe=index.nlist, allowed=allowed)
+    assert keys.size == 10
+    assert all(key % 2 == 0 for key in keys.tolist())
+
+
+@pytest.mark.parametrize("nprobe", [0, -1, 9])
+def test_nprobe_out_of_range_is_rejected(nprobe):
+    index = trained_index(clustered(100))
+    with pytest.raises(ValueError):
+        index.probe(np.ones(16, dtype=np.float32), nprobe)
+
+
+def test_default_nprobe_is_capped_to_trained_lists():
+    data = clustered(4)
+    index = IVFIndex(16, nlist=8, nprobe=8)
+    index.train(data)
+    assert index.nlist == 4
+    assert index.nprobe == 4
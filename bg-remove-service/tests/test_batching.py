@@ -0,0 +1,90 @@
+import asyncio
+import threading
+
+import pytest
+
+from bg_remove_service.batching import MicroBatcher
+from bg_remove_service.executors import ServiceSaturated
+
+
+def test_concurrent_requests_share_a_batch():
+    calls = []
+
+    def double(items):
+        calls.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(double, max_batch_size=4, max_wait_ms=50)
+
+    async def run():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(6)))
+
+    assert asyncio.run(run()) == [0, 2, 4, 6, 8, 10]
+    assert [len(batch) for batch in calls] == [4, 2]
+    stats = batcher.get_stats()
+    assert stats["requests"] == 6
+    assert stats["batches"] == 2
+    assert stats["batch_size_histogram"][4] == 1
+
+
+def test_a_bad_input_does_not_fail_its_neighbours():
+    def strict(items):
+        if any(item < 0 for item in items):
+            raise ValueError("negative input")
+        return items
+
+    batcher = MicroBatcher(strict, max_batch_size=8, max_wait_ms=20)
+
+    async def run():
+        return await asyncio.gather(*(batcher.submit(i) for i in (1, -1, 2)), return_exceptions=True)
+
+    first, bad, second = asyncio.run(run())
+    assert (first, second) == (1, 2)
+    assert isinstance(bad, ValueError)
+    assert batcher.get_stats()["errors"] == 1
+
+
+def test_wrong_result_count_is_an_error():
+    batcher = MicroBatcher(lambda items: [], max_batch_size=1, max_wait_ms=0)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(batcher.submit(1))
+
+
+def test_full_queue_is_rejected():
+    batcher = MicroBatcher(lambda items: items, max_batch_size=1, max_wait_ms=0, max_queue=0)
+
+    with pytest.raises(ServiceSaturated):
+        asyncio.run(batcher.submit(1))
+    assert batcher.get_stats()["rejected"] == 1
+
+
+def test_batcher_survives_a_new_event_loop():
+    batcher = MicroBatcher(lambda items: items, max_batch_size=4, max_wait_ms=1)
+
+    # Each asyncio.run is a new loop, as with a restarted app or a second test client
+    assert asyncio.run(batcher.submit(1)) == 1
+    assert asyncio.run(batcher.submit(2)) == 2
+
+
+def test_close_fails_waiting_requests_and_allows_reuse():
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow(items):
+        started.set()
+        release.wait(5)
+        return items
+
+    batcher = MicroBatcher(slow, max_batch_size=1, max_wait_ms=0)
+
+    async def run():
+        running = asyncio.ensure_future(batcher.submit(1))
+        waiting = asyncio.ensure_future(batcher.submit(2))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        await batcher.close()
+        release.set()
+        return await asyncio.gather(running, waiting, return_exceptions=True)
+
+    assert all(isinstance(result, RuntimeError) for result in asyncio.run(run()))
+    assert asyncio.run(batcher.submit(3)) == 3
@@ -0,0 +1,220 @@
+import numpy as np
+import pytest
+
+from bg_remove_service import embedding_index as embedding_index_module
+from bg_remove_service.embedding_index import EmbeddingIndex
+from bg_remove_service.embedding_service import (
+    ProductQuantizer,
+    dequantize_int8,
+    quantize_int8,
+)
+
+
+DIMENSIONS = 16
+
+
+def items(vectors: np.ndarray, start: int = 0) -> list[dict]:
+    return [
+        {
+            "id": str(start + i),
+            "embedding": vector.tolist(),
+            "owner_id": f"user{(start + i) % 3}",
+            "category": "tops" if (start + i) % 2 else "bottoms",
+        }
+        for i, vector in enumerate(vectors)
+    ]
+
+
+def random_vectors(n: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).normal(size=(n, DIMENSIONS)).astype(np.float32)
+
+
+def open_index(path, **kwargs) -> EmbeddingIndex:
+    return EmbeddingIndex(str(path), dimensions=DIMENSIONS, initial_capacity=4, ann_min_items=0, **kwargs)
+
+
+def test_upsert_grows_and_round_trips(tmp_path):
+    vectors = random_vectors(10)
+    index = open_index(tmp_path)
+    assert index.upsert(items(vectors)) == 10
+
+    assert len(index) == 10
+    assert index.capacity >= 10
+    np.testing.assert_allclose(index.get("3"), vectors[3])
+    assert index.get("missing") is None
+
+
+def test_upsert_replaces_in_place(tmp_path):
+    vectors = random_vectors(3)
+    index = open_index(tmp_path)
+    index.upsert(items(vectors))
+    index.upsert([{"id": "1", "embedding": vectors[0].tolist(), "category": "shoes"}])
+
+    assert len(index) == 3
+    np.testing.assert_allclose(index.get("1"), vectors[0])
+    assert index.get_stats()["categories"] == 3
+
+
+def test_wrong_dimensions_are_rejected_before_writing(tmp_path):
+    index = open_index(tmp_path)
+    with pytest.raises(ValueError):
+        index.upsert([{"id": "a", "embedding": [0.0] * DIMENSIONS}, {"id": "b", "embedding": [1.0]}])
+    assert len(index) == 0
+
+
+def test_query_is_exact_and_filters(tmp_path):
+    vectors = random_vectors(50)
+    index = open_index(tmp_path)
+    index.upsert(items(vectors))
+
+    results = index.query(target_embedding=vectors[7].tolist(), top_k=3)
+    assert results[0]["id"] == "7"
+    assert results[0]["similarity"] == pytest.approx(1.0, abs=1e-4)
+
+    by_id = index.query(target_id="7", top_k=5, category="tops", owner_id="user1")
+    assert by_id
+    assert all(r["id"] != "7" and r["category"] == "tops" and r["owner_id"] == "user1" for r in by_id)
+
+    with pytest.raises(KeyError):
+        index.query(target_id="missing")
+
+
+def test_delete_frees_rows_for_reuse(tmp_path):
+    vectors = random_vectors(4)
+    index = open_index(tmp_path)
+    index.upsert(items(vectors))
+    capacity = index.capacity
+
+    assert index.delete(["0", "1", "missing"]) == 2
+    index.upsert(items(random_vectors(2, seed=1), start=10))
+    assert len(index) == 4
+    assert index.capacity == capacity
+    assert all(r["id"] not in ("0", "1") for r in index.query(target_embedding=vectors[0].tolist(), top_k=4))
+
+
+def test_reopen_restores_items_and_ann(tmp_path):
+    vectors = random_vectors(200)
+    index = open_index(tmp_path, ann_nlist=8)
+    index.upsert(items(vectors))
+    index.build_ann()
+    index.close()
+
+    reopened = open_index(tmp_path, ann_nlist=8)
+    assert len(reopened) == 200
+    assert reopened.get_stats()["ann"]["vectors"] == 200
+    assert reopened.query(target_id="5", top_k=1, approximate=True, nprobe=8)[0]["id"] != "5"
+
+
+def test_approximate_query_matches_exact_when_probing_everything(tmp_path):
+    vectors = random_vectors(300)
+    index = open_index(tmp_path, storage="int8", ann_nlist=8)
+    index.upsert(items(vectors))
+    index.build_ann()
+
+    target = vectors[11].tolist()
+    approximate = index.query(target_embedding=target, top_k=5, approximate=True, nprobe=8)
+    assert approximate == index.query(target_embedding=target, top_k=5)
+    with pytest.raises(ValueError):
+        index.query(target_embedding=target, approximate=True, nprobe=9)
+
+
+@pytest.mark.parametrize("storage", ["float16", "int8"])
+def test_compressed_storage_rescores_exactly(tmp_path, storage):
+    vectors = random_vectors(300)
+    exact = open_index(tmp_path / "exact")
+    compressed = open_index(tmp_path / storage, storage=storage)
+    exact.upsert(items(vectors))
+    compressed.upsert(items(vectors))
+
+    assert compressed.get_stats()["storage_active"]
+    assert compressed.memory_bytes() < exact.memory_bytes()
+    for target in vectors[:10]:
+        expected = exact.query(target_embedding=target.tolist(), top_k=5)
+        found = compressed.query(target_embedding=target.tolist(), top_k=5)
+        # Shortlisted rows are rescored from float32, so the similarities are exact
+        assert [r["similarity"] for r in found] == [r["similarity"] for r in expected]
+
+
+def test_processes_sharing_a_directory_never_overwrite_each_other(tmp_path):
+    # Two handles on one directory stand in for two serve workers
+    first, second = open_index(tmp_path), open_index(tmp_path)
+    vectors = random_vectors(12)
+    first.upsert(items(vectors[:3]))
+    # `second` has not seen these rows and must not hand them out again
+    second.upsert(items(vectors[3:9], start=3))
+    first.delete(["4"])
+    second.upsert([{"id": "4", "embedding": vectors[9].tolist()}])
+    first.upsert(items(vectors[10:], start=10))
+
+    reopened = open_index(tmp_path)
+    expected = {**{str(i): vectors[i] for i in range(12) if i != 9}, "4": vectors[9]}
+    assert len(reopened) == len(expected)
+    for item_id, vector in expected.items():
+        np.testing.assert_array_equal(reopened.get(item_id), vector)
+
+    # Each handle picked up the rows it wrote over, and only holds live items
+    assert first.query(target_embedding=vectors[10], top_k=1)[0]["id"] == "10"
+    np.testing.assert_array_equal(first.get("4"), vectors[9])
+    assert second.delete(["0", "11"]) == 2
+    assert open_index(tmp_path).get("0") is None
+
+
+def test_queries_see_writes_from_another_process(tmp_path):
+    first, second = open_index(tmp_path, storage="int8", ann_nlist=4), open_index(tmp_path, storage="int8", ann_nlist=4)
+    vectors = random_vectors(40)
+    first.upsert(items(vectors[:10]))
+    assert second.query(target_embedding=vectors[3], top_k=1)[0]["id"] == "3"
+
+    # Written through `second` after it grew the file past `first`'s capacity
+    second.upsert(items(vectors[10:40], start=10))
+    assert first.get_stats()["items"] == 40
+    assert first.query(target_embedding=vectors[25], top_k=1)[0]["id"] == "25"
+    np.testing.assert_array_equal(first.get("39"), vectors[39])
+
+    second.delete(["25"])
+    assert first.get("25") is None
+    assert all(r["id"] != "25" for r in first.query(target_embedding=vectors[25], top_k=5))
+
+    # An ANN index trained by one process is picked up by the other
+    second.build_ann()
+    assert first.get_stats()["ann"]["vectors"] == 39
+    assert first.query(target_embedding=vectors[7], top_k=1, approximate=True, nprobe=4)[0]["id"] == "7"
+
+
+def test_int8_round_trip_error_is_small():
+    vectors = random_vectors(20)
+    codes, scales = quantize_int8(vectors)
+    assert codes.dtype == np.int8
+    np.testing.assert_allclose(dequantize_int8(codes, scales), vectors, atol=np.abs(vectors).max() / 127)
+
+
+def test_product_quantizer_scores_approximate_inner_products():
+    vectors = random_vectors(600)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    pq = ProductQuantizer(DIMENSIONS, subspaces=4)
+    pq.train(vectors)
+    codes = pq.encode(vectors)
+    assert codes.shape == (600, 4)
+    assert codes.dtype == np.uint8
+
+    query = vectors[0]
+    approx = pq.scores(codes, pq.inner_product_table(query))
+    np.testing.assert_allclose(approx, pq.decode(codes) @ query, rtol=1e-4, atol=1e-5)
+    # The nearest neighbour by PQ estimate is among the true top 10
+    assert int(np.argmax(approx)) in np.argsort(-(vectors @ query))[:10].tolist()
+
+
+def test_settings_treat_empty_values_as_unset(tmp_path, monkeypatch):
+    monkeypatch.setenv("EMBEDDING_INDEX_DIR", str(tmp_path))
+    monkeypatch.setenv("EMBEDDING_INDEX_RESCORE_FACTOR", "")
+    monkeypatch.setenv("EMBEDDING_INDEX_STORAGE", "int8")
+    monkeypatch.setenv("EMBEDDING_INDEX_ANN_NPROBE", "not-a-number")
+    monkeypatch.setattr(embedding_index_module, "_embedding_index", None)
+
+    index = embedding_index_module.get_embedding_index()
+    try:
+        assert index.rescore_factor == 4
+        assert index.ann_nprobe == 8
+    finally:
+        index.close()
+        monkeypatch.setattr(embedding_index_module, "_embedding_index", None)
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from bg_remove_service.embedding_service import encode_embedding, top_k_indices
+
+
+def reference_find_most_compatible(target: list[float], candidates: list[dict], top_k: int) -> list[dict]:
+    """The per-candidate loop that find_most_compatible replaced."""
+    results = []
+    for candidate in candidates:
+        e1, e2 = np.array(target), np.array(candidate["embedding"])
+        norm1, norm2 = np.linalg.norm(e1), np.linalg.norm(e2)
+        similarity = 0.0 if norm1 == 0 or norm2 == 0 else float(np.dot(e1, e2) / (norm1 * norm2))
+        results.append({
+            "id": candidate["id"],
+            "similarity": round(similarity, 4),
+            "compatibility_score": round((similarity + 1) * 50, 2),
+            **{k: v for k, v in candidate.items() if k not in ["id", "embedding"]},
+        })
+    results.sort(key=lambda x: x["similarity"], reverse=True)
+    return results[:top_k]
+
+
+def assert_same_results(found: list[dict], expected: list[dict]):
+    assert [r["id"] for r in found] == [r["id"] for r in expected]
+    for got, want in zip(found, expected):
+        # float32 matmul against the float64 loop: at most one unit in the last rounded digit
+        assert got["similarity"] == pytest.approx(want["similarity"], abs=1.01e-4)
+        assert got["compatibility_score"] == pytest.approx(want["compatibility_score"], abs=0.0101)
+        assert {k: v for k, v in got.items() if k not in ("similarity", "compatibility_score")} == \
+               {k: v for k, v in want.items() if k not in ("similarity", "compatibility_score")}
+
+
+def candidates_for(vectors: np.ndarray) -> list[dict]:
+    return [{"id": f"item{i}", "embedding": vector.tolist(), "brand": f"b{i % 3}"} for i, vector in enumerate(vectors)]
+
+
+@pytest.mark.parametrize("n, top_k", [(1, 5), (7, 7), (50, 5), (300, 20), (40, 100)])
+def test_matches_the_per_candidate_loop(embedding_service, n, top_k):
+    rng = np.random.default_rng(n)
+    vectors = rng.normal(size=(n, 64)).astype(np.float32)
+    target = rng.normal(size=64).astype(np.float32).tolist()
+    candidates = candidates_for(vectors)
+    expected = reference_find_most_compatible(target, candidates, top_k)
+
+    assert_same_results(embedding_service.find_most_compatible(target, candidates, top_k), expected)
+    # The same candidates sent packed, and as base64 float32
+    packed = embedding_service.find_most_compatible_packed(
+        encode_embedding(np.asarray(target, dtype=np.float32)), [c["id"] for c in candidates], vectors, top_k
+    )
+    assert_same_results(packed, [{k: r[k] for k in ("id", "similarity", "compatibility_score")} for r in expected])
+
+
+def test_ties_and_zero_vectors_keep_input_order(embedding_service):
+    rng = np.random.default_rng(1)
+    target = rng.normal(size=64).astype(np.float32)
+    # Duplicated vectors score exactly alike; zero vectors all score 0
+    vectors = np.concatenate([np.tile(target, (6, 1)), np.zeros((4, 64), dtype=np.float32),
+                              np.tile(-target, (5, 1))])
+    vectors = vectors[rng.permutation(len(vectors))]
+    candidates = candidates_for(vectors)
+
+    for top_k in (1, 3, 6, 8, 15):
+        expected = reference_find_most_compatible(target.tolist(), candidates, top_k)
+        assert_same_results(embedding_service.find_most_compatible(target.tolist(), candidates, top_k), expected)
+
+
+def test_top_k_indices_is_a_stable_partial_sort():
+    rng = np.random.default_rng(2)
+    for _ in range(200):
+        n = int(rng.integers(1, 100))
+        scores = rng.integers(0, 4, n).astype(np.float32)
+        top_k = int(rng.integers(0, n + 3))
+        expected = sorted(range(n), key=lambda i: -scores[i])[:top_k]
+        assert top_k_indices(scores, top_k).tolist() == expected
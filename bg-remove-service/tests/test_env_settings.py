@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+
+import bg_remove_service
+from bg_remove_service.env_settings import env_float, env_int
+
+
+# Numeric settings read at import time or by the singleton factories
+NUMERIC_SETTINGS = [
+    "LLM_PACK_SIZE", "EMBEDDING_BATCH_MAX_SIZE", "EMBEDDING_BATCH_MAX_WAIT_MS",
+    "SEGMENTATION_WORKERS", "SEGMENTATION_MAX_QUEUE", "EMBEDDING_WORKERS", "CPU_POOL_WORKERS",
+    "LLM_MAX_CONCURRENCY", "LLM_TIMEOUT_SECONDS", "LLM_MAX_RETRIES", "LLM_BACKOFF_BASE_SECONDS",
+    "LLM_BACKOFF_MAX_SECONDS", "RESULT_CACHE_MAX_BYTES", "RESULT_CACHE_DISK_MAX_BYTES",
+    "QUANTIZATION_CALIBRATION_SIZE", "LLM_IMAGE_MAX_SIDE", "LLM_IMAGE_QUALITY",
+    "LLM_DEDUPE_MAX_DISTANCE", "SEGMENTATION_BATCH_SIZE", "TORCH_NUM_THREADS",
+    "TORCH_INTEROP_THREADS", "EMBEDDING_INDEX_RESCORE_FACTOR",
+]
+
+
+def test_empty_unset_and_invalid_values_give_the_default(monkeypatch):
+    monkeypatch.setenv("SETTING_EMPTY", "  ")
+    monkeypatch.setenv("SETTING_BAD", "lots")
+    monkeypatch.delenv("SETTING_UNSET", raising=False)
+
+    for name in ("SETTING_EMPTY", "SETTING_BAD", "SETTING_UNSET"):
+        assert env_int(name, 3) == 3
+        assert env_float(name, 0.5) == 0.5
+    assert env_int("SETTING_UNSET") is None
+
+
+def test_values_are_parsed(monkeypatch):
+    monkeypatch.setenv("SETTING_INT", " 12 ")
+    monkeypatch.setenv("SETTING_FLOAT", "2.5")
+
+    assert env_int("SETTING_INT", 1) == 12
+    assert env_float("SETTING_INT", 1.0) == 12.0
+    assert env_float("SETTING_FLOAT", 1.0) == 2.5
+    # "2.5" is not an integer
+    assert env_int("SETTING_FLOAT", 1) == 1
+
+
+def test_app_imports_with_every_numeric_setting_empty(tmp_path):
+    env = {**os.environ, **{name: "" for name in NUMERIC_SETTINGS},
+           "EMBEDDING_INDEX_DIR": str(tmp_path / "index"), "RESULT_CACHE_PATH": str(tmp_path / "cache.sqlite"),
+           "OPENROUTER_API_KEY": "test",
+           "PYTHONPATH": os.path.dirname(os.path.dirname(bg_remove_service.__file__))}
+    code = ("from bg_remove_service import main, segmentation, runtime_config; "
+            "from bg_remove_service.executors import get_executor; get_executor('cpu'); "
+            "runtime_config.apply_runtime_config(); "
+            "print(main.LLM_PACK_SIZE, segmentation.SEGMENTATION_BATCH_SIZE)")
+    result = subprocess.run([sys.executable, "-c", code], env=env, cwd=tmp_path,
+                            capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == "1 4"
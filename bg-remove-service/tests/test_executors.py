@@ -0,0 +1,85 @@
+import asyncio
+import threading
+
+import pytest
+
+from bg_remove_service.batching import MicroBatcher
+from bg_remove_service.executors import ModelExecutor, ServiceSaturated
+
+
+def test_rejects_beyond_workers_plus_queue():
+    executor = ModelExecutor("test", max_workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def run():
+        jobs = [asyncio.ensure_future(executor.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(ServiceSaturated):
+            await executor.run(lambda: None)
+        release.set()
+        await asyncio.gather(*jobs)
+
+    asyncio.run(run())
+    assert executor.rejected == 1
+    assert executor.in_flight == 0
+    assert executor.completed == 2
+
+
+def test_cancelled_caller_keeps_its_slot_until_the_job_ends():
+    executor = ModelExecutor("test", max_workers=1, max_queue=0)
+    started, release = threading.Event(), threading.Event()
+
+    def blocking():
+        started.set()
+        release.wait()
+
+    async def run():
+        task = asyncio.ensure_future(executor.run(blocking))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait)
+        task.cancel()
+        await asyncio.sleep(0.05)
+        # The job is still running on the only worker
+        assert executor.in_flight == 1
+        with pytest.raises(ServiceSaturated):
+            await executor.run(lambda: None)
+
+        release.set()
+        for _ in range(100):
+            if executor.in_flight == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert executor.in_flight == 0
+        assert await executor.run(lambda: 42) == 42
+
+    asyncio.run(run())
+
+
+def test_cancelled_queued_job_frees_its_slot():
+    executor = ModelExecutor("test", max_workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def run():
+        running = asyncio.ensure_future(executor.run(release.wait))
+        queued = asyncio.ensure_future(executor.run(lambda: None))
+        await asyncio.sleep(0.05)
+        queued.cancel()
+        await asyncio.sleep(0.05)
+        # The queued job was dropped before it started
+        assert executor.in_flight == 1
+        release.set()
+        await running
+
+    asyncio.run(run())
+
+
+def test_batcher_jobs_go_through_the_executor():
+    executor = ModelExecutor("test", max_workers=1, max_queue=4)
+    batcher = MicroBatcher(lambda items: [item * 2 for item in items], max_batch_size=8,
+                           max_wait_ms=20, executor=executor)
+
+    async def run():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+
+    assert asyncio.run(run()) == [0, 2, 4, 6, 8]
+    assert executor.completed == 1
+    assert batcher.get_stats()["batches"] == 1
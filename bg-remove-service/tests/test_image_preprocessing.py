@@ -0,0 +1,73 @@
+import io
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image, ImageDraw, ImageFilter
+from torchvision import transforms
+
+from bg_remove_service.image_preprocessing import EmbeddingPreprocessor, decode_for_embedding
+
+
+# The per-image chain the batched preprocessor replaced
+TORCHVISION_CHAIN = transforms.Compose([
+    transforms.Resize(112),
+    transforms.CenterCrop(112),
+    transforms.ToTensor(),
+    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+])
+
+# Photo sizes and formats as uploaded: 12 MP phone shots both ways up, web-size images
+INPUTS = [(4032, 3024, "JPEG"), (3024, 4032, "JPEG"), (1200, 800, "PNG"),
+          (800, 1200, "PNG"), (640, 480, "JPEG"), (1000, 1000, "JPEG")]
+
+
+def photo(width: int, height: int, seed: int) -> Image.Image:
+    """Smooth background, blurred shapes and sensor noise: closer to a photo than flat colours."""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 1, width)[None, :, None]
+    y = np.linspace(0, 1, height)[:, None, None]
+    image = Image.fromarray((255 * (x * rng.random(3) + y * rng.random(3)) / 2).astype(np.uint8))
+    draw = ImageDraw.Draw(image)
+    for _ in range(25):
+        x0, y0 = rng.integers(0, width), rng.integers(0, height)
+        x1, y1 = x0 + rng.integers(width // 20, width // 3), y0 + rng.integers(height // 20, height // 3)
+        draw.ellipse([x0, y0, x1, y1], fill=tuple(rng.integers(0, 255, 3).tolist()))
+    image = image.filter(ImageFilter.GaussianBlur(max(width, height) / 800))
+    noisy = np.asarray(image) + rng.normal(0, 6, (height, width, 3))
+    return Image.fromarray(np.clip(noisy, 0, 255).astype(np.uint8))
+
+
+def encoded(image: Image.Image, format: str) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format, **({"quality": 90} if format == "JPEG" else {}))
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("width, height, format", INPUTS)
+def test_embeddings_stay_close_to_the_torchvision_path(embedding_service, width, height, format):
+    data = encoded(photo(width, height, seed=width + height), format)
+
+    reference = TORCHVISION_CHAIN(Image.open(io.BytesIO(data)).convert("RGB")).unsqueeze(0)
+    batched = EmbeddingPreprocessor()([decode_for_embedding(data)])
+
+    # Normalized units (1.0 ~ 58 grey levels). Draft JPEG decoding of mid-size images
+    # moves single edge pixels the most; the average barely changes
+    difference = (reference - batched).abs()
+    assert difference.mean() <= 0.03
+    assert difference.max() <= 0.75
+
+    with torch.inference_mode():
+        expected = embedding_service.model(reference)
+    found = torch.tensor(embedding_service.generate_embeddings_batch([decode_for_embedding(data)]))
+    assert torch.nn.functional.cosine_similarity(expected, found).item() >= 0.9995
+
+
+def test_batch_is_independent_of_its_neighbours():
+    images = [decode_for_embedding(encoded(photo(w, h, seed=w), f)) for w, h, f in INPUTS[2:5]]
+    preprocess = EmbeddingPreprocessor()
+
+    batch = preprocess(images)
+    assert batch.shape == (3, 3, 112, 112)
+    for i, image in enumerate(images):
+        torch.testing.assert_close(preprocess([image])[0], batch[i])
@@ -0,0 +1,57 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from openai import BadRequestError
+
+from bg_remove_service.llm_client import LLMClient
+
+
+RESPONSE_FORMAT = {"type": "json_schema", "json_schema": {"name": "items", "schema": {"type": "object"}}}
+
+
+def completion(content: str) -> dict:
+    return {
+        "id": "test",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "test",
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": content}}],
+    }
+
+
+def client_rejecting(message: str):
+    """Client whose provider answers 400 with `message` whenever response_format is sent."""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        requests.append(body)
+        if "response_format" in body:
+            return httpx.Response(400, json={"error": {"message": message, "code": 400}})
+        return httpx.Response(200, json=completion("[]"))
+
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return LLMClient("key", base_url="http://llm.test/v1", http_client=http_client), requests
+
+
+def test_unsupported_response_format_is_turned_off():
+    client, requests = client_rejecting("response_format is not supported by this model")
+
+    response = asyncio.run(client.chat([{"role": "user", "content": "hi"}], response_format=RESPONSE_FORMAT))
+
+    assert response.choices[0].message.content == "[]"
+    assert ["response_format" in body for body in requests] == [True, False]
+    assert not client.structured_output
+
+
+def test_other_bad_requests_keep_structured_output():
+    client, requests = client_rejecting("image_url is not a valid URL")
+
+    with pytest.raises(BadRequestError):
+        asyncio.run(client.chat([{"role": "user", "content": "hi"}], response_format=RESPONSE_FORMAT))
+
+    assert len(requests) == 1
+    assert client.structured_output
@@ -0,0 +1,54 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from bg_remove_service.llm_image import dhash, duplicate_groups
+
+
+def photo(seed: int, size: tuple[int, int] = (400, 300)) -> Image.Image:
+    """Smooth random shapes, so the dHash has structure to compare."""
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 256, (6, 8, 3), dtype=np.uint8)
+    return Image.fromarray(coarse).resize(size, Image.BICUBIC)
+
+
+def recompressed(image: Image.Image, size: tuple[int, int], quality: int) -> Image.Image:
+    buffer = io.BytesIO()
+    image.resize(size, Image.LANCZOS).save(buffer, "JPEG", quality=quality)
+    return Image.open(io.BytesIO(buffer.getvalue()))
+
+
+def test_near_duplicates_group_together():
+    shot = photo(0)
+    hashes = [dhash(shot), dhash(recompressed(shot, (200, 150), 60)), dhash(recompressed(shot, (800, 600), 85))]
+
+    assert duplicate_groups(hashes, max_distance=4) == {0: [0, 1, 2]}
+
+
+def test_distinct_images_stay_apart():
+    hashes = [dhash(photo(seed)) for seed in range(4)]
+
+    assert duplicate_groups(hashes, max_distance=4) == {0: [0], 1: [1], 2: [2], 3: [3]}
+
+
+def test_threshold_boundary_is_inclusive():
+    base = 0b1011_0110
+    four_bits_off = base ^ 0b1111
+    five_bits_off = base ^ 0b1_1111
+
+    assert duplicate_groups([base, four_bits_off], max_distance=4) == {0: [0, 1]}
+    assert duplicate_groups([base, five_bits_off], max_distance=4) == {0: [0], 1: [1]}
+    assert duplicate_groups([base, base], max_distance=0) == {0: [0, 1]}
+
+
+def test_negative_threshold_disables_dedupe():
+    value = dhash(photo(0))
+
+    assert duplicate_groups([value, value, value], max_distance=-1) == {0: [0], 1: [1], 2: [2]}
+
+
+def test_undecoded_images_are_left_out():
+    value = dhash(photo(0))
+
+    assert duplicate_groups([None, value, None, value], max_distance=4) == {1: [1, 3]}
@@ -0,0 +1,75 @@
+from typing import Optional
+
+import pytest
+from pydantic import BaseModel
+
+from bg_remove_service.llm_json import (
+    IncrementalArrayParser,
+    parse_json_reply,
+    repair_json,
+    validate_items,
+)
+
+
+class Item(BaseModel):
+    category: str
+    color: Optional[str] = None
+
+
+def test_clean_json_is_not_marked_repaired():
+    assert parse_json_reply('[{"category": "tops"}]') == ([{"category": "tops"}], False)
+
+
+def test_prose_and_code_fences_are_skipped():
+    reply = 'Here you go:\n```json\n[{"category": "tops"}]\n```\nAnything else?'
+    assert parse_json_reply(reply) == ([{"category": "tops"}], False)
+
+
+def test_trailing_commas_are_dropped():
+    value, repaired = parse_json_reply('{"items": [{"category": "tops",}, ],}')
+    assert value == {"items": [{"category": "tops"}]}
+    assert repaired
+
+
+def test_truncated_reply_keeps_complete_elements():
+    value, repaired = parse_json_reply('[{"category": "tops"}, {"category": "bottoms"}, {"categ')
+    assert value == [{"category": "tops"}, {"category": "bottoms"}]
+    assert repaired
+
+
+def test_brackets_inside_strings_are_not_structure():
+    value, _ = parse_json_reply('[{"category": "tops", "color": "red ] \\" {"}]')
+    assert value == [{"category": "tops", "color": 'red ] " {'}]
+
+
+def test_opener_selects_the_container_kind():
+    assert parse_json_reply('{"note": 1} [1, 2]', opener="[") == ([1, 2], False)
+
+
+def test_defect_inside_the_container_keeps_what_precedes_it():
+    value, repaired = parse_json_reply('[{"category": "tops"}, {"category": tops}]')
+    assert value == [{"category": "tops"}]
+    assert repaired
+
+
+def test_reply_without_json_raises():
+    with pytest.raises(ValueError):
+        repair_json("I could not find any clothing in this image.")
+
+
+def test_validate_items_drops_only_bad_elements():
+    items, dropped = validate_items(Item, [{"category": "tops"}, {"color": "red"}, "oops"])
+    assert [item.category for item in items] == ["tops"]
+    assert dropped == 2
+    with pytest.raises(ValueError):
+        validate_items(Item, {"category": "tops"})
+
+
+def test_incremental_parser_yields_elements_as_they_complete():
+    parser = IncrementalArrayParser()
+    assert parser.feed('Sure! {"items": [{"category": "to') == []
+    assert parser.feed('ps"}, {"category"') == [{"category": "tops"}]
+    assert parser.feed(': "shoes"},') == [{"category": "shoes"}]
+    assert parser.feed(' {"category": "bags",}]} trailing') == [{"category": "bags"}]
+    assert parser.done
+    assert parser.feed('[{"category": "late"}]') == []
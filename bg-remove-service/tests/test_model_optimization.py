@@ -0,0 +1,76 @@
+import pytest
+import torch
+
+from bg_remove_service.embedding_service import SimpleEmbeddingNet
+from bg_remove_service.model_optimization import (
+    compare_outputs,
+    fold_batchnorm,
+    freeze_model,
+    is_frozen_artifact,
+    load_frozen,
+    save_frozen,
+)
+
+
+# Largest allowed absolute difference per embedding value
+TOLERANCE = 1e-4
+
+
+def eager_model() -> torch.nn.Module:
+    """Random weights with non-trivial BatchNorm statistics, so folding actually changes the convs."""
+    torch.manual_seed(0)
+    model = SimpleEmbeddingNet(embedding_size=64, pretrained=False)
+    for module in model.modules():
+        if isinstance(module, torch.nn.BatchNorm2d):
+            module.running_mean.uniform_(-0.2, 0.2)
+            module.running_var.uniform_(0.5, 1.5)
+            module.weight.data.uniform_(0.5, 1.5)
+            module.bias.data.uniform_(-0.2, 0.2)
+    return model.eval()
+
+
+@pytest.fixture(scope="module")
+def frozen_artifact(tmp_path_factory):
+    """Frozen graph saved and loaded exactly as the service does, plus a reference eager model."""
+    eager = eager_model()
+    frozen = freeze_model(eager_model(), torch.randn(8, 3, 112, 112))
+    path = str(tmp_path_factory.mktemp("frozen") / "model.pt")
+    save_frozen(frozen, path, {"model_version": "test"})
+    return eager, path
+
+
+def test_folded_model_matches_eager():
+    eager = eager_model()
+    folded = fold_batchnorm(eager_model())
+    assert not any(isinstance(m, torch.nn.BatchNorm2d) for m in folded.modules())
+
+    batch = torch.randn(4, 3, 112, 112)
+    with torch.no_grad():
+        metrics = compare_outputs(eager(batch), folded(batch))
+    assert metrics["max_abs_diff"] <= TOLERANCE
+
+
+@pytest.mark.parametrize("batch_size", [1, 8, 32])
+def test_frozen_model_matches_eager(frozen_artifact, batch_size):
+    eager, path = frozen_artifact
+    loaded, metadata = load_frozen(path, torch.device("cpu"))
+    assert metadata == {"model_version": "test"}
+
+    batch = torch.randn(batch_size, 3, 112, 112)
+    with torch.no_grad():
+        reference = eager(batch)
+        candidate = loaded(batch.contiguous(memory_format=torch.channels_last))
+    metrics = compare_outputs(reference, candidate)
+
+    assert candidate.shape == (batch_size, 64)
+    assert metrics["max_abs_diff"] <= TOLERANCE
+    assert metrics["min_cosine"] >= 0.9999
+
+
+def test_frozen_artifact_is_recognized(frozen_artifact, tmp_path):
+    _, path = frozen_artifact
+    assert is_frozen_artifact(path)
+
+    checkpoint = tmp_path / "checkpoint.pth"
+    torch.save({"state_dict": {}}, checkpoint)
+    assert not is_frozen_artifact(str(checkpoint))
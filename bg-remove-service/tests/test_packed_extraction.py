@@ -0,0 +1,139 @@
+import asyncio
+import io
+import json
+from types import SimpleNamespace
+
+import httpx
+import numpy as np
+import pytest
+from PIL import Image
+
+from bg_remove_service import main
+from bg_remove_service.main import ExtractedItem, extract_attributes_packed, parse_packed_items
+
+
+SHIRT = {"category": "tops", "color": "white", "name": "White T-Shirt"}
+JEANS = {"category": "bottoms", "color": "blue", "name": "Blue Jeans"}
+SHOES = {"category": "footwear", "color": "black", "name": "Black Sneakers"}
+
+
+def reply(content: str) -> SimpleNamespace:
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class FakeLLM:
+    """Answers packed calls with `packed_reply` and single-image calls with one shirt."""
+
+    def __init__(self, packed_reply: str):
+        self.packed_reply = packed_reply
+        self.packed_calls = 0
+        self.single_calls = 0
+
+    async def chat(self, messages, response_format=None):
+        images = sum(1 for part in messages[-1]["content"] if part["type"] == "image_url")
+        if images > 1:
+            self.packed_calls += 1
+            return reply(self.packed_reply)
+        self.single_calls += 1
+        return reply(json.dumps([SHIRT]))
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    def install(packed_reply: str) -> FakeLLM:
+        fake = FakeLLM(packed_reply)
+        monkeypatch.setattr(main, "llm_client", fake)
+        monkeypatch.setattr(main, "result_cache", None)
+        return fake
+    return install
+
+
+def test_clean_packed_reply_is_split_per_image():
+    results, clean = parse_packed_items(json.dumps({"0": [SHIRT], "1": [JEANS, SHOES]}), 2)
+
+    assert clean
+    assert results == [[ExtractedItem(**SHIRT)], [ExtractedItem(**JEANS), ExtractedItem(**SHOES)]]
+
+
+def test_non_json_reply_leaves_every_image_for_a_retry():
+    assert parse_packed_items("Sorry, I cannot help with that.", 3) == ([None, None, None], False)
+    # An array is not the packed shape either
+    results, _ = parse_packed_items(json.dumps([SHIRT]), 2)
+    assert results == [None, None]
+
+
+def test_missing_image_entries_are_retried_and_extra_ones_ignored():
+    too_few, _ = parse_packed_items(json.dumps({"0": [SHIRT]}), 3)
+    too_many, clean = parse_packed_items(json.dumps({"0": [SHIRT], "1": [], "2": [JEANS]}), 2)
+
+    assert too_few == [[ExtractedItem(**SHIRT)], None, None]
+    assert too_many == [[ExtractedItem(**SHIRT)], []]
+    assert clean
+
+
+def test_items_with_missing_keys_are_dropped_and_extra_keys_ignored():
+    incomplete = {"category": "tops", "color": "red"}
+    results, clean = parse_packed_items(json.dumps({"0": [incomplete, JEANS], "1": [{**SHOES, "pattern": "plain"}]}), 2)
+
+    assert results == [[ExtractedItem(**JEANS)], [ExtractedItem(**SHOES)]]
+    # Not clean, so the partial result is not cached
+    assert not clean
+
+
+def test_one_invalid_entry_is_retried_for_that_image_only():
+    results, clean = parse_packed_items(json.dumps({"0": [SHIRT], "1": "a shirt", "2": [JEANS]}), 3)
+
+    assert results == [[ExtractedItem(**SHIRT)], None, [ExtractedItem(**JEANS)]]
+    assert clean
+
+
+def test_extract_attributes_packed_returns_none_only_for_the_invalid_image(llm):
+    fake = llm(json.dumps({"0": [JEANS], "1": {"oops": True}, "2": [SHOES]}))
+    images = [Image.new("RGB", (32, 32), color) for color in ("red", "green", "blue")]
+
+    results = asyncio.run(extract_attributes_packed(images))
+
+    assert results == [[ExtractedItem(**JEANS)], None, [ExtractedItem(**SHOES)]]
+    assert fake.packed_calls == 1 and fake.single_calls == 0
+
+
+def distinct_png(seed: int) -> bytes:
+    rng = np.random.default_rng(seed)
+    image = Image.fromarray(rng.integers(0, 256, (6, 8, 3), dtype=np.uint8)).resize((64, 48), Image.BICUBIC)
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def post_batch(files: list[tuple]) -> dict:
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post("/batch/extract-attributes", files=files)
+        assert response.status_code == 200
+        return response.json()
+
+    return asyncio.run(run())
+
+
+def test_batch_falls_back_to_a_single_call_for_the_invalid_image_only(llm, monkeypatch):
+    monkeypatch.setattr(main, "LLM_PACK_SIZE", 3)
+    fake = llm(json.dumps({"0": [JEANS], "1": "not a list", "2": [SHOES]}))
+    files = [("files", (f"{i}.png", distinct_png(i), "image/png")) for i in range(3)]
+
+    body = post_batch(files)
+
+    items = {result["image_index"]: [item["name"] for item in result["items"]] for result in body["results"]}
+    assert items == {0: ["Blue Jeans"], 1: ["White T-Shirt"], 2: ["Black Sneakers"]}
+    assert fake.packed_calls == 1 and fake.single_calls == 1
+
+
+def test_batch_falls_back_per_image_when_the_packed_reply_is_not_json(llm, monkeypatch):
+    monkeypatch.setattr(main, "LLM_PACK_SIZE", 2)
+    fake = llm("I see two photos of clothes.")
+    files = [("files", (f"{i}.png", distinct_png(i), "image/png")) for i in range(2)]
+
+    body = post_batch(files)
+
+    assert [len(result["items"]) for result in body["results"]] == [1, 1]
+    assert fake.packed_calls == 1 and fake.single_calls == 2
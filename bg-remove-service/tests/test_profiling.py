@@ -0,0 +1,99 @@
+import asyncio
+import cProfile
+import os
+import pstats
+from types import SimpleNamespace
+
+import pytest
+
+from bg_remove_service import profiling
+from bg_remove_service.executors import ModelExecutor
+from bg_remove_service.profiling import ProfileSession, ProfilingMiddleware, get_profiler
+from bg_remove_service.tracing import TracingMiddleware
+
+
+def busy_work(n: int) -> int:
+    return sum(i * i for i in range(n))
+
+
+def pool_app(executor: ModelExecutor):
+    """ASGI app whose only route runs one job on `executor`."""
+    async def app(scope, receive, send):
+        result = await executor.run(busy_work, 20_000)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": str(result).encode()})
+    return TracingMiddleware(ProfilingMiddleware(app))
+
+
+def get(app, path: str) -> int:
+    scope = {"type": "http", "method": "GET", "path": path, "headers": [], "query_string": b""}
+    statuses = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    # asyncio.run also waits for the capture to be written on the default executor
+    asyncio.run(app(scope, receive, send))
+    return statuses[0]
+
+
+@pytest.fixture
+def profiler(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path))
+    profiler = get_profiler()
+    yield profiler
+    profiler.stop()
+
+
+def test_profiled_request_includes_its_pool_job(profiler):
+    executor = ModelExecutor("cpu")
+    profiler.start(ProfileSession("/work", torch=False))
+
+    assert get(pool_app(executor), "/work") == 200
+
+    capture = profiler.captures[-1]
+    assert capture["endpoint"] == "/work"
+    assert capture["python_jobs_skipped"] == 0
+    functions = {name for _, _, name in pstats.Stats(capture["files"]["pstats"]).stats}
+    assert "busy_work" in functions
+    executor.pool.shutdown()
+
+
+class ExclusiveProfile(cProfile.Profile):
+    """cProfile as it behaves from Python 3.12: one enabled profile per process."""
+    active = False
+
+    def enable(self, *args, **kwargs):
+        if ExclusiveProfile.active:
+            raise ValueError("Another profiling tool is already active")
+        ExclusiveProfile.active = True
+        super().enable(*args, **kwargs)
+
+    def disable(self):
+        super().disable()
+        ExclusiveProfile.active = False
+
+
+def test_profiled_request_still_runs_when_another_profiler_is_active(profiler, monkeypatch):
+    monkeypatch.setattr(profiling, "cProfile", SimpleNamespace(Profile=ExclusiveProfile))
+    executor = ModelExecutor("cpu")
+    profiler.start(ProfileSession("/work", torch=False))
+
+    held = ExclusiveProfile()
+    held.enable()
+    try:
+        status = get(pool_app(executor), "/work")
+    finally:
+        held.disable()
+
+    assert status == 200
+    capture = profiler.captures[-1]
+    # Neither the loop nor the job could be profiled, and nothing was written
+    assert capture["python_jobs_skipped"] == 1
+    assert capture["files"] == {}
+    assert not os.listdir(profiling.profile_dir())
+    executor.pool.shutdown()
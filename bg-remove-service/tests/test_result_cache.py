@@ -0,0 +1,79 @@
+import time
+
+from PIL import Image
+
+from bg_remove_service.result_cache import ResultCache, content_key
+
+
+def test_content_key_depends_on_pixels_not_encoding():
+    red = Image.new("RGB", (4, 4), (255, 0, 0))
+    assert content_key(red) == content_key(red.copy())
+    assert content_key(red) != content_key(Image.new("RGB", (4, 4), (0, 0, 255)))
+    assert content_key(red) != content_key(red.convert("RGBA"))
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ResultCache(max_bytes=10)
+    cache.register("mask", "v1")
+    cache.set("mask", "a", b"aaaa")
+    cache.set("mask", "b", b"bbbb")
+    assert cache.get("mask", "a") == b"aaaa"
+    cache.set("mask", "c", b"cccc")
+
+    assert cache.get("mask", "b") is None
+    assert cache.get("mask", "a") == b"aaaa"
+    stats = cache.get_stats()
+    assert stats["memory_bytes"] == 8
+    assert stats["namespaces"]["mask"]["evictions"] == 1
+
+
+def test_new_version_drops_old_entries(tmp_path):
+    cache = ResultCache(disk_path=str(tmp_path / "cache.sqlite"))
+    cache.register("embedding", "v1")
+    cache.set("embedding", "k", b"old")
+    cache.register("embedding", "v2")
+
+    assert cache.get("embedding", "k") is None
+    assert cache.get_stats()["disk_entries"] == 0
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = ResultCache(disk_path=path)
+    cache.register("mask", "v1")
+    cache.set("mask", "k", b"value")
+    cache.close()
+
+    reopened = ResultCache(disk_path=path)
+    reopened.register("mask", "v1")
+    assert reopened.get("mask", "k") == b"value"
+    assert reopened.get_stats()["namespaces"]["mask"]["disk_hits"] == 1
+    assert reopened.get_stats()["disk_bytes"] == 5
+
+
+def test_disk_tier_trims_least_recently_used(tmp_path):
+    cache = ResultCache(max_bytes=0, disk_path=str(tmp_path / "cache.sqlite"), max_disk_bytes=1000)
+    cache.register("mask", "v1")
+    for i in range(10):
+        cache.set("mask", str(i), bytes(100))
+        time.sleep(0.001)
+    # Touch the oldest entry so it survives the next trim
+    assert cache.get("mask", "0") is not None
+
+    cache.set("mask", "10", bytes(100))
+    stats = cache.get_stats()
+    assert stats["disk_bytes"] <= 900
+    assert cache.get("mask", "0") is not None
+    assert cache.get("mask", "1") is None
+    assert cache.get("mask", "10") is not None
+
+
+def test_disk_totals_track_replacements(tmp_path):
+    cache = ResultCache(disk_path=str(tmp_path / "cache.sqlite"))
+    cache.register("mask", "v1")
+    cache.set("mask", "k", bytes(10))
+    cache.set("mask", "k", bytes(30))
+
+    stats = cache.get_stats()
+    assert stats["disk_entries"] == 1
+    assert stats["disk_bytes"] == 30
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+import torch
+import torch.nn.functional as F
+from PIL import Image
+
+from bg_remove_service.segmentation import RMBG_INPUT_SIZE, predict_masks
+
+
+class StubRMBG(torch.nn.Module):
+    """Stands in for RMBG-1.4: returns the channel mean as the matte and records its inputs."""
+
+    def __init__(self):
+        super().__init__()
+        self.inputs = []
+
+    def forward(self, batch):
+        self.inputs.append(batch.clone())
+        matte = batch.mean(dim=1, keepdim=True)
+        return [matte], [matte]
+
+
+def gradient_image(width: int, height: int, seed: int) -> Image.Image:
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width)[None, :, None]
+    y = np.linspace(0, 255, height)[:, None, None]
+    pixels = (x * rng.random(3) + y * rng.random(3)) / 2
+    return Image.fromarray(pixels.astype(np.uint8))
+
+
+def pipeline_mask(model: torch.nn.Module, image: Image.Image) -> np.ndarray:
+    """The RMBG-1.4 pipeline's own pre/post-processing, one image at a time."""
+    pixels = torch.tensor(np.array(image), dtype=torch.float32).permute(2, 0, 1).unsqueeze(0)
+    pixels = F.interpolate(pixels, size=RMBG_INPUT_SIZE, mode="bilinear") / 255.0
+    pixels = (pixels - 0.5) / 1.0
+    with torch.inference_mode():
+        result = model(pixels)[0][0]
+    result = F.interpolate(result, size=(image.height, image.width), mode="bilinear")[0, 0]
+    ma, mi = torch.max(result), torch.min(result)
+    result = (result - mi) / (ma - mi)
+    return (result * 255).numpy().astype(np.uint8)
+
+
+def test_batched_masks_match_the_pipeline_across_sizes():
+    images = [gradient_image(320, 240, 0), gradient_image(97, 211, 1), gradient_image(640, 480, 2)]
+    model = StubRMBG()
+
+    masks = predict_masks(model, images, torch.device("cpu"), batch_size=2)
+
+    assert [batch.shape[0] for batch in model.inputs] == [2, 1]
+    for image, mask in zip(images, masks):
+        assert mask.shape == (image.height, image.width)
+        assert mask.dtype == np.uint8
+        np.testing.assert_array_equal(mask, pipeline_mask(StubRMBG(), image))
+
+
+def test_inputs_are_resized_and_normalized():
+    model = StubRMBG()
+    images = [Image.new("RGB", (50, 30), (255, 0, 128)), Image.new("L", (20, 40), 64)]
+
+    predict_masks(model, images, torch.device("cpu"))
+
+    batch = model.inputs[0]
+    assert batch.shape == (2, 3, *RMBG_INPUT_SIZE)
+    expected = torch.tensor([[255, 0, 128], [64, 64, 64]], dtype=torch.float32) / 255 - 0.5
+    np.testing.assert_allclose(batch.mean(dim=(2, 3)), expected, atol=1e-5)
+    # Solid colours stay solid after the resize
+    assert torch.all(batch.amax(dim=(2, 3)) - batch.amin(dim=(2, 3)) < 1e-5)
@@ -0,0 +1,87 @@
+import dotenv
+import pytest
+
+from bg_remove_service import serve
+
+
+SERVE_SETTINGS = ("HOST", "PORT", "SERVE_WORKERS", "SERVE_THREADS_PER_WORKER",
+                  "SERVE_SHARED_MEMORY", "SERVE_PIN_WORKERS", "LOG_LEVEL")
+
+
+@pytest.fixture(autouse=True)
+def clean_env(monkeypatch):
+    for name in SERVE_SETTINGS:
+        # Recorded first, so whatever a test (or load_dotenv) sets is undone afterwards
+        monkeypatch.setenv(name, "")
+        monkeypatch.delenv(name)
+
+
+def test_defaults_without_settings():
+    args = serve.parse_args([])
+
+    assert (args.host, args.port, args.workers, args.threads) == ("0.0.0.0", 8001, 1, 0)
+    assert not args.shared_memory and not args.pin_workers
+    assert args.log_level == "info"
+
+
+def test_defaults_come_from_the_environment(monkeypatch):
+    monkeypatch.setenv("HOST", "127.0.0.1")
+    monkeypatch.setenv("PORT", "9000")
+    monkeypatch.setenv("SERVE_WORKERS", "4")
+    monkeypatch.setenv("SERVE_THREADS_PER_WORKER", "2")
+    monkeypatch.setenv("SERVE_SHARED_MEMORY", "TRUE")
+    monkeypatch.setenv("SERVE_PIN_WORKERS", "true")
+    monkeypatch.setenv("LOG_LEVEL", "warning")
+
+    args = serve.parse_args([])
+
+    assert (args.host, args.port, args.workers, args.threads) == ("127.0.0.1", 9000, 4, 2)
+    assert args.shared_memory and args.pin_workers
+    assert args.log_level == "warning"
+
+
+def test_flags_override_the_environment(monkeypatch):
+    monkeypatch.setenv("PORT", "9000")
+    monkeypatch.setenv("SERVE_WORKERS", "4")
+
+    args = serve.parse_args(["--port", "9100", "--workers", "2", "--shared-memory"])
+
+    assert (args.port, args.workers) == (9100, 2)
+    assert args.shared_memory
+
+
+def test_empty_or_invalid_numbers_use_the_defaults(monkeypatch):
+    monkeypatch.setenv("PORT", "")
+    monkeypatch.setenv("SERVE_WORKERS", "four")
+    monkeypatch.setenv("HOST", "")
+
+    args = serve.parse_args([])
+
+    assert (args.host, args.port, args.workers) == ("0.0.0.0", 8001, 1)
+
+
+def test_main_reads_dotenv_before_parsing_arguments(tmp_path, monkeypatch):
+    env_file = tmp_path / ".env"
+    env_file.write_text("PORT=9200\nSERVE_THREADS_PER_WORKER=3\nLOG_LEVEL=debug\n")
+    calls = {}
+
+    monkeypatch.setattr(serve, "load_dotenv", lambda: dotenv.load_dotenv(env_file))
+    monkeypatch.setattr(serve, "apply_runtime_config", lambda **kwargs: calls.update(runtime=kwargs))
+    monkeypatch.setattr(serve.uvicorn, "run", lambda app, **kwargs: calls.update(uvicorn=kwargs))
+    monkeypatch.setattr("sys.argv", ["serve"])
+
+    serve.main()
+
+    assert calls["runtime"] == {"threads": 3}
+    assert calls["uvicorn"]["port"] == 9200
+    assert calls["uvicorn"]["log_level"] == "debug"
+
+
+def test_worker_cpus_split_the_affinity(monkeypatch):
+    monkeypatch.setattr(serve, "affinity", lambda: [0, 1, 2, 3, 4])
+
+    assert serve.worker_cpus(0, 2, pin=True) == {0, 1}
+    assert serve.worker_cpus(1, 2, pin=True) == {2, 3}
+    # Not enough cores left for a full worker
+    assert serve.worker_cpus(2, 2, pin=True) is None
+    assert serve.worker_cpus(0, 2, pin=False) is None
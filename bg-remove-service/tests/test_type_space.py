@@ -0,0 +1,86 @@
+import asyncio
+import json
+
+import httpx
+import numpy as np
+import pytest
+
+from bg_remove_service import embedding_index as embedding_index_module
+from bg_remove_service import main
+from bg_remove_service.type_space import TypeSpace, create_type_space, load_typespaces
+
+
+def test_without_typespaces_every_pair_uses_the_general_space(monkeypatch, capsys):
+    monkeypatch.delenv("TYPESPACES_PATH", raising=False)
+    type_space = create_type_space(np.ones((4, 8), dtype=np.float32))
+
+    assert type_space.condition("tops", "bottoms") is None
+    assert type_space.condition("shoes", "shoes") is None
+    assert "general (unmasked) space" in capsys.readouterr().out
+
+
+def test_typespaces_file_maps_pairs_order_insensitively(tmp_path, monkeypatch):
+    path = tmp_path / "typespaces.json"
+    path.write_text(json.dumps({"tops|shoes": 2, "bottoms|tops": 0, "bags|tops": 9}))
+    monkeypatch.setenv("TYPESPACES_PATH", str(path))
+    type_space = create_type_space(np.ones((4, 8), dtype=np.float32))
+
+    # 'footwear' is the app's name for 'shoes'
+    assert type_space.condition("footwear", "Tops") == 2
+    assert type_space.condition("tops", "bottoms") == 0
+    # Index beyond the checkpoint's masks
+    assert type_space.condition("bags", "tops") is None
+    assert load_typespaces(str(path))[("shoes", "tops")] == 2
+
+
+def test_subspace_similarity_matches_masked_cosine():
+    rng = np.random.default_rng(0)
+    masks = rng.uniform(0, 1, size=(3, 8)).astype(np.float32)
+    type_space = TypeSpace(masks, {})
+    target = rng.normal(size=8).astype(np.float32)
+    matrix = rng.normal(size=(5, 8)).astype(np.float32)
+
+    projected_target = target * masks[1]
+    projected = matrix * masks[1]
+    expected = projected @ projected_target / (
+        np.linalg.norm(projected, axis=1) * np.linalg.norm(projected_target))
+    np.testing.assert_allclose(type_space.similarities(target, matrix, 1), expected, rtol=1e-5)
+    np.testing.assert_allclose(
+        type_space.similarities(target, matrix, 1, type_space.masked_norms(matrix)[:, 1]), expected, rtol=1e-5)
+
+
+def test_type_space_is_active_only_when_a_pair_maps_to_a_mask():
+    masks = np.ones((2, 8), dtype=np.float32)
+    assert not TypeSpace(masks, {}).active
+    assert not TypeSpace(masks, {("shoes", "tops"): 5}).active
+    assert TypeSpace(masks, {("shoes", "tops"): 1}).active
+
+
+def test_type_aware_index_query_without_typespaces_does_not_load_the_model(tmp_path, monkeypatch):
+    monkeypatch.delenv("TYPESPACES_PATH", raising=False)
+    monkeypatch.setenv("EMBEDDING_INDEX_DIR", str(tmp_path))
+    monkeypatch.setattr(embedding_index_module, "_embedding_index", None)
+    if main.embedding_model.loaded:
+        pytest.skip("the embedding model was loaded by another test")
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            await client.post("/index/upsert", json={"items": [
+                {"id": "a", "embedding": [1.0] * 64, "category": "tops"},
+                {"id": "b", "embedding": [0.5] * 64, "category": "shoes"},
+            ]})
+            query = await client.post("/index/query", json={"target_id": "a", "top_k": 1})
+            ready = await client.get("/ready")
+        return query, ready
+
+    try:
+        query, ready = asyncio.run(run())
+    finally:
+        embedding_index_module.get_embedding_index().close()
+        monkeypatch.setattr(embedding_index_module, "_embedding_index", None)
+
+    assert [r["id"] for r in query.json()["results"]] == ["b"]
+    assert not main.embedding_model.loaded
+    assert ready.json()["type_space"] == {"loaded": False, "typespaces_configured": False}
+
@@ -0,0 +1,80 @@
+import asyncio
+import io
+import tempfile
+
+from PIL import Image
+from starlette.datastructures import Headers, UploadFile
+
+from bg_remove_service import main
+from bg_remove_service.main import keep_uploads, stream_remove_background
+
+
+def png_bytes() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), (200, 10, 10)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def spooled_upload(data: bytes, filename: str = "a.png") -> UploadFile:
+    spooled = tempfile.SpooledTemporaryFile(max_size=16)
+    spooled.write(data)
+    spooled.seek(0)
+    return UploadFile(spooled, filename=filename, headers=Headers({"content-type": "image/png"}))
+
+
+def test_kept_uploads_survive_closing_the_form():
+    data = png_bytes()
+    upload = spooled_upload(data)
+    spooled = upload.file
+
+    async def run():
+        [kept] = await keep_uploads([upload])
+        # What FastAPI < 0.118 does before a StreamingResponse body runs
+        await upload.close()
+        return kept, await kept.read()
+
+    kept, contents = asyncio.run(run())
+    assert contents == data
+    # The spooled file is handed over, not copied into memory
+    assert kept.file is spooled
+    assert kept.filename == "a.png"
+    assert kept.content_type == "image/png"
+
+
+def test_stream_reads_and_closes_one_chunk_at_a_time(monkeypatch):
+    uploads = [spooled_upload(png_bytes(), f"{i}.png") for i in range(3)]
+    seen = []
+
+    async def fake_items(chunk, codec):
+        # Earlier chunks are closed, later ones not yet read
+        seen.append([upload.file.closed for upload in uploads])
+        return [{"index": idx, "filename": file.filename, "success": True} for idx, file in chunk]
+
+    monkeypatch.setattr(main, "SEGMENTATION_BATCH_SIZE", 1)
+    monkeypatch.setattr(main, "remove_background_items", fake_items)
+
+    async def run():
+        return [item async for item in stream_remove_background(uploads)]
+
+    items = asyncio.run(run())
+    assert [item["index"] for item in items] == [0, 1, 2]
+    assert seen == [[False, False, False], [True, False, False], [True, True, False]]
+    assert all(upload.file.closed for upload in uploads)
+
+
+def test_stream_closes_uploads_when_the_client_disconnects(monkeypatch):
+    uploads = [spooled_upload(png_bytes(), f"{i}.png") for i in range(3)]
+
+    async def fake_items(chunk, codec):
+        return [{"index": idx, "filename": file.filename, "success": True} for idx, file in chunk]
+
+    monkeypatch.setattr(main, "SEGMENTATION_BATCH_SIZE", 1)
+    monkeypatch.setattr(main, "remove_background_items", fake_items)
+
+    async def run():
+        stream = stream_remove_background(uploads)
+        await stream.__anext__()
+        await stream.aclose()
+
+    asyncio.run(run())
+    assert all(upload.file.closed for upload in uploads)
@@ -1,6 +1,20 @@
 import axios from "axios";
 import FormData from "form-data";
 
+/**
+ * Parse a JSON error body that arrived as an arraybuffer response
+ */
+function decodeErrorBody(data: any): any {
+  if (!(data instanceof ArrayBuffer) && !Buffer.isBuffer(data)) {
+    return data;
+  }
+  try {
+    return JSON.parse(Buffer.from(data).toString("utf8"));
+  } catch {
+    return undefined;
+  }
+}
+
 export class AiService {
   private readonly aiServiceUrl: string;
 
@@ -82,13 +96,14 @@ export class AiService {
   }
 
   /**
-   * Generate embedding for an image
+   * Generate embedding for an image.
+   * Requested as packed little-endian float32 to skip JSON float serialization.
    */
   async generateEmbedding(
     fileBuffer: Buffer,
     filename: string,
     mimetype: string
-  ): Promise<any> {
+  ): Promise<{ embedding: number[]; dimensions: number }> {
     try {
       const formData = new FormData();
       formData.append("file", fileBuffer, {
@@ -102,18 +117,27 @@ export class AiService {
         {
           headers: {
             ...formData.getHeaders(),
+            Accept: "application/octet-stream",
           },
+          responseType: "arraybuffer",
         }
       );
 
-      return response.data;
+      const data = Buffer.from(response.data);
+      const dimensions = data.length / Float32Array.BYTES_PER_ELEMENT;
+      const embedding = Array.from({ length: dimensions }, (_, i) =>
+        data.readFloatLE(i * Float32Array.BYTES_PER_ELEMENT)
+      );
+
+      return { embedding, dimensions };
     } catch (error: any) {
       console.error(
         "AI Service Error (generateEmbedding):",
-        error.response?.data || error.message
+        decodeErrorBody(error.response?.data) || error.message
       );
       throw new Error(
-        error.response?.data?.detail || "Failed to generate embedding"
+        decodeErrorBody(error.response?.data)?.detail ||
+          "Failed to generate embedding"
       );
     }
   }
@@ -148,10 +172,11 @@ export class AiService {
     } catch (error: any) {
       console.error(
         "AI Service Error (removeBackground):",
-        error.response?.data || error.message
+        decodeErrorBody(error.response?.data) || error.message
       );
       throw new Error(
-        error.response?.data?.detail || "Failed to remove background"
+        decodeErrorBody(error.response?.data)?.detail ||
+          "Failed to remove background"
       );
     }
   }